@@ -1,4 +1,3 @@
-import os
 import argparse
 from pathlib import Path
 import torch
@@ -33,32 +32,8 @@ def load_net_g(hps, weights_path):
         eps=hps.train.eps,
     )
 
-    def load_checkpoint(checkpoint_path, model, optimizer=None):
-        assert os.path.isfile(checkpoint_path)
-        checkpoint_dict = torch.load(checkpoint_path, map_location="cpu")
-        iteration = checkpoint_dict["iteration"]
-        learning_rate = checkpoint_dict["learning_rate"]
-
-        if optimizer is not None:
-            optimizer.load_state_dict(checkpoint_dict["optimizer"])
-        saved_state_dict = checkpoint_dict["model"]
-
-        state_dict = model.state_dict()
-        new_state_dict = {}
-        for k, v in state_dict.items():
-            try:
-                new_state_dict[k] = saved_state_dict[k]
-            except:
-                print("%s is not in the checkpoint" % k)
-                new_state_dict[k] = v
-        model.load_state_dict(new_state_dict)
-
-        print(
-            "Loaded checkpoint '{}' (iteration {})".format(checkpoint_path, iteration)
-        )
-        return model, optimizer, learning_rate, iteration
-
-    model, optimizer, learning_rate, iteration = load_checkpoint(
+    # flat checkpoints ([prefix].model.json) are memory-mapped, see utils.save_flat_checkpoint
+    model, optimizer, learning_rate, iteration = utils.load_checkpoint(
         weights_path, net_g, optim_g
     )
 
@@ -124,10 +99,10 @@ def get_zs(net_g, dataloader, num_samples=0):
     return zs
 
 
-def k_means(zs):
+def k_means(zs, n_clusters=1000):
     X = torch.cat(zs, dim=1).transpose(0, 1).numpy()
     print(X.shape)
-    kmeans = KMeans(n_clusters=1000, random_state=0, n_init="auto").fit(X)
+    kmeans = KMeans(n_clusters=n_clusters, random_state=0, n_init="auto").fit(X)
     print(kmeans.cluster_centers_.shape)
 
     return kmeans.cluster_centers_
@@ -139,16 +114,16 @@ def save_memory_bank(bank):
 
 
 def save_checkpoint(model, optimizer, learning_rate, iteration, checkpoint_path):
-    state_dict = model.state_dict()
-    torch.save(
-        {
-            "model": state_dict,
-            "iteration": iteration,
-            "optimizer": optimizer.state_dict(),
-            "learning_rate": learning_rate,
-        },
-        checkpoint_path,
-    )
+    checkpoint_dict = {
+        "model": model.state_dict(),
+        "iteration": iteration,
+        "optimizer": optimizer.state_dict(),
+        "learning_rate": learning_rate,
+    }
+    if checkpoint_path.endswith(".model.json"):
+        utils.save_flat_checkpoint(checkpoint_dict, checkpoint_path[: -len(".model.json")])
+    else:
+        torch.save(checkpoint_dict, checkpoint_path)
     print("Saving model to " + checkpoint_path)
 
 
@@ -169,7 +144,7 @@ if __name__ == "__main__":
 
     dataloader = get_dataloader(hps)
     zs = get_zs(net_g, dataloader, num_samples=args.num_samples)
-    centers = k_means(zs)
+    centers = k_means(zs, n_clusters=hps.models.memory_bank.bank_size)
 
     memory_bank = VAEMemoryBank(
         **hps.models.memory_bank,
@@ -185,8 +160,11 @@ if __name__ == "__main__":
         }
     )
 
-    p = Path(args.weights_path)
-    save_path = p.with_stem(p.stem + "_with_memory").__str__()
+    if args.weights_path.endswith(".model.json"):
+        save_path = args.weights_path[: -len(".model.json")] + "_with_memory.model.json"
+    else:
+        p = Path(args.weights_path)
+        save_path = p.with_stem(p.stem + "_with_memory").__str__()
     save_checkpoint(net_g, optimizer, lr, iterations, save_path)
 
     # test
@@ -0,0 +1,648 @@
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import tempfile
+import time
+
+import scipy.fft
+import torch
+
+from inference.export import InferenceGraph, example_inputs
+from inference.frontend import text_to_ids
+from inference.model import build_synthesizer, load_synthesizer
+from inference.prefork import (
+    fork_workers,
+    memory_usage,
+    private_bytes_in,
+    share_weights,
+    weight_ranges,
+)
+from inference.quantize import QUANTIZED_MODULES, quantize_synthesizer
+from models.models import Generator, VAEMemoryBank
+from synthesize import load_items
+from text.symbols import symbols
+from utils import utils
+from utils.mel_processing import mel_spectrogram_torch
+
+
+def timeit(fn, n_repeats):
+    fn()  # warmup (also builds caches and indices)
+    start = time.perf_counter()
+    for _ in range(n_repeats):
+        out = fn()
+    return (time.perf_counter() - start) / n_repeats, out
+
+
+def synthetic_bank(bank_size, n_hidden_dims, n_modes=64, seed=0):
+    # clustered like a k-means initialized bank, rather than isotropic noise
+    g = torch.Generator().manual_seed(seed)
+    modes = torch.randn(n_modes, n_hidden_dims, generator=g) * 3
+    ids = torch.randint(0, n_modes, (bank_size,), generator=g)
+    bank = modes[ids] + 0.5 * torch.randn(bank_size, n_hidden_dims, generator=g)
+    return bank.transpose(0, 1)
+
+
+def benchmark_memory_bank(args):
+    torch.set_num_threads(args.num_threads)
+    results = []
+    for bank_size in args.bank_sizes:
+        torch.manual_seed(args.seed)
+        bank = VAEMemoryBank(
+            bank_size=bank_size,
+            n_hidden_dims=args.n_hidden_dims,
+            init_values=synthetic_bank(bank_size, args.n_hidden_dims, seed=args.seed),
+        ).eval()
+        # queries near bank entries, as posterior latents are near their k-means centers
+        ids = torch.randint(0, bank_size, (args.batch_size * args.frames,))
+        z = bank.memory_bank.detach()[:, ids] + 0.5 * torch.randn(
+            args.n_hidden_dims, ids.size(0)
+        )
+        z = z.view(args.n_hidden_dims, args.batch_size, args.frames).transpose(0, 1)
+
+        with torch.no_grad():
+            exact_time, exact = timeit(lambda: bank(z), args.n_repeats)
+            results.append(
+                {"bank_size": bank_size, "mode": "exact", "ms": exact_time * 1e3}
+            )
+            for top_k in args.top_k:
+                for n_lists in args.n_lists:
+                    bank.top_k, bank.n_lists, bank.n_probe = top_k, n_lists, args.n_probe
+                    bank._bank_index = None
+                    build_start = time.perf_counter()
+                    bank(z[:, :, :1])
+                    build_time = time.perf_counter() - build_start
+                    t, out = timeit(lambda: bank(z), args.n_repeats)
+                    results.append(
+                        {
+                            "bank_size": bank_size,
+                            "mode": "ivf" if n_lists else "top_k",
+                            "top_k": top_k,
+                            "n_lists": n_lists,
+                            "n_probe": args.n_probe if n_lists else None,
+                            "ms": t * 1e3,
+                            "index_build_ms": build_time * 1e3,
+                            "rel_l2_error": ((out - exact).norm() / exact.norm()).item(),
+                            "cosine": torch.nn.functional.cosine_similarity(
+                                out, exact, dim=1
+                            ).mean().item(),
+                        }
+                    )
+            bank.top_k = None
+    return results
+
+
+def log_mel(y, hps_data):
+    mel = mel_spectrogram_torch(
+        y.squeeze(1),
+        hps_data.filter_length,
+        hps_data.n_mel_channels,
+        hps_data.sampling_rate,
+        hps_data.hop_length,
+        hps_data.win_length,
+        hps_data.mel_fmin,
+        hps_data.mel_fmax,
+    )
+    return mel
+
+
+def stream_latency(dec, z, chunk_size):
+    """Wall time of each chunk yielded by dec.infer_stream, and the full waveform."""
+    times, chunks = [], []
+    start = time.perf_counter()
+    for o in dec.infer_stream(z, chunk_size=chunk_size):
+        times.append(time.perf_counter() - start)
+        chunks.append(o)
+        start = time.perf_counter()
+    return times, torch.cat(chunks, dim=2)
+
+
+def benchmark_decoder(args):
+    torch.set_num_threads(args.num_threads)
+    torch.manual_seed(args.seed)
+    hps = utils.get_hparams_from_file(args.config)
+    hps_causal = utils.get_hparams_from_file(args.causal_config)
+    if args.weights_path is not None:
+        net_g, _ = load_synthesizer(args.weights_path, args.config)
+        x = torch.randint(1, len(symbols), (1, args.n_tokens))
+        with torch.no_grad():
+            z, y_mask, _ = net_g.infer_latent(
+                x, torch.LongTensor([args.n_tokens]), noise_scale=0.667
+            )
+        z = z * y_mask
+        baseline = net_g.dec
+    else:
+        z = torch.randn(1, hps.models.decoder.initial_channel, args.frames)
+        baseline = Generator(**hps.models.decoder).eval()
+    if args.causal_weights_path is not None:
+        causal = load_synthesizer(args.causal_weights_path, args.causal_config)[0].dec
+    else:
+        # the baseline weights run causally, i.e. before fine-tuning
+        causal = Generator(**hps_causal.models.decoder).eval()
+        causal.load_state_dict(baseline.state_dict())
+
+    frame_ms = 1e3 * baseline.hop_length / hps.data.sampling_rate
+    results = []
+    with torch.no_grad():
+        reference = baseline(z)
+        for name, dec, chunk_size, lookahead in [
+            ("baseline", baseline, args.chunk_size, baseline.receptive_field()),
+            ("causal", causal, args.causal_chunk_size, causal.lookahead),
+        ]:
+            stream_latency(dec, z[:, :, : 4 * chunk_size], chunk_size)  # warmup
+            times, o = stream_latency(dec, z, chunk_size)
+            times = torch.tensor(times[:-1] if len(times) > 1 else times) * 1e3
+            results.append(
+                {
+                    "decoder": name,
+                    "frames": z.size(2),
+                    "chunk_size": chunk_size,
+                    "n_chunks": len(times),
+                    "first_chunk_ms": times[0].item(),
+                    "chunk_ms_mean": times.mean().item(),
+                    "chunk_ms_max": times.max().item(),
+                    "chunk_audio_ms": chunk_size * frame_ms,
+                    # future frames needed before the first sample of a chunk is emitted
+                    "lookahead_ms": (chunk_size - 1 + lookahead) * frame_ms,
+                    "log_mel_l1": (
+                        log_mel(o, hps.data) - log_mel(reference, hps.data)
+                    ).abs().mean().item(),
+                }
+            )
+    return results
+
+
+def mel_cepstral_distance(y, y_ref, hps_data, n_mfcc=25):
+    """
+    MCD in dB between two time-aligned waveforms, on the DCT of their log-mel
+    spectrograms (c0, i.e. energy, is excluded).
+    """
+    c, c_ref = [
+        scipy.fft.dct(log_mel(w, hps_data)[0].numpy(), axis=0, norm="ortho")[1:n_mfcc]
+        for w in (y, y_ref)
+    ]
+    n_frames = min(c.shape[1], c_ref.shape[1])
+    diff = c[:, :n_frames] - c_ref[:, :n_frames]
+    return float((10 / math.log(10) * (2 * (diff ** 2).sum(0)) ** 0.5).mean())
+
+
+def load_filelist_inputs(path, hps_data, n):
+    return [
+        text_to_ids(text, hps_data, cleaned=path.endswith(".cleaned")).unsqueeze(0)
+        for _, text in load_items(path)[:n]
+    ]
+
+
+def benchmark_quantize(args):
+    torch.set_num_threads(args.num_threads)
+
+    def load():
+        if args.weights_path is None:
+            torch.manual_seed(args.seed)
+            hps = utils.get_hparams_from_file(args.config)
+            net_g = build_synthesizer(hps).eval()
+        else:
+            net_g, hps = load_synthesizer(args.weights_path, args.config)
+        return net_g.freeze_for_inference(), hps
+
+    reference, hps = load()
+    calibration_path = args.calibration_filelist or hps.data.validation_files
+    calibration = [
+        (x, torch.LongTensor([x.size(1)]))
+        for x in load_filelist_inputs(calibration_path, hps.data, args.n_calibration)
+    ]
+    inputs = []
+    g = torch.Generator().manual_seed(args.seed)
+    with torch.no_grad():
+        for x in load_filelist_inputs(args.filelist, hps.data, args.n_utterances):
+            x_lengths = torch.LongTensor([x.size(1)])
+            # the fp32 durations, so that all outputs are time-aligned
+            _, x_mask, logw = reference.encode_text(x, x_lengths)
+            d = (torch.exp(logw) * x_mask).squeeze(1)
+            n_frames = int(torch.round(d.sum()).item())
+            noise = torch.randn(
+                1, hps.models.decoder.initial_channel, n_frames, generator=g
+            )
+            inputs.append((x, x_lengths, d, noise))
+
+    def run(net_g):
+        synth_time, n_samples, outputs = 0.0, 0, []
+        with torch.no_grad():
+            net_g.infer(*inputs[0][:2])  # warmup
+            for x, x_lengths, d, noise in inputs:
+                start = time.perf_counter()
+                o = net_g.infer(x, x_lengths, noise_scale=args.noise_scale)[0]
+                synth_time += time.perf_counter() - start
+                n_samples += o.size(2)
+                outputs.append(
+                    net_g.infer(x, x_lengths, noise_scale=args.noise_scale, noise=noise, d=d)[0]
+                )
+        return synth_time / (n_samples / hps.data.sampling_rate), outputs
+
+    rtf, reference_outputs = run(reference)
+    results = [{"mode": "fp32", "rtf": rtf}]
+    for mode in args.modes:
+        net_g, _ = load()
+        quantize_synthesizer(
+            net_g,
+            mode,
+            modules=args.modules,
+            fp32_layers=args.fp32_layers,
+            min_channels=args.min_channels,
+            calibration_inputs=calibration,
+        )
+        rtf, outputs = run(net_g)
+        mcd = [
+            mel_cepstral_distance(o, o_ref, hps.data)
+            for o, o_ref in zip(outputs, reference_outputs)
+        ]
+        results.append({"mode": mode, "rtf": rtf, "mcd_db": sum(mcd) / len(mcd)})
+    return results
+
+
+def benchmark_prefork(args):
+    """
+    Memory that every pre-forked worker adds, with the weights shared by the
+    parent vs. loaded by each worker (as N independent processes would).
+    """
+    torch.set_num_threads(1)  # no intra-op thread pool may exist when forking
+
+    def load():
+        if args.weights_path is None:
+            torch.manual_seed(args.seed)
+            hps = utils.get_hparams_from_file(args.config)
+            net_g = build_synthesizer(hps).eval()
+        else:
+            net_g, hps = load_synthesizer(args.weights_path, args.config)
+        if not net_g.frozen:
+            net_g.freeze_for_inference()
+        return net_g
+
+    x = torch.randint(1, len(symbols), (1, args.n_tokens))
+    x_lengths = torch.LongTensor([args.n_tokens])
+
+    def measure(net_g, ranges=()):
+        ready_r, ready_w = os.pipe()
+        exit_r, exit_w = os.pipe()
+
+        def run_worker(index):
+            torch.set_num_threads(args.num_threads)
+            model = net_g if net_g is not None else load()
+            with torch.no_grad():
+                for _ in range(args.n_repeats):
+                    model.infer(x, x_lengths)
+            os.write(ready_w, b"1")
+            os.read(exit_r, 1)
+
+        pids = fork_workers(args.n_workers, run_worker)
+        for _ in pids:
+            os.read(ready_r, 1)
+        usage = [
+            dict(memory_usage(pid), weights_private=private_bytes_in(pid, ranges))
+            for pid in pids
+        ]
+        os.write(exit_w, b"1" * len(pids))
+        for pid in pids:
+            os.waitpid(pid, 0)
+        return {
+            key + "_mb": sum(u[key] for u in usage) / len(usage) / 2 ** 20
+            for key in usage[0]
+        }
+
+    net_g = load()
+    weight_bytes = share_weights(net_g)
+    shared = measure(net_g, weight_ranges(net_g))
+    independent = measure(None)
+    del independent["weights_private_mb"]
+    # a worker forked after `share_weights` must not hold a copy of any weight
+    assert shared["weights_private_mb"] < 0.05 * weight_bytes / 2 ** 20, (
+        "forked workers copy the shared weights"
+    )
+    return {
+        "weights_mb": weight_bytes / 2 ** 20,
+        "n_workers": args.n_workers,
+        "per_worker_shared": shared,
+        "per_worker_independent": independent,
+    }
+
+
+RTF_MODES = ["eager", "frozen", "quantized", "exported", "streaming"]
+
+
+def rtf_inputs(args, hps_data):
+    """
+    Token id batches per (length, batch size): the utterances of the filelist
+    closest to each length in tokens, or random tokens of exactly that length.
+    """
+    g = torch.Generator().manual_seed(args.seed)
+    if not args.synthetic:
+        path = args.filelist
+        utterances = [
+            text_to_ids(text, hps_data, cleaned=path.endswith(".cleaned"))
+            for _, text in load_items(path)
+        ]
+    inputs = {}
+    for n_tokens in args.lengths:
+        for batch_size in args.batch_sizes:
+            if args.synthetic:
+                batch = [
+                    torch.randint(1, len(symbols), (n_tokens,), generator=g)
+                    for _ in range(batch_size)
+                ]
+            else:
+                batch = sorted(utterances, key=lambda ids: abs(ids.size(0) - n_tokens))
+                batch = batch[:batch_size]
+            inputs[n_tokens, batch_size] = batch
+    return inputs
+
+
+def benchmark_rtf_mode(args, mode, n_threads, inputs):
+    """
+    Loads the model for `mode` and times every input batch, smallest first.
+    Runs in a forked process, so that its peak RSS is its own.
+    """
+    torch.set_num_threads(n_threads)
+    if args.weights_path is None:
+        torch.manual_seed(args.seed)
+        hps = utils.get_hparams_from_file(args.config)
+        net_g = build_synthesizer(hps).eval()
+    else:
+        net_g, hps = load_synthesizer(args.weights_path, args.config)
+    if mode == "eager" and net_g.frozen:
+        return [{"mode": mode, "threads": n_threads, "skipped": "checkpoint is frozen"}]
+    if mode != "eager" and not net_g.frozen:
+        net_g.freeze_for_inference()
+    if mode == "quantized":
+        quantize_synthesizer(net_g, "dynamic")
+    if mode == "exported":
+        with tempfile.TemporaryDirectory() as tmp:
+            graph = InferenceGraph(net_g).eval()
+            path = os.path.join(tmp, "graph.pt")
+            with torch.no_grad():
+                torch.jit.trace(
+                    graph, example_inputs(net_g, (50,)), check_trace=False
+                ).save(path)
+            exported = torch.jit.load(path)
+    sampling_rate = hps.data.sampling_rate
+
+    def run(batch):
+        """Returns (seconds to the first audio, total seconds, audio samples)."""
+        x_lengths = torch.LongTensor([ids.size(0) for ids in batch])
+        x = torch.zeros(len(batch), x_lengths.max(), dtype=torch.long)
+        for i, ids in enumerate(batch):
+            x[i, : ids.size(0)] = ids
+        generators = [torch.Generator().manual_seed(args.seed + i) for i in range(len(batch))]
+        start = time.perf_counter()
+        if mode == "streaming":
+            first, n_samples = None, 0
+            for o in net_g.infer_stream(
+                    x, x_lengths, chunk_size=args.chunk_size, generator=generators
+            ):
+                first = first or time.perf_counter() - start
+                n_samples += o.size(2)
+            return first, time.perf_counter() - start, n_samples
+        if mode == "exported":
+            noise = torch.randn(
+                len(batch),
+                net_g.dec.conv_pre.in_channels,
+                net_g.learnable_upsampling.max_seq_len,
+                generator=generators[0],
+            )
+            _, o_lengths = exported(
+                x, x_lengths, noise, torch.tensor(0.667), torch.tensor(1.0)
+            )
+        else:
+            _, o_lengths, *_ = net_g.infer_batch(x, x_lengths, generator=generators)
+        elapsed = time.perf_counter() - start
+        # a batch only yields audio once all of it is vocoded
+        return elapsed, elapsed, o_lengths.sum().item()
+
+    results = []
+    with torch.no_grad():
+        for (n_tokens, batch_size), batch in sorted(inputs.items()):
+            if mode == "streaming" and batch_size > 1:
+                continue  # streams a single utterance
+            for _ in range(args.n_warmup):
+                run(batch)
+            runs = sorted((run(batch) for _ in range(args.n_repeats)), key=lambda r: r[1])
+            ttfa, latency, n_samples = runs[len(runs) // 2]
+            audio_seconds = n_samples / sampling_rate
+            results.append(
+                {
+                    "mode": mode,
+                    "threads": n_threads,
+                    "tokens": n_tokens,
+                    "mean_tokens": sum(ids.size(0) for ids in batch) / len(batch),
+                    "batch_size": len(batch),
+                    "audio_seconds": audio_seconds,
+                    "latency_ms": 1000 * latency,
+                    "ttfa_ms": 1000 * ttfa,
+                    "rtf": latency / audio_seconds,
+                    "throughput_audio_seconds_per_second": audio_seconds / latency,
+                    "throughput_utterances_per_second": len(batch) / latency,
+                    # cells run smallest first, so this is the peak of the
+                    # largest cell so far (or of loading the model)
+                    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                }
+            )
+    return results
+
+
+def benchmark_rtf(args):
+    """
+    RTF, time to first audio, throughput and peak RSS of every inference mode
+    over a matrix of text lengths, batch sizes and thread counts. Each mode
+    and thread count runs in its own forked process.
+    """
+    torch.set_num_threads(1)  # no intra-op thread pool may exist when forking
+    if args.weights_path is None:
+        hps = utils.get_hparams_from_file(args.config)
+    else:
+        hps = load_synthesizer(args.weights_path, args.config)[1]
+    inputs = rtf_inputs(args, hps.data)
+
+    results = []
+    for mode in args.modes:
+        for n_threads in args.threads:
+            read_fd, write_fd = os.pipe()
+
+            def run_worker(index):
+                os.close(read_fd)
+                payload = json.dumps(benchmark_rtf_mode(args, mode, n_threads, inputs))
+                with os.fdopen(write_fd, "w") as f:
+                    f.write(payload)
+
+            pid = fork_workers(1, run_worker)[0]
+            os.close(write_fd)
+            with os.fdopen(read_fd) as f:
+                payload = f.read()
+            _, status = os.waitpid(pid, 0)
+            if status != 0:
+                results.append({"mode": mode, "threads": n_threads, "error": status})
+            else:
+                results.extend(json.loads(payload))
+
+    report = {
+        "environment": {
+            "torch": torch.__version__,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "weights_path": args.weights_path,
+        "inputs": "synthetic" if args.synthetic else args.filelist,
+        "n_warmup": args.n_warmup,
+        "n_repeats": args.n_repeats,
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_bank = subparsers.add_parser(
+        "memory_bank", help="top-k / IVF memory bank attention vs. the exact softmax"
+    )
+    parser_bank.add_argument(
+        "--bank_sizes", type=int, nargs="+", default=[1000, 10000, 100000]
+    )
+    parser_bank.add_argument("--top_k", type=int, nargs="+", default=[32])
+    parser_bank.add_argument(
+        "--n_lists", type=int, nargs="+", default=[0, 256], help="0 for exact top-k"
+    )
+    parser_bank.add_argument("--n_probe", type=int, default=8)
+    parser_bank.add_argument("--n_hidden_dims", type=int, default=192)
+    parser_bank.add_argument("--batch_size", type=int, default=1)
+    parser_bank.add_argument("--frames", type=int, default=200)
+    parser_bank.add_argument("--n_repeats", type=int, default=3)
+    parser_bank.add_argument("--num_threads", type=int, default=1)
+    parser_bank.add_argument("--seed", type=int, default=1234)
+    parser_bank.set_defaults(func=benchmark_memory_bank)
+
+    parser_decoder = subparsers.add_parser(
+        "decoder",
+        help="per-chunk streaming latency and quality of the causal vs. baseline decoder",
+    )
+    parser_decoder.add_argument("-c", "--config", type=str, default="configs/ljs.json")
+    parser_decoder.add_argument(
+        "--causal_config", type=str, default="configs/ljs_causal.json"
+    )
+    parser_decoder.add_argument(
+        "--weights_path", type=str, default=None, help="random weights and latents if unset"
+    )
+    parser_decoder.add_argument(
+        "--causal_weights_path",
+        type=str,
+        default=None,
+        help="fine-tuned causal model; the baseline weights run causally if unset",
+    )
+    parser_decoder.add_argument("--frames", type=int, default=400)
+    parser_decoder.add_argument("--n_tokens", type=int, default=100)
+    parser_decoder.add_argument("--chunk_size", type=int, default=32)
+    parser_decoder.add_argument("--causal_chunk_size", type=int, default=1)
+    parser_decoder.add_argument("--num_threads", type=int, default=1)
+    parser_decoder.add_argument("--seed", type=int, default=1234)
+    parser_decoder.set_defaults(func=benchmark_decoder)
+
+    parser_quantize = subparsers.add_parser(
+        "quantize", help="RTF and mel-cepstral distance of INT8 vs. fp32 inference"
+    )
+    parser_quantize.add_argument("-c", "--config", type=str, default="configs/ljs.json")
+    parser_quantize.add_argument(
+        "--weights_path", type=str, default=None, help="random weights if unset"
+    )
+    parser_quantize.add_argument(
+        "--filelist",
+        type=str,
+        default="filelists/ljs_audio_text_test_filelist.txt.cleaned",
+    )
+    parser_quantize.add_argument(
+        "--calibration_filelist",
+        type=str,
+        default=None,
+        help="for static quantization, defaults to the validation filelist",
+    )
+    parser_quantize.add_argument("--n_utterances", type=int, default=20)
+    parser_quantize.add_argument("--n_calibration", type=int, default=20)
+    parser_quantize.add_argument(
+        "--modes", type=str, nargs="+", default=["dynamic", "static"]
+    )
+    parser_quantize.add_argument(
+        "--modules", type=str, nargs="+", default=list(QUANTIZED_MODULES)
+    )
+    parser_quantize.add_argument(
+        "--fp32_layers", type=str, nargs="*", default=[], help="fnmatch patterns"
+    )
+    parser_quantize.add_argument("--min_channels", type=int, default=128)
+    parser_quantize.add_argument("--noise_scale", type=float, default=0.667)
+    parser_quantize.add_argument("--num_threads", type=int, default=1)
+    parser_quantize.add_argument("--seed", type=int, default=1234)
+    parser_quantize.set_defaults(func=benchmark_quantize)
+
+    parser_prefork = subparsers.add_parser(
+        "prefork",
+        help="memory per pre-forked worker with shared vs. per-worker weights",
+    )
+    parser_prefork.add_argument("-c", "--config", type=str, default="configs/ljs.json")
+    parser_prefork.add_argument(
+        "--weights_path", type=str, default=None, help="random weights if unset"
+    )
+    parser_prefork.add_argument("--n_workers", type=int, default=2)
+    parser_prefork.add_argument("--n_tokens", type=int, default=100)
+    parser_prefork.add_argument("--n_repeats", type=int, default=2)
+    parser_prefork.add_argument("--num_threads", type=int, default=1)
+    parser_prefork.add_argument("--seed", type=int, default=1234)
+    parser_prefork.set_defaults(func=benchmark_prefork)
+
+    parser_rtf = subparsers.add_parser(
+        "rtf",
+        help="RTF, time to first audio, throughput and peak RSS of every "
+        "inference mode over text lengths, batch sizes and thread counts",
+    )
+    parser_rtf.add_argument("-c", "--config", type=str, default="configs/ljs.json")
+    parser_rtf.add_argument(
+        "--weights_path", type=str, default=None, help="random weights if unset"
+    )
+    parser_rtf.add_argument(
+        "--filelist",
+        type=str,
+        default="filelists/ljs_audio_text_test_filelist.txt.cleaned",
+    )
+    parser_rtf.add_argument(
+        "--synthetic",
+        action="store_true",
+        help="random tokens of exactly each length instead of the filelist",
+    )
+    parser_rtf.add_argument(
+        "--lengths", type=int, nargs="+", default=[32, 96, 192], help="in tokens"
+    )
+    parser_rtf.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 4])
+    parser_rtf.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser_rtf.add_argument(
+        "--modes", type=str, nargs="+", default=RTF_MODES, choices=RTF_MODES
+    )
+    parser_rtf.add_argument(
+        "--chunk_size", type=int, default=32, help="frames per streamed chunk"
+    )
+    parser_rtf.add_argument(
+        "--n_warmup",
+        type=int,
+        default=2,
+        help="untimed runs per cell; TorchScript optimizes after profiling runs",
+    )
+    parser_rtf.add_argument("--n_repeats", type=int, default=3)
+    parser_rtf.add_argument("--seed", type=int, default=1234)
+    parser_rtf.add_argument(
+        "--output", type=str, default=None, help="also write the JSON report here"
+    )
+    parser_rtf.set_defaults(func=benchmark_rtf)
+
+    args = parser.parse_args()
+    print(json.dumps(args.func(args), indent=2))
@@ -0,0 +1,32 @@
+import argparse
+from pathlib import Path
+
+import torch
+
+from utils import utils
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Converts G_*.pth / D_*.pth checkpoints to flat, memory-mappable "
+                    "checkpoints: [prefix].model.{bin,json} and [prefix].optim.{bin,json}"
+    )
+    parser.add_argument("checkpoints", type=str, nargs="+")
+    parser.add_argument(
+        "--output_dir", type=str, default=None, help="defaults to each checkpoint's directory"
+    )
+    args = parser.parse_args()
+
+    for checkpoint_path in args.checkpoints:
+        p = Path(checkpoint_path)
+        prefix = Path(args.output_dir or p.parent) / p.stem
+        checkpoint_dict = torch.load(checkpoint_path, map_location="cpu")
+        utils.save_flat_checkpoint(checkpoint_dict, str(prefix))
+
+        # check that every tensor reads back unchanged
+        converted = utils.load_flat_checkpoint(
+            str(prefix) + ".model.json", "optimizer" in checkpoint_dict
+        )
+        for k, v in checkpoint_dict["model"].items():
+            assert torch.equal(v, converted["model"][k]), k
+        print("Converted {} to {}.model.json".format(checkpoint_path, prefix))
@@ -0,0 +1,53 @@
+import argparse
+from pathlib import Path
+
+import torch
+
+from inference.export import (
+    export_onnx,
+    export_torchscript,
+    max_parity_error,
+    onnx_runner,
+)
+from inference.model import load_synthesizer
+
+# padded batches of token lengths checked against eager inference, including
+# lengths shorter than the attention window and longer than the traced input
+PARITY_BATCHES = [(3,), (7,), (30, 120), (200, 45, 90)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", type=str, default=None)
+    parser.add_argument(
+        "--weights_path", type=str, required=True, help="training or frozen checkpoint"
+    )
+    parser.add_argument(
+        "--format", type=str, default="torchscript", choices=["torchscript", "onnx"]
+    )
+    parser.add_argument(
+        "--output", type=str, default=None, help="defaults to [weights_path].pt/.onnx"
+    )
+    parser.add_argument("--opset_version", type=int, default=17)
+    parser.add_argument(
+        "--atol", type=float, default=1e-3, help="max abs waveform difference allowed"
+    )
+    args = parser.parse_args()
+
+    net_g, hps = load_synthesizer(args.weights_path, args.config)
+    if not net_g.frozen:
+        net_g.freeze_for_inference()
+
+    suffix = ".pt" if args.format == "torchscript" else ".onnx"
+    output = args.output or Path(args.weights_path).with_suffix(suffix).__str__()
+    if args.format == "torchscript":
+        export_torchscript(net_g, output)
+        exported = torch.jit.load(output)
+    else:
+        export_onnx(net_g, output, opset_version=args.opset_version)
+        exported = onnx_runner(output)
+
+    diff = max_parity_error(net_g, exported, PARITY_BATCHES)
+    print("max abs difference (exported vs. eager): {:.3e}".format(diff))
+    assert diff <= args.atol, "exported graph does not match eager inference"
+    print("Exported {} graph to {}".format(args.format, output))
@@ -0,0 +1,61 @@
+import argparse
+from pathlib import Path
+
+import torch
+
+from inference.model import load_synthesizer, save_inference_checkpoint
+from text.symbols import symbols
+
+
+def max_output_diff(net_a, net_b, n_samples=4, seed=1234):
+    """Max abs waveform difference of the two models on random inputs with fixed noise."""
+    g = torch.Generator().manual_seed(seed)
+    diff = 0.0
+    with torch.no_grad():
+        for i in range(n_samples):
+            length = int(torch.randint(10, 120, (1,), generator=g))
+            x = torch.randint(1, len(symbols), (1, length), generator=g)
+            x_lengths = torch.LongTensor([length])
+            outputs = []
+            for net_g in (net_a, net_b):
+                torch.manual_seed(seed + i)
+                outputs.append(net_g.infer(x, x_lengths, noise_scale=0.667)[0])
+            diff = max(diff, (outputs[0] - outputs[1]).abs().max().item())
+    return diff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", type=str, default="configs/ljs.json")
+    parser.add_argument("--weights_path", type=str, required=True)
+    parser.add_argument(
+        "--output", type=str, default=None, help="defaults to [weights_path]_frozen.pth"
+    )
+    parser.add_argument("--n_samples", type=int, default=4)
+    parser.add_argument(
+        "--atol", type=float, default=1e-3, help="max abs waveform difference allowed"
+    )
+    args = parser.parse_args()
+
+    net_g, hps = load_synthesizer(args.weights_path, args.config)
+    frozen, _ = load_synthesizer(args.weights_path, args.config)
+    frozen.freeze_for_inference()
+
+    diff = max_output_diff(net_g, frozen, n_samples=args.n_samples)
+    print("max abs difference (frozen vs. original): {:.3e}".format(diff))
+    assert diff <= args.atol, "frozen model does not match the original model"
+
+    if args.output is not None:
+        output = args.output
+    elif args.weights_path.endswith(".model.json"):
+        output = args.weights_path[: -len(".model.json")] + "_frozen.model.json"
+    else:
+        p = Path(args.weights_path)
+        output = p.with_stem(p.stem + "_frozen").__str__()
+    save_inference_checkpoint(frozen, hps, output)
+
+    reloaded, _ = load_synthesizer(output)
+    diff = max_output_diff(frozen, reloaded, n_samples=args.n_samples)
+    print("max abs difference (reloaded vs. frozen): {:.3e}".format(diff))
+    assert diff <= args.atol, "saved inference checkpoint does not reload correctly"
+    print("Saved inference checkpoint to " + output)
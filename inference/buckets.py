@@ -0,0 +1,182 @@
+import math
+import time
+from collections import Counter
+
+import torch
+from torch.nn import functional as F
+
+from text.symbols import symbols
+from utils.stage_timer import stage
+
+
+def geometric_buckets(smallest, largest, ratio=1.25):
+    """
+    Ascending sizes from `smallest` to `largest`, each `ratio` times the
+    previous: padding a size of at least `smallest` up to its bucket adds
+    less than (ratio - 1) of it.
+    """
+    buckets = [smallest]
+    while buckets[-1] < largest:
+        buckets.append(min(max(math.ceil(buckets[-1] * ratio), buckets[-1] + 1), largest))
+    return buckets
+
+
+def padding_bound(buckets):
+    """Worst-case padding overhead of sizes within the bucket range."""
+    return max((b / a - 1 for a, b in zip(buckets, buckets[1:])), default=0.0)
+
+
+class ShapeBuckets:
+    """
+    Runs padded batches at a small set of shapes: token counts are padded up
+    to `token_buckets` and output frames up to `frame_buckets` (both
+    ascending), so allocator warmup, lazy initialization and, with
+    `compile`, torch.compile of the vocoder happen once per bucket in
+    `warmup` rather than on the first requests of every new length.
+    Padding is masked, so outputs match `SynthesizerTrn.infer_batch`. Inputs
+    beyond the largest bucket run at their own shape (with the eager
+    vocoder) and are counted as overflows.
+
+    The compiled vocoder is static in the frame count and dynamic in the
+    batch size, except that batches of one are specialized, so `warmup`
+    compiles two graphs per frame bucket. Compiles after warmup are counted
+    in `stats()["recompiles"]`.
+    """
+
+    def __init__(self, net_g, token_buckets, frame_buckets, compile=False):
+        self.net_g = net_g
+        self.token_buckets = sorted(token_buckets)
+        self.frame_buckets = sorted(frame_buckets)
+        self.compile = compile
+        self.eager_dec = net_g.dec.forward
+        if compile:
+            # two graphs (batches of one and of more) per frame bucket. The
+            # flows stay eager: the WN gate reads its channel count from a
+            # tensor, which breaks the graph
+            torch._dynamo.config.cache_size_limit = max(
+                torch._dynamo.config.cache_size_limit, 2 * len(self.frame_buckets) + 1
+            )
+            # compiled in place of `forward`, so that the state dict is unchanged
+            net_g.dec.forward = torch.compile(net_g.dec.forward, dynamic=False)
+        self.n_graphs_warm = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.n_tokens = 0
+        self.n_padded_tokens = 0
+        self.n_frames = 0
+        self.n_padded_frames = 0
+        self.n_overflows = 0
+        self.shapes = Counter()
+
+    @staticmethod
+    def bucket(n, buckets):
+        return next((b for b in buckets if b >= n), n)
+
+    def infer_batch(
+            self, x, x_lengths, decoder_batch_size=None, timer=None, on_decoded=None, **kwargs
+    ):
+        """
+        Same as `SynthesizerTrn.infer_batch`, except that the batch is
+        vocoded at once at its frame bucket (`decoder_batch_size` is
+        ignored, `on_decoded` is called for every item once it is done).
+        """
+        n_tokens = self.bucket(x.size(1), self.token_buckets)
+        x = F.pad(x, (0, n_tokens - x.size(1)))
+        z, y_mask, stats = self.net_g.infer_latent(
+            x, x_lengths, frame_buckets=self.frame_buckets, timer=timer, **kwargs
+        )
+        with stage(timer, "dec"):
+            if not self.compile:
+                o = self.net_g.dec(z, x_mask=y_mask)
+            elif z.size(2) > self.frame_buckets[-1]:
+                # a shape of its own, not worth a compile
+                o = self.eager_dec(z, x_mask=y_mask)
+            else:
+                torch._dynamo.mark_dynamic(z, 0)
+                torch._dynamo.mark_dynamic(y_mask, 0)
+                o = self.net_g.dec(z, x_mask=y_mask)
+        y_lengths = y_mask.sum([1, 2]).long()
+        if on_decoded is not None:
+            for i in range(z.size(0)):
+                on_decoded(i, o[i, 0, : y_lengths[i] * self.net_g.dec.hop_length])
+
+        batch_size, n_frames = z.size(0), z.size(2)
+        self.n_tokens += x_lengths.sum().item()
+        self.n_padded_tokens += batch_size * n_tokens
+        self.n_frames += y_lengths.sum().item()
+        self.n_padded_frames += batch_size * n_frames
+        self.n_overflows += int(
+            n_tokens > self.token_buckets[-1] or n_frames > self.frame_buckets[-1]
+        )
+        self.shapes["{}x{}".format(n_tokens, n_frames)] += 1
+        return o, y_lengths * self.net_g.dec.hop_length, y_mask, stats
+
+    def _run(self, n_tokens, n_frames, batch_size):
+        """Runs random tokens with durations forced to fill `n_frames`."""
+        x = torch.randint(1, len(symbols), (batch_size, n_tokens))
+        x_lengths = torch.full((batch_size,), n_tokens, dtype=torch.long)
+        d = torch.full((batch_size, n_tokens), n_frames / n_tokens)
+        start = time.perf_counter()
+        self.infer_batch(x, x_lengths, d=d)
+        return time.perf_counter() - start
+
+    @staticmethod
+    def n_graphs():
+        return torch._dynamo.utils.counters["stats"]["unique_graphs"]
+
+    def warmup(self, n_runs=2, max_batch_size=1):
+        """
+        Runs every token and every frame bucket (paired in ascending order)
+        once cold and `n_runs` times warm, at batch sizes 1 and, up to
+        `max_batch_size`, 2. With `compile`, every frame bucket then runs at
+        `max_batch_size`, which must not compile anything. Returns the cold
+        and mean warm latency per pair and batch size.
+        """
+        report = []
+        n_pairs = max(len(self.token_buckets), len(self.frame_buckets))
+        pairs = [
+            (
+                self.token_buckets[min(i, len(self.token_buckets) - 1)],
+                self.frame_buckets[min(i, len(self.frame_buckets) - 1)],
+            )
+            for i in range(n_pairs)
+        ]
+        with torch.no_grad():
+            for n_tokens, n_frames in pairs:
+                for batch_size in sorted({1, min(2, max_batch_size)}):
+                    latencies = [
+                        self._run(n_tokens, n_frames, batch_size)
+                        for _ in range(1 + n_runs)
+                    ]
+                    report.append(
+                        {
+                            "tokens": n_tokens,
+                            "frames": n_frames,
+                            "batch_size": batch_size,
+                            "cold_ms": 1000 * latencies[0],
+                            "warm_ms": 1000 * sum(latencies[1:]) / max(n_runs, 1),
+                        }
+                    )
+            if self.compile:
+                n_graphs = self.n_graphs()
+                if max_batch_size > 2:
+                    for n_tokens, n_frames in pairs:
+                        self._run(n_tokens, n_frames, max_batch_size)
+                assert self.n_graphs() == n_graphs, "the vocoder recompiled after warmup"
+                self.n_graphs_warm = n_graphs
+        self.reset_stats()
+        return report
+
+    def stats(self):
+        return {
+            "token_padding": self.n_padded_tokens / max(self.n_tokens, 1) - 1,
+            "frame_padding": self.n_padded_frames / max(self.n_frames, 1) - 1,
+            "token_padding_bound": padding_bound(self.token_buckets),
+            "frame_padding_bound": padding_bound(self.frame_buckets),
+            "overflows": self.n_overflows,
+            "recompiles": (
+                None if self.n_graphs_warm is None else self.n_graphs() - self.n_graphs_warm
+            ),
+            "shapes": dict(self.shapes),
+        }
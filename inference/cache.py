@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from torch.nn import functional as F
+
+
+def tensors_nbytes(tensors):
+    return sum(t.element_size() * t.nelement() for t in tensors)
+
+
+class EncoderCache:
+    """
+    LRU cache of `SynthesizerTrn.encode_text` outputs (encoder hidden states,
+    mask and predicted log-durations) per token sequence, with a memory
+    budget in bytes. A padded batch is assembled from the entries of its
+    items, and only the items that miss are encoded (as one batch), so an
+    utterance hits no matter which batch it arrives in. A cache is only
+    valid for the model it was filled with; call `clear()` after loading new
+    weights.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(ids):
+        """Key of one unpadded token sequence."""
+        return tuple(ids.tolist())
+
+    def lookup(self, x, x_lengths, encode_fn):
+        keys = [self.key(x[i, : x_lengths[i]]) for i in range(x.size(0))]
+        values = [None] * len(keys)
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    values[i] = self._entries[key]
+            self.hits += sum(v is not None for v in values)
+            self.misses += sum(v is None for v in values)
+
+        missed = [i for i, v in enumerate(values) if v is None]
+        if missed:
+            # only the missed items, padded to the longest of them
+            lengths = x_lengths[missed]
+            encoded = encode_fn(x[missed, : lengths.max()], lengths)
+            for j, i in enumerate(missed):
+                # copies, so that an entry does not keep the batch alive
+                values[i] = tuple(
+                    t[j: j + 1, :, : lengths[j]].clone() for t in encoded
+                )
+                self.insert(keys[i], values[i])
+
+        # items are zero past their length, as encode_text masks its outputs
+        return tuple(
+            torch.cat(
+                [F.pad(value[k], (0, x.size(1) - value[k].size(2))) for value in values]
+            )
+            for k in range(3)
+        )
+
+    def insert(self, key, value):
+        n_bytes = tensors_nbytes(value)
+        if n_bytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self.n_bytes += n_bytes
+            while self.n_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.n_bytes -= tensors_nbytes(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.n_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            "entries": len(self),
+            "bytes": self.n_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+
+def model_hash(net_g):
+    """Hash of a model's weights, part of every `AudioCache` key."""
+    h = hashlib.sha256()
+    for name, tensor in sorted(net_g.state_dict().items()):
+        h.update(name.encode())
+        h.update(tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy())
+    return h.hexdigest()[:16]
+
+
+class AudioCache:
+    """
+    Content-addressed, two-tier LRU cache of synthesized waveforms (1-dim
+    float tensors): up to `max_memory_bytes` in memory and, with a
+    `cache_dir`, up to `max_disk_bytes` on disk. Entries evicted from memory
+    move to disk and disk hits move back to memory. The disk tier is
+    reloaded (oldest first) on startup, so it survives restarts.
+    """
+
+    def __init__(
+            self,
+            max_memory_bytes=256 * 1024 * 1024,
+            cache_dir=None,
+            max_disk_bytes=4 * 1024 * 1024 * 1024,
+    ):
+        self.max_memory_bytes = max_memory_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()  # key -> file size
+        self._lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            paths = [
+                os.path.join(cache_dir, name)
+                for name in os.listdir(cache_dir)
+                if name.endswith(".npy")
+            ]
+            for path in sorted(paths, key=os.path.getmtime):
+                self._disk[os.path.basename(path)[: -len(".npy")]] = os.path.getsize(path)
+                self.disk_bytes += os.path.getsize(path)
+            self._evict_disk()
+
+    @staticmethod
+    def key(ids, noise_scale, length_scale, seed, model_hash):
+        """
+        Texts are keyed by their token ids, i.e. after cleaning, so texts
+        that normalize to the same tokens share an entry.
+        """
+        payload = json.dumps(
+            [ids.tolist(), float(noise_scale), float(length_scale), int(seed), model_hash]
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+            if key in self._disk:
+                audio = torch.from_numpy(np.load(self._path(key)))
+                self._remove_disk(key)
+                self._insert_memory(key, audio)
+                self.disk_hits += 1
+                return audio
+            self.misses += 1
+            return None
+
+    def insert(self, key, audio):
+        audio = audio.detach().cpu().float().contiguous()
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            if key in self._disk:
+                self._remove_disk(key)
+            self._insert_memory(key, audio)
+
+    def _insert_memory(self, key, audio):
+        self._memory[key] = audio
+        self.memory_bytes += tensors_nbytes([audio])
+        while self.memory_bytes > self.max_memory_bytes and self._memory:
+            evicted_key, evicted = self._memory.popitem(last=False)
+            self.memory_bytes -= tensors_nbytes([evicted])
+            if self.cache_dir is None:
+                self.evictions += 1
+            else:
+                self._insert_disk(evicted_key, evicted)
+
+    def _insert_disk(self, key, audio):
+        # written under a temporary name, so a reader never sees a partial file
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, audio.numpy())
+        os.replace(tmp_path, self._path(key))
+        self._disk[key] = os.path.getsize(self._path(key))
+        self.disk_bytes += self._disk[key]
+        self._evict_disk()
+
+    def _remove_disk(self, key):
+        self.disk_bytes -= self._disk.pop(key)
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+
+    def _evict_disk(self):
+        while self.disk_bytes > self.max_disk_bytes and self._disk:
+            self._remove_disk(next(iter(self._disk)))
+            self.evictions += 1
+
+    def spill(self):
+        """Moves the memory tier to disk, e.g. before exiting."""
+        assert self.cache_dir is not None, "spilling needs a cache_dir"
+        with self._lock:
+            while self._memory:
+                key, audio = self._memory.popitem(last=False)
+                self.memory_bytes -= tensors_nbytes([audio])
+                self._insert_disk(key, audio)
+
+    @property
+    def hit_rate(self):
+        total = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / total if total else 0.0
+
+    def stats(self):
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self.disk_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
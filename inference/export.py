@@ -0,0 +1,130 @@
+import torch
+from torch import nn
+
+from text.symbols import symbols
+
+
+class InferenceGraph(nn.Module):
+    """
+    `SynthesizerTrn` inference as a single traceable graph:
+    (x, x_lengths, noise, noise_scale, length_scale) -> (o, o_lengths).
+
+    noise: [b, inter_channels, t] standard normal noise for the prior, where t
+      is at least the number of output frames (at most
+      `learnable_upsampling.max_seq_len`).
+    noise_scale, length_scale: 0-dim float tensors.
+
+    Padded batches are vocoded with the decoder's frame mask, so every item
+    matches its own, unbatched output.
+    """
+
+    def __init__(self, net_g):
+        super().__init__()
+        assert not (
+                net_g.use_memory_bank and net_g.memory_bank.top_k is not None
+        ), "top-k memory bank retrieval cannot be exported, set top_k to None"
+        self.net_g = net_g
+
+    def forward(self, x, x_lengths, noise, noise_scale, length_scale):
+        z, y_mask, _ = self.net_g.infer_latent(
+            x,
+            x_lengths,
+            noise_scale=noise_scale,
+            length_scale=length_scale,
+            noise=noise,
+        )
+        o = self.net_g.dec(z, x_mask=y_mask)
+        o_lengths = y_mask.sum([1, 2]).long() * self.net_g.dec.hop_length
+        return o, o_lengths
+
+
+INPUT_NAMES = ["x", "x_lengths", "noise", "noise_scale", "length_scale"]
+OUTPUT_NAMES = ["o", "o_lengths"]
+DYNAMIC_AXES = {
+    "x": {0: "batch", 1: "tokens"},
+    "x_lengths": {0: "batch"},
+    "noise": {0: "batch", 2: "frames"},
+    "o": {0: "batch", 2: "samples"},
+    "o_lengths": {0: "batch"},
+}
+
+
+def example_inputs(net_g, lengths, noise_scale=0.667, length_scale=1.0, seed=1234):
+    """Random (x, x_lengths, noise, noise_scale, length_scale) for a padded batch."""
+    g = torch.Generator().manual_seed(seed)
+    x_lengths = torch.LongTensor(lengths)
+    x = torch.zeros(len(lengths), max(lengths), dtype=torch.long)
+    for i, length in enumerate(lengths):
+        x[i, :length] = torch.randint(1, len(symbols), (length,), generator=g)
+    noise = torch.randn(
+        len(lengths),
+        net_g.dec.conv_pre.in_channels,
+        net_g.learnable_upsampling.max_seq_len,
+        generator=g,
+    )
+    return x, x_lengths, noise, torch.tensor(noise_scale), torch.tensor(length_scale)
+
+
+def export_torchscript(net_g, path, lengths=(50,)):
+    """Traces `InferenceGraph(net_g)` and saves it for `torch.jit.load`."""
+    graph = InferenceGraph(net_g).eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(graph, example_inputs(net_g, lengths), check_trace=False)
+    traced.save(path)
+    return traced
+
+
+def export_onnx(net_g, path, lengths=(50,), opset_version=17):
+    graph = InferenceGraph(net_g).eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            graph,
+            example_inputs(net_g, lengths),
+            path,
+            input_names=INPUT_NAMES,
+            output_names=OUTPUT_NAMES,
+            dynamic_axes=DYNAMIC_AXES,
+            opset_version=opset_version,
+            dynamo=False,
+        )
+
+
+def onnx_runner(path):
+    """Wraps an onnxruntime session in the same call signature as the graph."""
+    import onnxruntime
+
+    session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+
+    def run(*inputs):
+        outputs = session.run(
+            OUTPUT_NAMES,
+            {name: t.numpy() for name, t in zip(INPUT_NAMES, inputs)},
+        )
+        return tuple(torch.from_numpy(o) for o in outputs)
+
+    return run
+
+
+def max_parity_error(net_g, exported, batches):
+    """
+    Max abs waveform difference between eager `infer_batch` and an exported
+    graph over padded batches of token lengths, e.g. [(7,), (30, 120)], with
+    the same noise. Output lengths must match exactly.
+    """
+    diff = 0.0
+    with torch.no_grad():
+        for i, lengths in enumerate(batches):
+            inputs = example_inputs(net_g, lengths, seed=i)
+            x, x_lengths, noise, noise_scale, length_scale = inputs
+            o, o_lengths, *_ = net_g.infer_batch(
+                x,
+                x_lengths,
+                noise=noise,
+                noise_scale=noise_scale,
+                length_scale=length_scale,
+            )
+            o_exported, o_lengths_exported = exported(*inputs)
+            assert torch.equal(o_lengths, o_lengths_exported), "output lengths differ"
+            t = o_exported.size(2)
+            diff = max(diff, (o[:, :, :t] - o_exported).abs().max().item())
+    return diff
@@ -0,0 +1,21 @@
+import torch
+
+from text import cleaned_text_to_sequence, text_to_sequence, vie_text_to_sequence
+from utils import commons
+
+
+def text_to_ids(text, hps_data, cleaned=False):
+    """
+    Converts input text to the token ids the model was trained on, as in
+    TextAudioLoader.get_text. Input text is raw unless `cleaned` is set (e.g.
+    for *.cleaned filelists), regardless of `hps_data.cleaned_text`.
+    """
+    if cleaned:
+        text_norm = cleaned_text_to_sequence(text)
+    elif getattr(hps_data, "lang", None) == "vi":
+        text_norm = vie_text_to_sequence(text.lower())
+    else:
+        text_norm = text_to_sequence(text, hps_data.text_cleaners)
+    if hps_data.add_blank:
+        text_norm = commons.intersperse(text_norm, 0)
+    return torch.LongTensor(text_norm)
@@ -0,0 +1,199 @@
+import json
+import os
+import re
+
+import numpy as np
+import torch
+
+from inference.cache import model_hash
+from inference.frontend import text_to_ids
+from inference.pipeline import split_sentences
+from inference.prefork import fork_workers, share_weights
+
+_PARAGRAPH_END = re.compile(r"\n\s*\n")
+
+
+def split_units(text, max_chars=300):
+    """
+    Splits a long text into synthesis units: the sentences of each paragraph
+    (paragraphs are separated by blank lines). Returns (text, paragraph_end)
+    pairs, where `paragraph_end` marks the last sentence of a paragraph.
+    """
+    units = []
+    for paragraph in _PARAGRAPH_END.split(text):
+        sentences = split_sentences(paragraph.replace("\n", " "), max_chars)
+        units.extend((s, i == len(sentences) - 1) for i, s in enumerate(sentences))
+    return units
+
+
+def assign_units(costs, n_workers):
+    """
+    Longest-first assignment of units to workers, each unit to the worker
+    with the least total cost so far. Returns the unit indices per worker.
+    """
+    assignment = [[] for _ in range(n_workers)]
+    totals = [0] * n_workers
+    for i in sorted(range(len(costs)), key=lambda i: costs[i], reverse=True):
+        worker = totals.index(min(totals))
+        assignment[worker].append(i)
+        totals[worker] += costs[i]
+    return assignment
+
+
+def synthesize_unit(net_g, ids, seed, noise_scale=0.667, length_scale=1.0):
+    """
+    Audio of one unit, trimmed to the frames its upsampling mask covers, as
+    a 1-dim float tensor.
+    """
+    with torch.no_grad():
+        o, y_mask, _ = net_g.infer(
+            ids.unsqueeze(0),
+            torch.LongTensor([ids.size(0)]),
+            noise_scale=noise_scale,
+            length_scale=length_scale,
+            generator=torch.Generator().manual_seed(seed),
+        )
+    n_samples = int(y_mask.sum().item()) * net_g.dec.hop_length
+    return o[0, 0, :n_samples]
+
+
+def stitch(pieces, pauses, crossfade):
+    """
+    Concatenates 1-dim float arrays with `pauses[i]` samples of silence after
+    `pieces[i]`. Every boundary is crossfaded (linearly) over `crossfade`
+    samples, which with a pause fades the piece out into the silence.
+    """
+    out = [pieces[0]]
+    for piece, pause in zip(pieces[1:], pauses):
+        piece = np.concatenate([np.zeros(pause, dtype=piece.dtype), piece])
+        n = min(crossfade, out[-1].shape[0], piece.shape[0])
+        if n > 0:
+            ramp = np.linspace(0, 1, n + 2, dtype=piece.dtype)[1:-1]
+            tail, out[-1] = out[-1][-n:], out[-1][:-n]
+            piece = piece.copy()
+            piece[:n] = tail * (1 - ramp) + piece[:n] * ramp
+        out.append(piece)
+    return np.concatenate(out)
+
+
+class LongFormJob:
+    """
+    Renders a long text into one waveform. Units (see `split_units`) are
+    synthesized with `synthesize_unit` by `n_workers` forked processes that
+    share the model weights (see `inference.prefork`), each saved to
+    `work_dir` as it is finished. A job that is interrupted resumes from the
+    saved units, as long as its text, settings and weights are unchanged.
+    Every unit is seeded with `seed` plus its index, so a resumed job renders
+    the same audio as an uninterrupted one.
+    """
+
+    def __init__(
+            self,
+            net_g,
+            hps,
+            text,
+            work_dir,
+            cleaned=False,
+            max_chars=300,
+            noise_scale=0.667,
+            length_scale=1.0,
+            seed=1234,
+    ):
+        self.net_g = net_g
+        self.hps = hps
+        self.work_dir = work_dir
+        self.cleaned = cleaned
+        self.noise_scale = noise_scale
+        self.length_scale = length_scale
+        self.seed = seed
+        self.units = split_units(text, max_chars)
+        self.manifest = {
+            "units": [unit for unit, _ in self.units],
+            "cleaned": cleaned,
+            "noise_scale": noise_scale,
+            "length_scale": length_scale,
+            "seed": seed,
+            "model_hash": model_hash(net_g),
+        }
+
+    def _path(self, index):
+        return os.path.join(self.work_dir, "{:06d}.npy".format(index))
+
+    def prepare(self):
+        """Creates or validates `work_dir`, returns the indices left to render."""
+        os.makedirs(self.work_dir, exist_ok=True)
+        manifest_path = os.path.join(self.work_dir, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                assert json.load(f) == self.manifest, (
+                    "{} belongs to a different text, settings or model".format(
+                        self.work_dir
+                    )
+                )
+        else:
+            with open(manifest_path, "w") as f:
+                json.dump(self.manifest, f, indent=2)
+        return [i for i in range(len(self.units)) if not os.path.exists(self._path(i))]
+
+    def render_units(self, indices, worker=0, log_interval=10):
+        for n, i in enumerate(indices):
+            ids = text_to_ids(self.units[i][0], self.hps.data, self.cleaned)
+            audio = synthesize_unit(
+                self.net_g, ids, self.seed + i, self.noise_scale, self.length_scale
+            )
+            # written under a temporary name, so a killed worker never leaves
+            # a partial unit behind that resuming would skip
+            tmp_path = self._path(i) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, audio.numpy())
+            os.replace(tmp_path, self._path(i))
+            if (n + 1) % log_interval == 0 or n + 1 == len(indices):
+                print("[worker {}] {}/{} units".format(worker, n + 1, len(indices)))
+
+    def render(self, n_workers=1, num_threads=1, log_interval=10):
+        """
+        Synthesizes the units left to render. The weights are shared before
+        forking, so `n_workers` processes cost one copy of the model plus
+        their activations. Returns the number of units rendered.
+        """
+        indices = self.prepare()
+        if not indices:
+            return 0
+        if n_workers == 1:
+            torch.set_num_threads(num_threads)
+            self.render_units(indices, log_interval=log_interval)
+            return len(indices)
+
+        # no intra-op thread pool may exist when forking
+        torch.set_num_threads(1)
+        share_weights(self.net_g)
+        assignment = assign_units([len(self.units[i][0]) for i in indices], n_workers)
+
+        def run_worker(worker):
+            torch.set_num_threads(num_threads)
+            self.render_units(
+                [indices[i] for i in assignment[worker]], worker, log_interval
+            )
+
+        pids = fork_workers(n_workers, run_worker)
+        failed = [pid for pid in pids if os.waitpid(pid, 0)[1] != 0]
+        assert not failed, "{} of {} workers failed, rerun to resume".format(
+            len(failed), n_workers
+        )
+        return len(indices)
+
+    def stitch(self, sentence_pause_ms=300, paragraph_pause_ms=800, crossfade_ms=10):
+        """The waveform of all (rendered) units, with pauses and crossfades."""
+        sampling_rate = self.hps.data.sampling_rate
+        pieces = [np.load(self._path(i)) for i in range(len(self.units))]
+        if not pieces:
+            return np.zeros(0, dtype=np.float32)
+        pauses = [
+            int(
+                sampling_rate
+                * (paragraph_pause_ms if paragraph_end else sentence_pause_ms)
+                / 1000
+            )
+            for _, paragraph_end in self.units[:-1]
+        ]
+        return stitch(pieces, pauses, int(sampling_rate * crossfade_ms / 1000))
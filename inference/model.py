@@ -0,0 +1,64 @@
+import torch
+
+from models.models import SynthesizerTrn
+from text.symbols import symbols
+from utils import utils
+
+
+def build_synthesizer(hps, use_memory_bank=False):
+    net_g = SynthesizerTrn(
+        len(symbols),
+        hps.data.filter_length // 2 + 1,
+        hps.train.segment_size // hps.data.hop_length,
+        hps.models,
+    )
+    if use_memory_bank:
+        net_g.attach_memory_bank(hps.models)
+    return net_g
+
+
+def load_synthesizer(checkpoint_path, config_path=None, device="cpu"):
+    """
+    Loads a SynthesizerTrn in eval mode from either a training checkpoint
+    (G_*.pth, which needs `config_path`) or a self-contained inference
+    checkpoint written by `save_inference_checkpoint`, in either format:
+    a pickle or a flat checkpoint ([prefix].model.json, see
+    `utils.save_flat_checkpoint`).
+    """
+    flat = checkpoint_path.endswith(".model.json")
+    if flat:
+        checkpoint_dict = utils.load_flat_checkpoint(checkpoint_path)
+    else:
+        checkpoint_dict = torch.load(checkpoint_path, map_location="cpu")
+    if checkpoint_dict.get("frozen", False):
+        hps = utils.HParams(**checkpoint_dict["config"])
+        net_g = build_synthesizer(hps, checkpoint_dict["use_memory_bank"])
+        net_g.freeze_for_inference()
+    else:
+        assert config_path is not None, "a config is needed for training checkpoints"
+        hps = utils.get_hparams_from_file(config_path)
+        net_g = build_synthesizer(
+            hps, any(k.startswith("memory_bank.") for k in checkpoint_dict["model"])
+        )
+    # memory-mapped tensors are used in place rather than copied
+    net_g.load_state_dict(checkpoint_dict["model"], assign=flat)
+    return net_g.to(device).eval(), hps
+
+
+def save_inference_checkpoint(net_g, hps, checkpoint_path):
+    """
+    Saves a frozen model (see `SynthesizerTrn.freeze_for_inference`) together
+    with its config, without optimizer state, posterior encoder or
+    discriminators. Paths ending in .model.json are saved as flat checkpoints.
+    """
+    assert net_g.frozen, "call freeze_for_inference() first"
+    checkpoint_dict = {
+        "model": net_g.state_dict(),
+        "config": hps.to_dict(),
+        "use_memory_bank": net_g.use_memory_bank,
+        "frozen": True,
+    }
+    if checkpoint_path.endswith(".model.json"):
+        utils.save_flat_checkpoint(checkpoint_dict, checkpoint_path[: -len(".model.json")])
+    else:
+        torch.save(checkpoint_dict, checkpoint_path)
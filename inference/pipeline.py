@@ -0,0 +1,172 @@
+import asyncio
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from inference.frontend import text_to_ids
+
+# a sentence ends at terminal punctuation followed by whitespace, or a newline
+_SENTENCE_END = re.compile(r"(?<=[.!?;…])[\"')\]]*\s+|\n+")
+
+
+class SentenceSplitter:
+    """
+    Accumulates text fragments and returns the complete sentences seen so far.
+    Sentences longer than `max_chars` are split at the last comma or space so
+    that a run-on fragment stream cannot stall the pipeline.
+    """
+
+    def __init__(self, max_chars=300):
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def feed(self, fragment):
+        self.buffer += fragment
+        sentences = []
+        while True:
+            match = _SENTENCE_END.search(self.buffer)
+            if match is not None and match.start() <= self.max_chars:
+                end = match.end()
+            elif len(self.buffer) > self.max_chars:
+                head = self.buffer[: self.max_chars]
+                end = max(head.rfind(","), head.rfind(" ")) + 1 or self.max_chars
+            else:
+                break
+            sentences.append(self.buffer[:end].strip())
+            self.buffer = self.buffer[end:]
+        return [s for s in sentences if s]
+
+    def flush(self):
+        sentence, self.buffer = self.buffer.strip(), ""
+        return [sentence] if sentence else []
+
+
+def split_sentences(text, max_chars=300):
+    """All sentences of a complete text, as `SentenceSplitter` splits them."""
+    splitter = SentenceSplitter(max_chars)
+    return splitter.feed(text) + splitter.flush()
+
+
+class StreamingSynthesizer:
+    """
+    Synthesizes an async stream of text fragments sentence by sentence.
+    Sentences are synthesized (cleaning, encoder, flow and vocoder) by a pool
+    of `n_workers` threads while earlier audio is being consumed, with at most
+    `max_pending` sentences in flight, and audio is yielded in input order.
+
+    Usage:
+        synth = StreamingSynthesizer(net_g, hps)
+        async for index, sentence, audio in synth.synthesize(fragments):
+            play(audio)
+        print(synth.stats())
+    """
+
+    def __init__(
+            self, net_g, hps, n_workers=2, max_pending=4, max_chars=300, **infer_kwargs
+    ):
+        self.net_g = net_g
+        self.hps = hps
+        self.n_workers = n_workers
+        self.max_pending = max_pending
+        self.max_chars = max_chars
+        self.infer_kwargs = infer_kwargs
+        self.metrics = {}
+
+    def synthesize_sentence(self, sentence):
+        x = text_to_ids(sentence, self.hps.data).unsqueeze(0)
+        x_lengths = torch.LongTensor([x.size(1)])
+        with torch.no_grad():
+            o = self.net_g.infer(x, x_lengths, **self.infer_kwargs)[0]
+        return o[0, 0].cpu()
+
+    async def synthesize(self, text_stream):
+        """
+        Yields (sentence index, sentence, waveform) for every sentence of
+        `text_stream`, an async iterable of text fragments.
+        """
+        loop = asyncio.get_running_loop()
+        pending = asyncio.Queue()
+        # a slot is taken before a sentence is submitted and given back once
+        # its audio is done, so at most max_pending are queued or synthesizing
+        slots = asyncio.Semaphore(self.max_pending)
+        futures = set()
+        metrics = self.metrics = {
+            "start": time.perf_counter(),
+            "first_text": None,
+            "first_audio": None,
+            "n_sentences": 0,
+            "n_samples": 0,
+            "sentence_latencies": [],
+        }
+
+        async def produce(executor):
+            splitter = SentenceSplitter(self.max_chars)
+            try:
+                async for fragment in text_stream:
+                    if metrics["first_text"] is None:
+                        metrics["first_text"] = time.perf_counter()
+                    for sentence in splitter.feed(fragment):
+                        await submit(executor, sentence)
+                for sentence in splitter.flush():
+                    await submit(executor, sentence)
+            finally:
+                pending.put_nowait(None)
+
+        async def submit(executor, sentence):
+            await slots.acquire()
+            future = loop.run_in_executor(executor, self.synthesize_sentence, sentence)
+            futures.add(future)
+            pending.put_nowait((sentence, time.perf_counter(), future))
+
+        executor = ThreadPoolExecutor(self.n_workers)
+        producer = asyncio.ensure_future(produce(executor))
+        try:
+            index = 0
+            while True:
+                item = await pending.get()
+                if item is None:
+                    break
+                sentence, submitted, future = item
+                audio = await future
+                futures.discard(future)
+                slots.release()
+                now = time.perf_counter()
+                if metrics["first_audio"] is None:
+                    metrics["first_audio"] = now
+                metrics["sentence_latencies"].append(now - submitted)
+                metrics["n_sentences"] += 1
+                metrics["n_samples"] += audio.size(0)
+                yield index, sentence, audio
+                index += 1
+            await producer  # re-raises errors from the text stream
+        finally:
+            # when the consumer stops early (e.g. on barge-in), queued
+            # sentences are dropped rather than synthesized, and the event
+            # loop does not wait for the one(s) already running
+            producer.cancel()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+            metrics["end"] = time.perf_counter()
+
+    def stats(self):
+        """
+        Time to first audio, measured from the first text fragment and from
+        the start of the stream, plus per-sentence latency and real-time factor.
+        """
+        m = self.metrics
+        if not m or m["first_audio"] is None:
+            return {"n_sentences": 0}
+        audio_seconds = m["n_samples"] / self.hps.data.sampling_rate
+        latencies = m["sentence_latencies"]
+        return {
+            "ttfa": m["first_audio"] - m["first_text"],
+            "ttfa_from_start": m["first_audio"] - m["start"],
+            "n_sentences": m["n_sentences"],
+            "audio_seconds": audio_seconds,
+            "sentence_latency_mean": sum(latencies) / len(latencies),
+            "sentence_latency_max": max(latencies),
+            "rtf": (m.get("end", time.perf_counter()) - m["first_text"]) / audio_seconds,
+        }
@@ -0,0 +1,107 @@
+import os
+import signal
+
+
+def share_weights(net_g):
+    """
+    Makes the weights of `net_g` safe to share with forked workers: tensors
+    mapped from a flat checkpoint (see `utils.tensor_file`) already live in
+    the page cache and are kept as they are, all others are moved into
+    shared memory. Inference never writes to the weights, so forked workers
+    map the same physical pages. Returns the number of bytes shared.
+    """
+    storages = {}
+    for tensor in list(net_g.parameters()) + list(net_g.buffers()):
+        if tensor.untyped_storage().filename is None:
+            tensor.share_memory_()
+        # tensors of a flat checkpoint are views into one storage
+        storage = tensor.untyped_storage()
+        storages[storage.data_ptr()] = storage.nbytes()
+    return sum(storages.values())
+
+
+def fork_workers(n_workers, run_worker):
+    """
+    Forks `n_workers` processes that each call `run_worker(index)` and exit.
+    Returns their pids. Load (and share) the model before forking, with
+    `torch.set_num_threads(1)` in the parent so that no intra-op thread pool
+    exists at fork time; workers set their own thread counts.
+    """
+    pids = []
+    for index in range(n_workers):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(index)
+            except BaseException:
+                import traceback
+
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        pids.append(pid)
+    return pids
+
+
+def wait_workers(pids):
+    """Waits for the workers, terminating all of them if the parent is stopped."""
+
+    def terminate(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+
+def memory_usage(pid="self"):
+    """
+    RSS, PSS and private (unshared) memory of a process in bytes, from
+    /proc/[pid]/smaps_rollup (Linux). The private memory is what a process
+    adds on top of the pages it shares with its parent and siblings.
+    """
+    fields = {}
+    with open("/proc/{}/smaps_rollup".format(pid)) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "private": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def private_bytes_in(pid, ranges):
+    """
+    Private (copied or written) bytes of a process in the memory mappings
+    overlapping the address ranges [(start, end), ...], from /proc/[pid]/smaps.
+    """
+    total, overlaps = 0, False
+    with open("/proc/{}/smaps".format(pid)) as f:
+        for line in f:
+            fields = line.split()
+            if "-" in fields[0] and len(fields) >= 5:  # a mapping header
+                start, end = (int(a, 16) for a in fields[0].split("-"))
+                overlaps = any(s < end and start < e for s, e in ranges)
+            elif overlaps and fields[0] in ("Private_Clean:", "Private_Dirty:"):
+                total += int(fields[1]) * 1024
+    return total
+
+
+def weight_ranges(net_g):
+    """Address ranges [(start, end), ...] of the storages of `net_g`'s weights."""
+    storages = [
+        tensor.untyped_storage()
+        for tensor in list(net_g.parameters()) + list(net_g.buffers())
+    ]
+    return [(s.data_ptr(), s.data_ptr() + s.nbytes()) for s in storages]
@@ -0,0 +1,171 @@
+import fnmatch
+
+import torch
+from torch import nn
+from torch.nn import functional as F
+import torch.ao.nn.quantized as nnq
+import torch.ao.nn.quantized.dynamic as nnqd
+from torch.ao.quantization import default_dynamic_qconfig, get_default_qconfig
+
+# the modules that gain from int8 on CPU; "dec" can be added, but most of
+# its time is spent in the late, narrow stages that stay in fp32 anyway
+QUANTIZED_MODULES = ("enc_p", "flow", "memory_bank")
+# the memory bank key/value projections only run once (their outputs are
+# cached); transposed convolutions (dec.ups) lose too much accuracy when
+# quantized and are never listed as they are not Conv1d layers
+_NEVER_QUANTIZED = ("memory_bank.encoder.conv_k", "memory_bank.encoder.conv_v")
+
+
+class DynamicQuantizedConv1d(nn.Module):
+    """
+    Conv1d as im2col followed by a dynamically quantized int8 Linear, which is
+    much more accurate than torch's DynamicQuantizedConv1d.
+    """
+
+    def __init__(self, conv):
+        super().__init__()
+        assert conv.groups == 1 and isinstance(conv.padding, tuple)
+        self.kernel_size = conv.kernel_size
+        self.stride = conv.stride
+        self.dilation = conv.dilation
+        self.padding = conv.padding
+        linear = nn.Linear(conv.in_channels * conv.kernel_size[0], conv.out_channels)
+        with torch.no_grad():
+            linear.weight.copy_(conv.weight.flatten(1))
+            if conv.bias is not None:
+                linear.bias.copy_(conv.bias)
+            else:
+                linear.bias.zero_()
+        linear.qconfig = default_dynamic_qconfig
+        self.linear = nnqd.Linear.from_float(linear)
+
+    def forward(self, x):
+        k, d = self.kernel_size[0], self.dilation[0]
+        if k == 1:
+            cols = x[:, :, :: self.stride[0]].transpose(1, 2)
+        else:
+            x = F.pad(x, (self.padding[0], self.padding[0]))
+            cols = x.unfold(2, d * (k - 1) + 1, self.stride[0])[..., ::d]  # [b, c, t, k]
+            cols = cols.transpose(1, 2).flatten(2)
+        return self.linear(cols).transpose(1, 2)
+
+
+class StaticQuantized(nn.Module):
+    """
+    A statically quantized Conv1d / Linear between float tensors: the input is
+    quantized with the scale and zero point observed during calibration.
+    """
+
+    def __init__(self, module, scale, zero_point):
+        super().__init__()
+        self.module = module
+        self.scale = float(scale)
+        self.zero_point = int(zero_point)
+        # used by the causal decoder
+        for attr in ("kernel_size", "stride", "dilation"):
+            if hasattr(module, attr):
+                setattr(self, attr, getattr(module, attr))
+
+    def forward(self, x):
+        x = torch.quantize_per_tensor(x, self.scale, self.zero_point, torch.quint8)
+        return self.module(x).dequantize()
+
+
+def quantizable_layers(
+        net_g, modules=QUANTIZED_MODULES, fp32_layers=(), min_channels=128
+):
+    """
+    Names of the Conv1d and Linear layers under `modules` that are quantized.
+    `fp32_layers` are fnmatch patterns of layer names kept in fp32, e.g.
+    "dec.conv_post" or "flow.flows.*.post". Layers with fewer than
+    `min_channels` input channels (the late, long-sequence decoder stages)
+    stay in fp32 as well: there (de)quantizing the activations costs more
+    than the int8 matmul saves.
+    """
+    names = []
+    for name, module in net_g.named_modules():
+        if type(module) not in (nn.Conv1d, nn.Linear):
+            continue
+        n_channels = module.in_channels if type(module) is nn.Conv1d else module.in_features
+        if n_channels < min_channels:
+            continue
+        if not any(name.startswith(m + ".") for m in modules):
+            continue
+        if name in _NEVER_QUANTIZED or any(
+                fnmatch.fnmatchcase(name, p) for p in fp32_layers
+        ):
+            continue
+        names.append(name)
+    return names
+
+
+def _set_module(net_g, name, module):
+    parent, _, attr = name.rpartition(".")
+    setattr(net_g.get_submodule(parent), attr, module)
+
+
+def calibrate(net_g, layers, inputs, noise_scale=0.667):
+    """
+    Runs `net_g.infer` over `inputs`, [(x, x_lengths)], and returns the
+    input observers of `layers`. Output observers are attached to the layers
+    as `activation_post_process`, where `from_float` expects them.
+    """
+    qconfig = get_default_qconfig(torch.backends.quantized.engine)
+    observers, handles = {}, []
+    for name in layers:
+        module = net_g.get_submodule(name)
+        module.qconfig = qconfig
+        module.activation_post_process = qconfig.activation()
+        observers[name] = qconfig.activation()
+
+        def hook(module, args, output, observer=observers[name]):
+            observer(args[0])
+            module.activation_post_process(output)
+
+        handles.append(module.register_forward_hook(hook))
+    try:
+        with torch.no_grad():
+            for x, x_lengths in inputs:
+                net_g.infer(x, x_lengths, noise_scale=noise_scale)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return observers
+
+
+def quantize_synthesizer(
+        net_g,
+        mode="dynamic",
+        modules=QUANTIZED_MODULES,
+        fp32_layers=(),
+        min_channels=128,
+        calibration_inputs=None,
+):
+    """
+    INT8 post-training quantization of a frozen model's Conv1d and Linear
+    layers (see `SynthesizerTrn.freeze_for_inference`), in place.
+
+    dynamic: weights are quantized ahead of time, activations per call.
+    static: activation ranges are observed once over `calibration_inputs`,
+      [(x, x_lengths)], e.g. from the validation filelist.
+    """
+    assert net_g.frozen, "call freeze_for_inference() first"
+    assert mode in ("dynamic", "static")
+    layers = quantizable_layers(net_g, modules, fp32_layers, min_channels)
+    if mode == "static":
+        assert calibration_inputs is not None, "static quantization needs calibration"
+        observers = calibrate(net_g, layers, calibration_inputs)
+
+    for name in layers:
+        module = net_g.get_submodule(name)
+        is_conv = isinstance(module, nn.Conv1d)
+        if mode == "dynamic" and is_conv:
+            qmodule = DynamicQuantizedConv1d(module)
+        elif mode == "dynamic":
+            module.qconfig = default_dynamic_qconfig
+            qmodule = nnqd.Linear.from_float(module)
+        else:
+            qmodule = (nnq.Conv1d if is_conv else nnq.Linear).from_float(module)
+            qmodule = StaticQuantized(qmodule, *observers[name].calculate_qparams())
+        _set_module(net_g, name, qmodule)
+    return net_g
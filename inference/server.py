@@ -0,0 +1,694 @@
+import asyncio
+import io
+import json
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.io.wavfile
+import torch
+
+from inference.cache import AudioCache, model_hash
+from inference.frontend import text_to_ids
+from inference.pipeline import split_sentences
+from inference.timing import phoneme_timings
+from utils.stage_timer import StageTimer
+
+
+class Overloaded(Exception):
+    """A job's estimated completion time exceeds its class latency budget."""
+
+    def __init__(self, estimate):
+        super().__init__("estimated latency {:.2f}s exceeds the budget".format(estimate))
+        self.estimate = estimate
+
+
+class BadRequest(Exception):
+    """A request body the server cannot serve, answered with a 400."""
+
+
+class Request:
+    def __init__(self, ids, noise_scale, length_scale, seed=None, key=None):
+        self.ids = ids
+        self.noise_scale = noise_scale
+        self.length_scale = length_scale
+        self.seed = seed
+        self.key = key
+        self.waiters = 1
+        self.delivered = False
+        self.cls = None  # the class whose queue holds it, None once dispatched
+        self.arrival = time.perf_counter()
+        self.future = asyncio.get_running_loop().create_future()
+
+    def generator(self):
+        generator = torch.Generator()
+        if self.seed is None:
+            generator.seed()
+        else:
+            generator.manual_seed(self.seed)
+        return generator
+
+    @property
+    def n_tokens(self):
+        return self.ids.size(0)
+
+    @property
+    def group_key(self):
+        # only requests with the same inference parameters share a batch
+        return self.noise_scale, self.length_scale
+
+
+class LatencyWindow:
+    """Latency percentiles over the last `size` requests."""
+
+    def __init__(self, size=1000):
+        self.values = deque(maxlen=size)
+
+    def add(self, value):
+        self.values.append(value)
+
+    def percentile(self, q):
+        if not self.values:
+            return None
+        return float(np.percentile(np.array(self.values), q))
+
+
+class PriorityClass:
+    """
+    A class of jobs sharing a queue.
+
+    priority: classes with a lower value are always dispatched first.
+    max_concurrency: max batches of the class running at once, None for all
+      workers. Limiting bulk work keeps workers free for interactive jobs.
+    latency_budget: jobs whose estimated completion time (in seconds) exceeds
+      it are rejected with `Overloaded`. None queues every job.
+    max_batch_size: overrides the scheduler's. Small bulk batches bound how
+      long a higher priority request waits for a worker.
+    """
+
+    def __init__(
+        self, priority, max_concurrency=None, latency_budget=None, max_batch_size=None
+    ):
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.latency_budget = latency_budget
+        self.max_batch_size = max_batch_size
+        self.queue = deque()
+        self.running = 0
+        self.rejected = 0
+        self.latency = LatencyWindow()
+
+    @property
+    def saturated(self):
+        return self.max_concurrency is not None and self.running >= self.max_concurrency
+
+
+DEFAULT_CLASSES = {
+    "interactive": dict(priority=0, latency_budget=2.0),
+    "bulk": dict(priority=1, max_concurrency=1, max_batch_size=1),
+}
+
+
+class BatchScheduler:
+    """
+    Micro-batches concurrent requests into padded batches which run on a
+    pool of `n_workers` threads with `intra_op_threads` torch threads each.
+
+    Jobs (lists of token id chunks, e.g. sentences) are queued by priority
+    class. Whenever a worker is free, the highest priority class that is
+    below its concurrency limit and has a ready request gets it: a request is
+    ready once it has waited `max_wait_ms` for others to batch with, or when
+    a full batch of them is queued. The batch is the oldest request of
+    the class plus the queued requests closest to it in token length. As
+    batches hold single chunks, long jobs yield to higher priority ones
+    between chunks.
+
+    Admission estimates a job's completion time as the tokens queued ahead of
+    it (in its own and higher priority classes) and running, plus its own,
+    times the per-token cost measured on completed batches.
+
+    Chunks with a seed are deterministic: they are served from `cache` (an
+    `AudioCache`) when possible, and identical chunks in flight at the same
+    time are synthesized once; a queued chunk shared with a job of a higher
+    priority class moves to that class's queue. With `encoder_cache` (an
+    `EncoderCache`), the text encoder and duration predictor are skipped for
+    token sequences seen before, whatever batch they arrive in.
+
+    Batches are vocoded in groups of `decoder_batch_size` requests, shortest
+    first, and every request is answered as soon as its group is done rather
+    than with the whole batch.
+
+    With `buckets` (a `ShapeBuckets` of `net_g`), batches run at bucketed
+    shapes; call `warmup` before serving. With `stage_timings`, every batch
+    is timed stage by stage (see `StageTimer`) and the metrics report the
+    latency percentiles of each stage.
+    """
+
+    def __init__(
+        self,
+        net_g,
+        max_batch_size=8,
+        max_wait_ms=10,
+        n_workers=1,
+        intra_op_threads=None,
+        classes=None,
+        per_token_cost=None,
+        cache=None,
+        buckets=None,
+        stage_timings=False,
+        encoder_cache=None,
+        decoder_batch_size=1,
+    ):
+        self.net_g = net_g
+        self.decoder_batch_size = decoder_batch_size
+        self.encoder_cache = encoder_cache
+        self.stage_timings = stage_timings
+        self.stage_latency = defaultdict(LatencyWindow)
+        self.buckets = buckets
+        self.cache = cache
+        self.model_hash = model_hash(net_g)
+        self.in_flight = {}
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.n_workers = n_workers
+        intra_op_threads = intra_op_threads or max(torch.get_num_threads() // n_workers, 1)
+        self.executor = ThreadPoolExecutor(
+            n_workers, initializer=torch.set_num_threads, initargs=(intra_op_threads,)
+        )
+        self.classes = {
+            name: PriorityClass(**kwargs)
+            for name, kwargs in (classes or DEFAULT_CLASSES).items()
+        }
+        self.per_token_cost = per_token_cost
+        self.n_busy = 0
+        self.running_tokens = 0
+        self.n_requests = 0
+        self.n_errors = 0
+        self.n_coalesced = 0
+        self.batch_sizes = Counter()
+        self.latency = LatencyWindow()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.executor.shutdown(wait=True)
+
+    def _infer_batch(self, x, x_lengths, **kwargs):
+        if self.buckets is not None:
+            return self.buckets.infer_batch(x, x_lengths, **kwargs)
+        return self.net_g.infer_batch(x, x_lengths, **kwargs)
+
+    def warmup(self):
+        """Warms every shape bucket on a worker, returns `ShapeBuckets.warmup`."""
+        max_batch_size = max(self._max_batch_size(cls) for cls in self.classes.values())
+        return self.executor.submit(
+            self.buckets.warmup, max_batch_size=max_batch_size
+        ).result()
+
+    def measure_cost(self, n_tokens=100, n_runs=2):
+        """Sets the per-token cost from random inputs synthesized by a worker."""
+        x = torch.randint(1, self.net_g.enc_p.n_vocab, (1, n_tokens))
+        x_lengths = torch.LongTensor([n_tokens])
+
+        def run():
+            with torch.no_grad():
+                self._infer_batch(x, x_lengths)  # warmup
+                start = time.perf_counter()
+                for _ in range(n_runs):
+                    self._infer_batch(x, x_lengths)
+            return (time.perf_counter() - start) / (n_runs * n_tokens)
+
+        self.per_token_cost = self.executor.submit(run).result()
+        return self.per_token_cost
+
+    def estimate(self, cls, n_tokens):
+        """Estimated seconds until a job of `n_tokens` of class `cls` is done."""
+        if self.per_token_cost is None:
+            return None
+        ahead = self.running_tokens + sum(
+            request.n_tokens
+            for other in self.classes.values()
+            if other.priority <= cls.priority
+            for request in other.queue
+        )
+        parallel = min(self.n_workers, cls.max_concurrency or self.n_workers)
+        return (ahead + n_tokens) * self.per_token_cost / parallel
+
+    async def submit(
+        self, ids, priority="interactive", noise_scale=0.667, length_scale=1.0, seed=None
+    ):
+        """Returns the waveform of the token ids as a 1-dim float tensor."""
+        return (
+            await self.submit_job([ids], priority, noise_scale, length_scale, seed)
+        )[0]
+
+    async def submit_job(
+        self,
+        chunks,
+        priority="interactive",
+        noise_scale=0.667,
+        length_scale=1.0,
+        seed=None,
+    ):
+        """
+        Returns the waveforms of a list of token id chunks, which are
+        scheduled independently, each with its noise drawn from `seed`
+        (random if None). Raises `Overloaded` if the chunks that are neither
+        cached nor in flight do not fit the latency budget of its class.
+        """
+        cls = self.classes[priority]
+        start = time.perf_counter()
+        results, new, shared = [], [], []
+        for ids in chunks:
+            key = None
+            if seed is not None:
+                key = AudioCache.key(ids, noise_scale, length_scale, seed, self.model_hash)
+            if key in self.in_flight:
+                shared.append(self.in_flight[key])
+                results.append(self.in_flight[key])
+                continue
+            audio = None if key is None or self.cache is None else self.cache.get(key)
+            if audio is not None:
+                results.append(audio)
+            else:
+                request = Request(ids, noise_scale, length_scale, seed, key)
+                new.append(request)
+                results.append(request)
+
+        # shared requests queued in a lower priority class are promoted to
+        # this one, ahead of which they were not counted
+        promoted = [
+            request
+            for request in shared
+            if request.cls is not None and request.cls.priority > cls.priority
+        ]
+        estimate = self.estimate(
+            cls, sum(request.n_tokens for request in new + promoted)
+        )
+        if cls.latency_budget is not None and estimate is not None:
+            if estimate > cls.latency_budget:
+                cls.rejected += 1
+                raise Overloaded(estimate)
+        for request in shared:
+            request.waiters += 1
+            self.n_coalesced += 1
+        for request in promoted:
+            request.cls.queue.remove(request)
+            request.cls = cls
+            cls.queue.append(request)
+        for request in new:
+            request.cls = cls
+            if request.key is not None:
+                self.in_flight[request.key] = request
+        cls.queue.extend(new)
+        self._wakeup.set()
+
+        requests = new + shared
+        try:
+            # shielded: a request shared with other jobs outlives this one
+            await asyncio.gather(*[asyncio.shield(request.future) for request in requests])
+        finally:
+            # drop the rest of a job that failed or whose client went away
+            for request in requests:
+                request.waiters -= 1
+                if request.waiters == 0 and not request.future.done():
+                    request.future.cancel()
+                    self._forget(request)
+        audio = [
+            result.future.result() if isinstance(result, Request) else result
+            for result in results
+        ]
+        self.latency.add(time.perf_counter() - start)
+        cls.latency.add(time.perf_counter() - start)
+        return audio
+
+    async def _run(self):
+        while True:
+            self._dispatch()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._next_timeout())
+            except asyncio.TimeoutError:
+                pass
+
+    def _forget(self, request):
+        if request.key is not None and self.in_flight.get(request.key) is request:
+            del self.in_flight[request.key]
+
+    def _by_priority(self):
+        return sorted(self.classes.values(), key=lambda cls: cls.priority)
+
+    def _max_batch_size(self, cls):
+        return cls.max_batch_size or self.max_batch_size
+
+    def _ready(self, cls, now):
+        return (
+            len(cls.queue) >= self._max_batch_size(cls)
+            or now - cls.queue[0].arrival >= self.max_wait
+        )
+
+    def _next_timeout(self):
+        """
+        Seconds until the class `_dispatch` holds a worker for is ready, None
+        when nothing can be dispatched before a batch finishes or a request
+        arrives (both set `_wakeup`).
+        """
+        if self.n_busy >= self.n_workers:
+            return None
+        for cls in self._by_priority():
+            if cls.queue and not cls.saturated:
+                return max(cls.queue[0].arrival + self.max_wait - time.perf_counter(), 0)
+        return None
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self.n_busy < self.n_workers:
+            now = time.perf_counter()
+            for cls in self._by_priority():
+                while cls.queue and cls.queue[0].future.done():  # cancelled
+                    cls.queue.popleft().cls = None
+                if not cls.queue or cls.saturated:
+                    continue
+                # a worker is held back for a higher priority request that
+                # is still waiting for others to batch with
+                if not self._ready(cls, now):
+                    return
+                batch = self.take_batch(cls)
+                break
+            else:
+                return
+            tokens = sum(request.n_tokens for request in batch)
+            cls.running += 1
+            self.n_busy += 1
+            self.running_tokens += tokens
+            future = loop.run_in_executor(
+                self.executor,
+                self.infer,
+                batch,
+                lambda request, audio: loop.call_soon_threadsafe(
+                    self._deliver, request, audio
+                ),
+            )
+            future.add_done_callback(
+                lambda f, cls=cls, batch=batch, tokens=tokens, start=now: self._finish(
+                    cls, batch, tokens, start, f
+                )
+            )
+
+    def take_batch(self, cls):
+        head = cls.queue[0]
+        candidates = [
+            request
+            for request in cls.queue
+            if request.group_key == head.group_key and not request.future.done()
+        ]
+        candidates.sort(key=lambda r: abs(r.n_tokens - head.n_tokens))
+        batch = candidates[: self._max_batch_size(cls)]
+        for request in batch:
+            cls.queue.remove(request)
+            request.cls = None
+        return sorted(batch, key=lambda r: r.n_tokens, reverse=True)
+
+    def record_stages(self, timings):
+        """A `StageTimer` hook, also fed the text frontend time by the server."""
+        for name, ms in timings.items():
+            self.stage_latency[name].add(ms)
+
+    def infer(self, batch, deliver=None):
+        """
+        Synthesizes a batch, returns the waveforms. With `deliver`, every
+        request's waveform is also passed to `deliver(request, waveform)` as
+        soon as its decoder group is done.
+        """
+        timer = None
+        if self.stage_timings:
+            device = next(self.net_g.parameters()).device
+            timer = StageTimer(device, hooks=[self.record_stages])
+        x_lengths = torch.LongTensor([r.n_tokens for r in batch])
+        x = torch.zeros(len(batch), x_lengths.max(), dtype=torch.long)
+        for i, request in enumerate(batch):
+            x[i, : request.n_tokens] = request.ids
+        with torch.no_grad():
+            o, o_lengths, *_ = self._infer_batch(
+                x,
+                x_lengths,
+                noise_scale=batch[0].noise_scale,
+                length_scale=batch[0].length_scale,
+                generator=[request.generator() for request in batch],
+                encoder_cache=self.encoder_cache,
+                timer=timer,
+                decoder_batch_size=self.decoder_batch_size,
+                on_decoded=(
+                    None if deliver is None else lambda i, audio: deliver(batch[i], audio)
+                ),
+            )
+        if timer is not None:
+            timer.emit()
+        return [o[i, 0, : o_lengths[i]] for i in range(len(batch))]
+
+    def _finish(self, cls, batch, tokens, start, future):
+        cls.running -= 1
+        self.n_busy -= 1
+        self.running_tokens -= tokens
+        self.n_requests += len(batch)
+        self.batch_sizes[len(batch)] += 1
+        self._wakeup.set()
+        error = future.exception()
+        if error is None:
+            cost = (time.perf_counter() - start) / tokens
+            self.per_token_cost = (
+                cost
+                if self.per_token_cost is None
+                else 0.9 * self.per_token_cost + 0.1 * cost
+            )
+        for i, request in enumerate(batch):
+            if error is None:
+                self._deliver(request, future.result()[i])
+                continue
+            self._forget(request)
+            if not request.future.done() and not request.delivered:
+                self.n_errors += 1
+                request.future.set_exception(error)
+
+    def _deliver(self, request, audio):
+        if request.delivered:
+            return
+        request.delivered = True
+        self._forget(request)
+        if request.key is not None and self.cache is not None:
+            self.cache.insert(request.key, audio)
+        if not request.future.done():  # else cancelled by the client
+            request.future.set_result(audio)
+
+    def metrics(self):
+        return {
+            "queue_depth": sum(len(cls.queue) for cls in self.classes.values()),
+            "busy_workers": self.n_busy,
+            "requests": self.n_requests,
+            "errors": self.n_errors,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "latency_p50": self.latency.percentile(50),
+            "latency_p99": self.latency.percentile(99),
+            "per_token_cost": self.per_token_cost,
+            "coalesced": self.n_coalesced,
+            "cache": None if self.cache is None else self.cache.stats(),
+            "encoder_cache": (
+                None if self.encoder_cache is None else self.encoder_cache.stats()
+            ),
+            "buckets": None if self.buckets is None else self.buckets.stats(),
+            "stages": {
+                name: {
+                    "p50_ms": window.percentile(50),
+                    "p99_ms": window.percentile(99),
+                }
+                for name, window in list(self.stage_latency.items())
+            },
+            "classes": {
+                name: {
+                    "queue_depth": len(cls.queue),
+                    "running": cls.running,
+                    "rejected": cls.rejected,
+                    "latency_p50": cls.latency.percentile(50),
+                    "latency_p99": cls.latency.percentile(99),
+                }
+                for name, cls in self.classes.items()
+            },
+        }
+
+
+class SynthesisServer:
+    """
+    Minimal HTTP/1.1 front end of a BatchScheduler:
+      POST /synthesize {"text": ..., "priority": ..., "noise_scale": ...,
+        "length_scale": ..., "seed": ...} -> audio/wav (16 bit PCM)
+      POST /timings {"text": ..., "length_scale": ..., "soft": ...} -> JSON
+        phoneme timings and duration in seconds, without synthesis
+      GET /metrics -> JSON scheduler metrics
+    Texts are scheduled sentence by sentence (at most `max_chars` each) and
+    jobs over their latency budget get a 503 with a Retry-After estimate.
+    Requests without a seed use `default_seed`, random noise if None.
+    """
+
+    def __init__(self, scheduler, hps, max_chars=300, default_seed=None):
+        self.scheduler = scheduler
+        self.hps = hps
+        self.max_chars = max_chars
+        self.default_seed = default_seed
+
+    async def serve(self, host="127.0.0.1", port=8080, sock=None):
+        """Serves on host:port, or on a listening socket shared by workers."""
+        self.scheduler.start()
+        if sock is not None:
+            server = await asyncio.start_server(self.handle, sock=sock)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def handle(self, reader, writer):
+        extra_headers = ""
+        try:
+            method, path, body = await self.read_request(reader)
+            status, content_type, payload = await self.route(method, path, body)
+        except Overloaded as e:
+            status, content_type = 503, "application/json"
+            payload = json.dumps({"error": str(e)}).encode()
+            extra_headers = "Retry-After: {}\r\n".format(int(np.ceil(e.estimate)))
+        except BadRequest as e:
+            status, content_type = 400, "application/json"
+            payload = json.dumps({"error": str(e)}).encode()
+        except Exception as e:
+            status, content_type = 500, "application/json"
+            payload = json.dumps({"error": str(e)}).encode()
+        writer.write(
+            "HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\n"
+            "{}Connection: close\r\n\r\n".format(
+                status,
+                _REASONS.get(status, ""),
+                content_type,
+                len(payload),
+                extra_headers,
+            ).encode()
+            + payload
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_request(reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        method, path, _ = request_line.split(" ", 2)
+        headers = {}
+        for line in header_lines:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        return method, path, body
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/metrics":
+            return 200, "application/json", json.dumps(self.scheduler.metrics()).encode()
+        if method == "POST" and path == "/synthesize":
+            request, sentences = self.parse_request(body)
+            chunks = await asyncio.get_running_loop().run_in_executor(
+                None, self.frontend, request, sentences
+            )
+            audio = await self.scheduler.submit_job(
+                chunks,
+                priority=request.get("priority", "interactive"),
+                noise_scale=request.get("noise_scale", 0.667),
+                length_scale=request.get("length_scale", 1.0),
+                seed=request.get("seed", self.default_seed),
+            )
+            return 200, "audio/wav", self.encode_wav(torch.cat(audio))
+        if method == "POST" and path == "/timings":
+            request, sentences = self.parse_request(body)
+            timings = await asyncio.get_running_loop().run_in_executor(
+                None, self.timings, request, sentences
+            )
+            return 200, "application/json", json.dumps(timings).encode()
+        return 404, "application/json", b'{"error": "not found"}'
+
+    def parse_request(self, body):
+        """The JSON body of a POST and the sentences of its text."""
+        try:
+            request = json.loads(body)
+        except ValueError as e:
+            raise BadRequest("invalid JSON: {}".format(e))
+        if not isinstance(request, dict) or not isinstance(request.get("text"), str):
+            raise BadRequest('expected a JSON object with a "text" string')
+        priority = request.get("priority", "interactive")
+        if priority not in self.scheduler.classes:
+            raise BadRequest(
+                "unknown priority {!r}, expected one of {}".format(
+                    priority, sorted(self.scheduler.classes)
+                )
+            )
+        sentences = split_sentences(request["text"], self.max_chars)
+        if not sentences:
+            raise BadRequest("no text to synthesize")
+        return request, sentences
+
+    def frontend(self, request, sentences):
+        """
+        Token ids of every sentence. Phonemization is slow for long texts, so
+        this runs in an executor rather than on the event loop.
+        """
+        start = time.perf_counter()
+        chunks = [
+            text_to_ids(sentence, self.hps.data, request.get("cleaned", False))
+            for sentence in sentences
+        ]
+        if self.scheduler.stage_timings:
+            self.scheduler.record_stages({"frontend": 1000 * (time.perf_counter() - start)})
+        return chunks
+
+    def timings(self, request, sentences):
+        # sentences are timed as one batch and laid end to end, as
+        # /synthesize concatenates their audio
+        chunks = self.frontend(request, sentences)
+        x_lengths = torch.LongTensor([ids.size(0) for ids in chunks])
+        x = torch.zeros(len(chunks), x_lengths.max(), dtype=torch.long)
+        for i, ids in enumerate(chunks):
+            x[i, : ids.size(0)] = ids
+        timings, durations = phoneme_timings(
+            self.scheduler.net_g,
+            x,
+            x_lengths,
+            self.hps.data.sampling_rate,
+            length_scale=request.get("length_scale", 1.0),
+            soft=request.get("soft", False),
+        )
+        phonemes, offset = [], 0.0
+        for sentence_timings, duration in zip(timings, durations):
+            for timing in sentence_timings:
+                timing["start"] += offset
+                timing["end"] += offset
+                phonemes.append(timing)
+            offset += duration
+        return {"phonemes": phonemes, "duration": offset}
+
+    def encode_wav(self, audio):
+        audio = (audio.clamp(-1, 1) * (self.hps.data.max_wav_value - 1)).short()
+        buffer = io.BytesIO()
+        scipy.io.wavfile.write(buffer, self.hps.data.sampling_rate, audio.numpy())
+        return buffer.getvalue()
+
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
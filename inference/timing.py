@@ -0,0 +1,35 @@
+import torch
+
+from text.symbols import symbols
+
+
+def phoneme_timings(net_g, x, x_lengths, sampling_rate, length_scale=1.0, soft=False):
+    """
+    Per-token timings of a padded batch of token ids, without synthesizing
+    audio (see `SynthesizerTrn.infer_timings`). Returns, per item, a list of
+    {"symbol", "start", "end"} in seconds, and the audio durations in
+    seconds that `infer` would produce. With `add_blank`, every other token
+    is the blank symbol "_".
+    """
+    with torch.no_grad():
+        starts, ends, y_lengths = net_g.infer_timings(
+            x, x_lengths, length_scale=length_scale, soft=soft
+        )
+    seconds_per_frame = net_g.dec.hop_length / sampling_rate
+    timings = []
+    for i in range(x.size(0)):
+        timings.append(
+            [
+                {
+                    "symbol": symbols[token],
+                    "start": start * seconds_per_frame,
+                    "end": end * seconds_per_frame,
+                }
+                for token, start, end in zip(
+                    x[i, : x_lengths[i]].tolist(),
+                    starts[i, : x_lengths[i]].tolist(),
+                    ends[i, : x_lengths[i]].tolist(),
+                )
+            ]
+        )
+    return timings, (y_lengths * seconds_per_frame).tolist()
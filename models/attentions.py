@@ -18,6 +18,7 @@ class Encoder(nn.Module):
             kernel_size=1,
             p_dropout=0.0,
             window_size=4,
+            fused_attention=False,
             **kwargs
     ):
         super().__init__()
@@ -28,6 +29,7 @@ class Encoder(nn.Module):
         self.kernel_size = kernel_size
         self.p_dropout = p_dropout
         self.window_size = window_size
+        self.fused_attention = fused_attention
 
         self.drop = nn.Dropout(p_dropout)
         self.attn_layers = nn.ModuleList()
@@ -42,6 +44,7 @@ class Encoder(nn.Module):
                     n_heads,
                     p_dropout=p_dropout,
                     window_size=window_size,
+                    fused=fused_attention,
                 )
             )
             self.norm_layers_1.append(LayerNorm(hidden_channels))
@@ -169,6 +172,7 @@ class MultiHeadAttention(nn.Module):
             block_length=None,
             proximal_bias=False,
             proximal_init=False,
+            fused=False,
     ):
         super().__init__()
         assert channels % n_heads == 0
@@ -182,6 +186,7 @@ class MultiHeadAttention(nn.Module):
         self.block_length = block_length
         self.proximal_bias = proximal_bias
         self.proximal_init = proximal_init
+        self.fused = fused
         self.attn = None
 
         self.k_channels = channels // n_heads
@@ -212,15 +217,108 @@ class MultiHeadAttention(nn.Module):
                 self.conv_k.bias.copy_(self.conv_q.bias)
 
     def forward(self, x, c, attn_mask=None):
-        q = self.conv_q(x)
-        k = self.conv_k(c)
-        v = self.conv_v(c)
+        if self.fused and x is c and self._fused_attention_applicable():
+            q, k, v = self._fused_qkv(x)
+            x, self.attn = self.fused_attention(q, k, v, mask=attn_mask), None
+        else:
+            q = self.conv_q(x)
+            k = self.conv_k(c)
+            v = self.conv_v(c)
 
-        x, self.attn = self.attention(q, k, v, mask=attn_mask)
+            x, self.attn = self.attention(q, k, v, mask=attn_mask)
 
         x = self.conv_o(x)
         return x
 
+    def _fused_attention_applicable(self):
+        return (
+                not self.proximal_bias
+                and self.block_length is None
+                and (not self.training or self.p_dropout == 0)
+        )
+
+    def _fused_qkv(self, x):
+        # one 1x1 convolution for q, k and v of self-attention
+        if not isinstance(self.conv_q, nn.Conv1d):  # e.g. quantized
+            return self.conv_q(x), self.conv_k(x), self.conv_v(x)
+        weight = torch.cat([self.conv_q.weight, self.conv_k.weight, self.conv_v.weight])
+        bias = torch.cat([self.conv_q.bias, self.conv_k.bias, self.conv_v.bias])
+        return torch.split(F.conv1d(x, weight, bias), self.channels, dim=1)
+
+    def fused_attention(self, query, key, value, mask=None):
+        """
+        Self-attention equivalent to `attention` (without proximal bias, block
+        masks or attention dropout) that runs on F.scaled_dot_product_attention.
+        `mask` is the [b, 1, t, t] outer product of a padding mask; outputs at
+        padded positions differ from `attention`'s and are masked by callers.
+
+        The kernel only sees the content logits and a broadcast key padding
+        mask, so no [b, h, t, t] tensor is built. The relative-key logits and
+        the relative-value term only touch the [t, 2 * window_size + 1] band
+        and are added afterwards: an extra "sink" key, whose logit is the band
+        maximum, gives the softmax normalizer of each row, so the kernel's
+        output can be renormalized to include the band.
+        """
+        b, d, t = key.size()
+        scale = 1 / math.sqrt(self.k_channels)
+        query = query.view(b, self.n_heads, self.k_channels, t).transpose(2, 3)
+        key = key.view(b, self.n_heads, self.k_channels, t).transpose(2, 3)
+        value = value.view(b, self.n_heads, self.k_channels, t).transpose(2, 3)
+
+        if mask is None:
+            key_valid = torch.ones(b, 1, t, dtype=torch.bool, device=query.device)
+        else:
+            key_valid = (mask != 0).any(dim=2)  # [b, 1, t]
+        bias = torch.zeros(b, 1, 1, t, dtype=query.dtype, device=query.device)
+        bias = bias.masked_fill(~key_valid.unsqueeze(2), -1e4)
+        if self.window_size is None:
+            output = F.scaled_dot_product_attention(
+                query, key, value, attn_mask=bias, scale=scale
+            )
+            return output.transpose(2, 3).contiguous().view(b, d, t)
+
+        # content and relative-key logits of the band, key i + r - window_size
+        # for query i; keys outside the sequence or padded are -inf
+        w, n_rel = self.window_size, 2 * self.window_size + 1
+        key_band = F.pad(key, (0, 0, w, w))
+        scores_band = torch.stack(
+            [(query * key_band[:, :, r: r + t]).sum(-1) for r in range(n_rel)], dim=-1
+        ) * scale  # [b, h, t, 2 * window_size + 1]
+        in_band = F.pad(key_valid, (w, w)).unfold(-1, n_rel, 1)  # [b, 1, t, n_rel]
+        in_band = in_band & key_valid.unsqueeze(-1)  # padded queries: no band
+        rel_logits = self._matmul_with_relative_keys(query * scale, self.emb_rel_k)
+        scores_band = scores_band.masked_fill(~in_band, -float("inf"))
+        scores_rel = (scores_band + rel_logits).masked_fill(~in_band, -float("inf"))
+        sink_logit = torch.maximum(scores_band, scores_rel).amax(-1, keepdim=True)
+        sink_logit = sink_logit.masked_fill(~in_band.any(-1, keepdim=True), 0)
+
+        # the sink is key t: its logit comes from an extra query channel, and
+        # two extra value channels give the weights of the real keys and of
+        # the sink (the fused CPU kernel needs as many channels in all three)
+        query = torch.cat([query, sink_logit / scale, torch.zeros_like(sink_logit)], -1)
+        key = F.pad(key, (0, 2, 0, 1))
+        key[:, :, -1, -2] = 1
+        value = F.pad(value, (0, 2, 0, 1))
+        value[:, :, :-1, -2] = 1
+        value[:, :, -1, -1] = 1
+        bias = F.pad(bias, (0, 1))
+        output = F.scaled_dot_product_attention(
+            query, key, value, attn_mask=bias, scale=scale
+        )
+        output, p_keys, p_sink = output.split([self.k_channels, 1, 1], dim=-1)
+
+        # p_sink * exp(s - sink_logit) is a logit's weight relative to the
+        # kernel's normalizer; swap the content weight of each band key for
+        # its weight with the relative logit added
+        p_rel = torch.exp(scores_rel - sink_logit) * p_sink
+        p_delta = p_rel - torch.exp(scores_band - sink_logit) * p_sink
+        value_band = F.pad(value[:, :, :-1, : self.k_channels], (0, 0, w, w))
+        for r in range(n_rel):
+            output = output + p_delta[..., r: r + 1] * value_band[:, :, r: r + t]
+        output = output + self._matmul_with_relative_values(p_rel, self.emb_rel_v)
+        output = output / (p_keys + p_delta.sum(-1, keepdim=True))
+        return output.transpose(2, 3).contiguous().view(b, d, t)
+
     def attention(self, query, key, value, mask=None):
         # reshape [b, d, t] -> [b, n_h, t, d_k]
         b, d, t_s, t_t = (*key.size(), query.size(2))
@@ -291,18 +389,15 @@ class MultiHeadAttention(nn.Module):
         return ret
 
     def _get_relative_embeddings(self, relative_embeddings, length):
-        max_relative_position = 2 * self.window_size + 1
-        # Pad first before slice to avoid using cond ops.
-        pad_length = max(length - (self.window_size + 1), 0)
-        slice_start_position = max((self.window_size + 1) - length, 0)
+        # Pad by `length` on both sides, which always suffices, rather than by
+        # max(length - (window_size + 1), 0): no data-dependent branch, so
+        # traced / exported graphs stay valid for every length.
+        padded_relative_embeddings = F.pad(
+            relative_embeddings,
+            commons.convert_pad_shape([[0, 0], [length, length], [0, 0]]),
+        )
+        slice_start_position = self.window_size + 1
         slice_end_position = slice_start_position + 2 * length - 1
-        if pad_length > 0:
-            padded_relative_embeddings = F.pad(
-                relative_embeddings,
-                commons.convert_pad_shape([[0, 0], [pad_length, pad_length], [0, 0]]),
-            )
-        else:
-            padded_relative_embeddings = relative_embeddings
         used_relative_embeddings = padded_relative_embeddings[
                                    :, slice_start_position:slice_end_position
                                    ]
@@ -7,6 +7,7 @@ from torch.nn import Conv1d, ConvTranspose1d, AvgPool1d, Conv2d
 from torch.nn.utils import weight_norm, remove_weight_norm, spectral_norm
 from utils import commons
 from utils.commons import init_weights, get_padding
+from utils.stage_timer import stage
 from models import modules
 from models import attentions
 from models.modules import ConvBlock, SwishBlock, LinearNorm
@@ -67,6 +68,7 @@ class TextEncoder(nn.Module):
             n_layers,
             kernel_size,
             p_dropout,
+            fused_attention=False,
     ):
         super().__init__()
         self.n_vocab = n_vocab
@@ -82,7 +84,13 @@ class TextEncoder(nn.Module):
         nn.init.normal_(self.emb.weight, 0.0, hidden_channels ** -0.5)
 
         self.encoder = attentions.Encoder(
-            hidden_channels, filter_channels, n_heads, n_layers, kernel_size, p_dropout
+            hidden_channels,
+            filter_channels,
+            n_heads,
+            n_layers,
+            kernel_size,
+            p_dropout,
+            fused_attention=fused_attention,
         )
         self.proj = nn.Conv1d(hidden_channels, out_channels * 2, 1)
 
@@ -141,36 +149,116 @@ class LearnableUpsampling(nn.Module):
 
         self.proj_o = LinearNorm(192, 192 * 2)
 
-    def forward(self, duration, V, src_len, src_mask, max_src_len):
-        batch_size = duration.shape[0]
-
+    def fuse_batch_norm(self):
+        self.conv_w.fuse_batch_norm()
+        self.conv_c.fuse_batch_norm()
+
+    def forward(self, duration, V, src_len, src_mask, max_src_len, chunk_size=None):
+        """
+        chunk_size: if given, output frames are computed in windows of
+        `chunk_size` frames, so only [B, chunk_size, K] slices are held at a
+        time. In this mode `mel_len` is not clamped to `max_seq_len` and the
+        attention weights W are not returned (None).
+        """
         # Duration Interpretation
-        mel_len = torch.round(duration.sum(-1)).type(torch.LongTensor).to(V.device)
-        mel_len = torch.clamp(mel_len, max=self.max_seq_len)
-        max_mel_len = mel_len.max().item()
+        mel_len = torch.round(duration.sum(-1)).long()
+        if chunk_size is None:
+            mel_len = torch.clamp(mel_len, max=self.max_seq_len)
+        # a tensor rather than a Python int, so that traced graphs keep the
+        # output length dynamic
+        max_mel_len = mel_len.max()
         mel_mask = self.get_mask_from_lengths(mel_len, max_mel_len)
 
+        # Token Boundary Grid
+        e_k = torch.cumsum(duration, dim=1)
+        s_k = e_k - duration
+
+        V_w, V_c = self.conv_w(V), self.conv_c(V)
+
+        if chunk_size is None:
+            upsampled_rep, W = self._upsample_frames(
+                s_k, e_k, V, V_w, V_c, src_mask, mel_mask, 0, max_src_len
+            )
+            return upsampled_rep, mel_mask, mel_len, W
+
+        upsampled_rep = []
+        for t_start in range(0, int(max_mel_len), chunk_size):
+            rep, _ = self._upsample_frames(
+                s_k,
+                e_k,
+                V,
+                V_w,
+                V_c,
+                src_mask,
+                mel_mask[:, t_start: t_start + chunk_size],
+                t_start,
+                max_src_len,
+            )
+            upsampled_rep.append(rep)
+        upsampled_rep = torch.cat(upsampled_rep, dim=1)
+
+        return upsampled_rep, mel_mask, mel_len, None
+
+    def alignment(self, duration, V, src_mask, max_src_len):
+        """
+        Soft token-to-frame alignment, the attention weights W averaged over
+        their heads [B, T, K], without the upsampled representation.
+        """
+        mel_len = torch.clamp(torch.round(duration.sum(-1)).long(), max=self.max_seq_len)
+        mel_mask = self.get_mask_from_lengths(mel_len, mel_len.max())
+        e_k = torch.cumsum(duration, dim=1)
+        s_k = e_k - duration
+        W, _, _ = self._attention(
+            s_k, e_k, self.conv_w(V), src_mask, mel_mask, 0, max_src_len
+        )
+        return W.mean(1), mel_len
+
+    def _upsample_frames(self, s_k, e_k, V, V_w, V_c, src_mask, mel_mask, t_start, max_src_len):
+        """
+        Computes the upsampled representation of output frames
+        [t_start, t_start + mel_mask.shape[1]) against all source tokens.
+        """
+        W, S, E = self._attention(
+            s_k, e_k, V_w, src_mask, mel_mask, t_start, max_src_len
+        )
+
+        # Auxiliary Attention Context (C)
+        C = self.swish_c(S, E, V_c)  # [B, T, K, dim_c]
+
+        # Upsampled Representation (O)
+        upsampled_rep = self.linear_w(
+            torch.einsum("bqtk,bkh->bqth", W, V).permute(0, 2, 1, 3).flatten(2)
+        ) + self.linear_einsum(
+            torch.einsum("bqtk,btkp->bqtp", W, C).permute(0, 2, 1, 3).flatten(2)
+        )  # [B, T, M]
+        upsampled_rep = self.layer_norm(upsampled_rep)
+        upsampled_rep = upsampled_rep.masked_fill(mel_mask.unsqueeze(-1), 0)
+        upsampled_rep = self.proj_o(upsampled_rep)
+
+        return upsampled_rep, W
+
+    def _attention(self, s_k, e_k, V_w, src_mask, mel_mask, t_start, max_src_len):
+        """
+        Attention weights W [B, dim_w, T, K] of output frames
+        [t_start, t_start + mel_mask.shape[1]) over the source tokens, and
+        the frame to token boundary distances S, E.
+        """
+        batch_size, n_frames = mel_mask.shape
+
         # Prepare Attention Mask
         src_mask_ = src_mask.unsqueeze(1).expand(
-            -1, mel_mask.shape[1], -1
+            -1, n_frames, -1
         )  # [B, tat_len, src_len]
         mel_mask_ = mel_mask.unsqueeze(-1).expand(
             -1, -1, src_mask.shape[1]
         )  # [B, tgt_len, src_len]
-        attn_mask = torch.zeros(
-            (src_mask.shape[0], mel_mask.shape[1], src_mask.shape[1])
-        ).to(V.device)
-        attn_mask = attn_mask.masked_fill(src_mask_, 1.0)
-        attn_mask = attn_mask.masked_fill(mel_mask_, 1.0)
-        attn_mask = attn_mask.bool()
+        attn_mask = src_mask_ | mel_mask_
 
         # Token Boundary Grid
-        e_k = torch.cumsum(duration, dim=1)
-        s_k = e_k - duration
-        e_k = e_k.unsqueeze(1).expand(batch_size, max_mel_len, -1)
-        s_k = s_k.unsqueeze(1).expand(batch_size, max_mel_len, -1)
+        e_k = e_k.unsqueeze(1).expand(batch_size, n_frames, -1)
+        s_k = s_k.unsqueeze(1).expand(batch_size, n_frames, -1)
         t_arange = (
-            torch.arange(1, max_mel_len + 1, device=V.device)
+            torch.arange(t_start + 1, t_start + n_frames + 1, device=V_w.device)
             .unsqueeze(0)
             .unsqueeze(-1)
             .expand(batch_size, -1, max_src_len)
@@ -181,39 +269,21 @@ class LearnableUpsampling(nn.Module):
         )
 
         # Attention (W)
-        W = self.swish_w(S, E, self.conv_w(V))  # [B, T, K, dim_w]
+        W = self.swish_w(S, E, V_w)  # [B, T, K, dim_w]
         W = W.masked_fill(src_mask_.unsqueeze(-1), -np.inf)
         W = self.softmax_w(W)  # [B, T, K]
         W = W.masked_fill(mel_mask_.unsqueeze(-1), 0.0)
         W = W.permute(0, 3, 1, 2)
 
-        # Auxiliary Attention Context (C)
-        C = self.swish_c(S, E, self.conv_c(V))  # [B, T, K, dim_c]
-
-        # Upsampled Representation (O)
-        upsampled_rep = self.linear_w(
-            torch.einsum("bqtk,bkh->bqth", W, V).permute(0, 2, 1, 3).flatten(2)
-        ) + self.linear_einsum(
-            torch.einsum("bqtk,btkp->bqtp", W, C).permute(0, 2, 1, 3).flatten(2)
-        )  # [B, T, M]
-        upsampled_rep = self.layer_norm(upsampled_rep)
-        upsampled_rep = upsampled_rep.masked_fill(mel_mask.unsqueeze(-1), 0)
-        upsampled_rep = self.proj_o(upsampled_rep)
-
-        return upsampled_rep, mel_mask, mel_len, W
+        return W, S, E
 
     def get_mask_from_lengths(self, lengths, max_len=None):
         batch_size = lengths.shape[0]
         if max_len is None:
-            max_len = torch.max(lengths).item()
+            max_len = torch.max(lengths)
 
-        ids = (
-            torch.arange(0, max_len)
-            .unsqueeze(0)
-            .expand(batch_size, -1)
-            .to(lengths.device)
-        )
-        mask = ids >= lengths.unsqueeze(1).expand(-1, max_len)
+        ids = torch.arange(0, max_len, device=lengths.device).unsqueeze(0)
+        mask = ids >= lengths.unsqueeze(1)
 
         return mask
 
@@ -262,16 +332,59 @@ class ResidualCouplingBlock(nn.Module):
                 x = flow(x, x_mask, g=g, reverse=reverse)
         return x
 
+    def remove_weight_norm(self):
+        for flow in self.flows:
+            if isinstance(flow, modules.ResidualCouplingLayer):
+                flow.enc.remove_weight_norm()
+
+    def fold_flips(self):
+        """
+        Drops the Flip layers by conjugating the coupling layers that follow
+        an odd number of Flips (see ResidualCouplingLayer.flip_channels).
+        """
+        flows = nn.ModuleList()
+        flipped = False
+        for flow in self.flows:
+            if isinstance(flow, modules.Flip):
+                flipped = not flipped
+                continue
+            if flipped:
+                flow.flip_channels()
+            flows.append(flow)
+        if flipped:
+            flows.append(modules.Flip())
+        self.flows = flows
+
 
 class VAEMemoryBank(nn.Module):
+    """
+    top_k: if given, each query attends only to its top_k bank entries at
+      inference time instead of the full softmax over the bank.
+    n_lists: if non-zero, the top_k candidates are searched in an IVF index
+      that clusters the bank keys into n_lists lists (per head), probing the
+      n_probe lists whose centroids score highest for each query.
+    """
+
     def __init__(
-            self, bank_size=1000, n_hidden_dims=192, n_attn_heads=2, init_values=None
+            self,
+            bank_size=1000,
+            n_hidden_dims=192,
+            n_attn_heads=2,
+            init_values=None,
+            top_k=None,
+            n_lists=0,
+            n_probe=8,
+            query_chunk_size=128,
     ):
         super().__init__()
 
         self.bank_size = bank_size
         self.n_hidden_dims = n_hidden_dims
         self.n_attn_heads = n_attn_heads
+        self.top_k = top_k
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.query_chunk_size = query_chunk_size
 
         self.encoder = attentions.MultiHeadAttention(
             channels=n_hidden_dims,
@@ -284,11 +397,133 @@ class VAEMemoryBank(nn.Module):
             with torch.no_grad():
                 self.memory_bank.copy_(init_values)
 
+        self._bank_kv = None
+        self._bank_kv_version = None
+        self._bank_index = None
+
     def forward(self, z):
         b, _, _ = z.shape
-        return self.encoder(
-            z, self.memory_bank.unsqueeze(0).repeat(b, 1, 1), attn_mask=None
+        if self.training or torch.is_grad_enabled():
+            return self.encoder(
+                z, self.memory_bank.unsqueeze(0).repeat(b, 1, 1), attn_mask=None
+            )
+
+        # inference: the bank is static, so only the query projection is computed
+        key, value = self.bank_key_value()
+        query = self.encoder.conv_q(z)
+        if self.top_k is not None:
+            x = self.retrieval_attention(query, key, value)
+        else:
+            x, self.encoder.attn = self.encoder.attention(
+                query, key.expand(b, -1, -1), value.expand(b, -1, -1), mask=None
+            )
+        return self.encoder.conv_o(x)
+
+    def bank_key_value(self):
+        """
+        Returns the key and value projections of the memory bank, [1, d, bank_size]
+        each. They are cached and recomputed only when the bank or the key/value
+        weights have changed (moved, loaded or updated in-place).
+        """
+        params = (
+            self.memory_bank,
+            self.encoder.conv_k.weight,
+            self.encoder.conv_k.bias,
+            self.encoder.conv_v.weight,
+            self.encoder.conv_v.bias,
         )
+        version = tuple((p.data_ptr(), p._version) for p in params)
+        if self._bank_kv is None or self._bank_kv_version != version:
+            with torch.no_grad():
+                bank = self.memory_bank.unsqueeze(0)
+                self._bank_kv = (self.encoder.conv_k(bank), self.encoder.conv_v(bank))
+            self._bank_kv_version = version
+            self._bank_index = None
+        return self._bank_kv
+
+    def bank_index(self, key):
+        """
+        Builds (once per cached key projection) the IVF index over the bank keys.
+        key: [h, bank_size, d_k]
+        ret: centroids [h, n_lists, d_k], lists [h, n_lists, max_list_len]
+          holding bank indices (padded with -1), list_keys [h, n_lists,
+          max_list_len, d_k] holding the corresponding keys (padded with 0)
+        """
+        if self._bank_index is None:
+            n_heads, bank_size, k_channels = key.shape
+            n_lists = min(self.n_lists, bank_size)
+            centroids, labels = [], []
+            for key_h in key:
+                c, l = commons.kmeans(key_h, n_clusters=n_lists)
+                centroids.append(c)
+                labels.append(l)
+            centroids = torch.stack(centroids)
+
+            counts = torch.stack([torch.bincount(l, minlength=n_lists) for l in labels])
+            lists = torch.full(
+                (n_heads, n_lists, int(counts.max())),
+                -1,
+                dtype=torch.long,
+                device=key.device,
+            )
+            for h, l in enumerate(labels):
+                order = torch.argsort(l, stable=True)
+                offsets = torch.cumsum(counts[h], 0) - counts[h]
+                slots = torch.arange(bank_size, device=key.device) - offsets[l[order]]
+                lists[h, l[order], slots] = order
+            heads = torch.arange(n_heads, device=key.device).view(-1, 1, 1)
+            list_keys = key[heads, lists.clamp(min=0)] * (lists >= 0).unsqueeze(-1)
+            self._bank_index = (centroids, lists, list_keys)
+        return self._bank_index
+
+    def retrieval_attention(self, query, key, value):
+        """
+        Top-k attention over the bank.
+        query: [b, d, t]
+        key, value: [1, d, bank_size]
+        ret: [b, d, t]
+        """
+        b, d, t = query.shape
+        n_heads, k_channels = self.encoder.n_heads, self.encoder.k_channels
+        query = query.view(b, n_heads, k_channels, t).permute(1, 0, 3, 2) / math.sqrt(
+            k_channels
+        )  # [h, b, t, d_k]
+        query = query.reshape(n_heads, b * t, k_channels)
+        key = key.view(n_heads, k_channels, -1).transpose(1, 2)  # [h, n, d_k]
+        value = value.view(n_heads, k_channels, -1).transpose(1, 2)  # [h, n, d_k]
+        if self.n_lists:
+            centroids, lists, list_keys = self.bank_index(key)
+
+        output = torch.empty_like(query)
+        for h in range(n_heads):
+            for q_start in range(0, b * t, self.query_chunk_size):
+                q = query[h, q_start: q_start + self.query_chunk_size]  # [n_q, d_k]
+                if self.n_lists:
+                    # score each query only against the keys of its probed lists
+                    probe = torch.matmul(q, centroids[h].t()).topk(
+                        min(self.n_probe, centroids.size(1)), dim=-1
+                    ).indices  # [n_q, n_probe]
+                    candidates = lists[h, probe]  # [n_q, n_probe, max_list_len]
+                    scores = torch.full(
+                        candidates.shape, -1e4, dtype=q.dtype, device=q.device
+                    )
+                    for l in torch.unique(probe).tolist():
+                        rows, cols = (probe == l).nonzero(as_tuple=True)
+                        scores[rows, cols] = torch.matmul(q[rows], list_keys[h, l].t())
+                    scores = scores.masked_fill(candidates < 0, -1e4).flatten(1)
+                    candidates = candidates.flatten(1)
+                else:
+                    candidates = None
+                    scores = torch.matmul(q, key[h].t())  # [n_q, bank_size]
+                scores, ids = scores.topk(min(self.top_k, scores.size(-1)), dim=-1)
+                if candidates is not None:
+                    ids = candidates.gather(-1, ids).clamp(min=0)
+                p_attn = F.softmax(scores, dim=-1)  # [n_q, top_k]
+                output[h, q_start: q_start + q.size(0)] = torch.einsum(
+                    "qk,qkd->qd", p_attn, value[h, ids]
+                )
+        output = output.view(n_heads, b, t, k_channels).permute(1, 0, 3, 2)
+        return output.reshape(b, d, t)
 
 
 class PosteriorEncoder(nn.Module):
@@ -344,12 +579,19 @@ class Generator(torch.nn.Module):
             upsample_initial_channel,
             upsample_kernel_sizes,
             gin_channels=0,
+            causal=False,
+            lookahead=0,
     ):
         super(Generator, self).__init__()
         self.num_kernels = len(resblock_kernel_sizes)
         self.num_upsamples = len(upsample_rates)
+        self.hop_length = int(np.prod(upsample_rates))
+        # causal: every output sample only depends on the current and past
+        # frames, plus `lookahead` future frames
+        self.causal = causal
+        self.lookahead = lookahead if causal else 0
         self.conv_pre = Conv1d(
-            initial_channel, upsample_initial_channel, 7, 1, padding=3
+            initial_channel, upsample_initial_channel, 7, 1, padding=0 if causal else 3
         )
         resblock = modules.ResBlock1 if resblock == "1" else modules.ResBlock2
 
@@ -362,7 +604,7 @@ class Generator(torch.nn.Module):
                         upsample_initial_channel // (2 ** (i + 1)),
                         k,
                         u,
-                        padding=(k - u) // 2,
+                        padding=0 if causal else (k - u) // 2,
                     )
                 )
             )
@@ -373,35 +615,125 @@ class Generator(torch.nn.Module):
             for j, (k, d) in enumerate(
                     zip(resblock_kernel_sizes, resblock_dilation_sizes)
             ):
-                self.resblocks.append(resblock(ch, k, d))
+                self.resblocks.append(resblock(ch, k, d, causal=causal))
 
-        self.conv_post = Conv1d(ch, 1, 7, 1, padding=3, bias=False)
+        self.conv_post = Conv1d(ch, 1, 7, 1, padding=0 if causal else 3, bias=False)
         self.ups.apply(init_weights)
 
         if gin_channels != 0:
             self.cond = nn.Conv1d(gin_channels, upsample_initial_channel, 1)
 
-    def forward(self, x, g=None):
-        x = self.conv_pre(x)
+    def forward(self, x, g=None, x_mask=None):
+        """
+        x_mask: [b, 1, t] frame mask of a padded batch. Padded frames are
+        zeroed after every layer, so each item is decoded as if on its own.
+        """
+        if self.causal:
+            # nothing looks to the right, only the output needs masking
+            if self.lookahead:
+                o = self._forward(F.pad(x, (0, self.lookahead)), g=g)
+                o = o[:, :, self.lookahead * self.hop_length:]
+            else:
+                o = self._forward(x, g=g)
+            if x_mask is not None:
+                o = o * torch.repeat_interleave(x_mask, self.hop_length, dim=2)
+            return o
+        return self._forward(x, g=g, x_mask=x_mask)
+
+    def _forward(self, x, g=None, cache=None, x_mask=None):
+        if x_mask is not None:
+            x = x * x_mask
+        x = self._conv(self.conv_pre, x, cache)
         if g is not None:
             x = x + self.cond(g)
 
         for i in range(self.num_upsamples):
+            if x_mask is not None:
+                x = x * x_mask
             x = F.leaky_relu(x, modules.LRELU_SLOPE)
-            x = self.ups[i](x)
+            if self.causal:
+                x = modules.causal_conv_transpose(self.ups[i], x, cache)
+            else:
+                x = self.ups[i](x)
+            if x_mask is not None:
+                x_mask = torch.repeat_interleave(x_mask, self.ups[i].stride[0], dim=2)
             xs = None
             for j in range(self.num_kernels):
                 if xs is None:
-                    xs = self.resblocks[i * self.num_kernels + j](x)
+                    xs = self.resblocks[i * self.num_kernels + j](x, x_mask, cache=cache)
                 else:
-                    xs += self.resblocks[i * self.num_kernels + j](x)
+                    xs += self.resblocks[i * self.num_kernels + j](x, x_mask, cache=cache)
             x = xs / self.num_kernels
         x = F.leaky_relu(x)
-        x = self.conv_post(x)
+        x = self._conv(self.conv_post, x, cache)
         x = torch.tanh(x)
+        if x_mask is not None:
+            x = x * x_mask
 
         return x
 
+    def _conv(self, conv, x, cache=None):
+        return modules.causal_conv(conv, x, cache) if self.causal else conv(x)
+
+    def receptive_field(self):
+        """
+        One-sided receptive field of an output sample, in input frames: chunks
+        decoded with this much context on both sides match full decoding.
+        """
+        hop = 1
+        rf = get_padding(self.conv_pre.kernel_size[0])
+        for i, up in enumerate(self.ups):
+            rf += math.ceil(up.kernel_size[0] / up.stride[0]) / hop
+            hop *= up.stride[0]
+            rf += max(
+                self.resblocks[i * self.num_kernels + j].receptive_field()
+                for j in range(self.num_kernels)
+            ) / hop
+        rf += get_padding(self.conv_post.kernel_size[0]) / hop
+        return math.ceil(rf)
+
+    def infer_stream(self, x, chunk_size=32, context=None, g=None):
+        """
+        Decodes x in chunks of `chunk_size` frames, each with `context` frames
+        of left/right context (the receptive field by default), and yields
+        their waveforms of chunk_size * hop_length samples. The concatenated
+        chunks match forward(x) up to floating point error.
+
+        A causal generator instead carries the convolution states over from
+        chunk to chunk, so chunks can be as small as one frame, and each one
+        is emitted as soon as its `lookahead` future frames have arrived.
+        """
+        if self.causal:
+            yield from self._infer_stream_causal(x, chunk_size, g=g)
+            return
+        if context is None:
+            context = self.receptive_field()
+        t = x.size(2)
+        for t_start in range(0, t, chunk_size):
+            t_end = min(t_start + chunk_size, t)
+            c_start, c_end = max(t_start - context, 0), min(t_end + context, t)
+            o = self.forward(x[:, :, c_start:c_end], g=g)
+            yield o[
+                  :,
+                  :,
+                  (t_start - c_start) * self.hop_length: (t_end - c_start) * self.hop_length,
+                  ]
+
+    def _infer_stream_causal(self, x, chunk_size, g=None):
+        cache = {}
+        # the first `lookahead` frames of output are the warm-up of the shift
+        n_skip = self.lookahead * self.hop_length
+        chunks = [x[:, :, t: t + chunk_size] for t in range(0, x.size(2), chunk_size)]
+        if self.lookahead:
+            chunks.append(x.new_zeros(x.size(0), x.size(1), self.lookahead))
+        for chunk in chunks:
+            o = self._forward(chunk, g=g, cache=cache)
+            n_out = o.size(2)
+            o = o[:, :, n_skip:]
+            n_skip = max(n_skip - n_out, 0)
+            if o.size(2) > 0:
+                yield o
+
     def remove_weight_norm(self):
         print("Removing weight norm...")
         for l in self.ups:
@@ -582,6 +914,7 @@ class SynthesizerTrn(nn.Module):
         )
 
         self.use_memory_bank = False
+        self.frozen = False
 
     def forward(self, x, x_lengths, y, y_lengths, use_gt_duration=True):
 
@@ -657,35 +990,299 @@ class SynthesizerTrn(nn.Module):
             ids_slice_q,
         )
 
-    def infer(self, x, x_lengths, noise_scale=1, length_scale=1, max_len=None, d=None):
-        # infer with only one example
-        x, _, _, x_mask = self.enc_p(x, x_lengths)
+    def encode_text(self, x, x_lengths, timer=None):
+        """
+        Text encoder & duration predictor, the part of inference that only
+        depends on the input tokens.
+        """
+        with stage(timer, "enc_p"):
+            x, _, _, x_mask = self.enc_p(x, x_lengths)
+        with stage(timer, "dp"):
+            logw = self.dp(x, x_mask, g=None)
+        return x, x_mask, logw
+
+    def infer(
+            self,
+            x,
+            x_lengths,
+            noise_scale=1,
+            length_scale=1,
+            max_len=None,
+            d=None,
+            upsampling_chunk_size=None,
+            encoder_cache=None,
+            noise=None,
+            generator=None,
+            timer=None,
+    ):
+        # infer with only one example, see `infer_batch` for padded batches
+        # timer: a `StageTimer` to time the stages with
+        z, y_mask, stats = self.infer_latent(
+            x,
+            x_lengths,
+            noise_scale=noise_scale,
+            length_scale=length_scale,
+            d=d,
+            upsampling_chunk_size=upsampling_chunk_size,
+            encoder_cache=encoder_cache,
+            noise=noise,
+            generator=generator,
+            timer=timer,
+        )
+        with stage(timer, "dec"):
+            o = self.dec((z * y_mask)[:, :, :max_len], g=None)
+        return o, y_mask, stats
+
+    def infer_batch(
+            self, x, x_lengths, decoder_batch_size=None, timer=None, on_decoded=None, **kwargs
+    ):
+        """
+        Batched `infer` for padded inputs of different lengths. Items are
+        vocoded in groups of `decoder_batch_size` (all at once by default)
+        sorted by output length, shortest first, each group trimmed to its
+        longest item, so few padded frames are vocoded. Returns the waveforms
+        [b, 1, t] (zero beyond each item's length), their lengths in samples,
+        the frame mask and (z, z_p, m_p, logs_p). With the same noise, every
+        item matches `infer` on that item alone.
+        on_decoded: called with (index, waveform [t]) for every item as soon
+        as its group is vocoded, e.g. to return it before the rest.
+        """
+        z, y_mask, stats = self.infer_latent(x, x_lengths, timer=timer, **kwargs)
+        y_lengths = y_mask.sum([1, 2]).long()
+        batch_size = z.size(0)
+        decoder_batch_size = decoder_batch_size or batch_size
+
+        o = z.new_zeros(batch_size, 1, z.size(2) * self.dec.hop_length)
+        order = torch.argsort(y_lengths)
+        for i in range(0, batch_size, decoder_batch_size):
+            ids = order[i: i + decoder_batch_size]
+            t = y_lengths[ids].max().item()
+            with stage(timer, "dec"):
+                o_ids = self.dec(z[ids, :, :t], g=None, x_mask=y_mask[ids, :, :t])
+            o[ids, :, : o_ids.size(2)] = o_ids
+            if on_decoded is not None:
+                for j in ids.tolist():
+                    on_decoded(j, o[j, 0, : y_lengths[j] * self.dec.hop_length])
+        return o, y_lengths * self.dec.hop_length, y_mask, stats
+
+    def infer_variants(
+            self, x, x_lengths, variants, decoder_batch_size=None, encoder_cache=None, **kwargs
+    ):
+        """
+        Synthesizes one input ([1, t_x]) once per (length_scale, noise_scale,
+        seed) variant, e.g. several speeds or takes. The text encoder and
+        duration predictor run once; the variants are batched through the
+        upsampling, flows and vocoder (see `infer_batch`). A variant with
+        seed None gets random noise, otherwise it matches `infer` with a
+        generator seeded with `seed`. Returns one waveform [t] per variant.
+        """
+        assert x.size(0) == 1, "variants are rendered for a single input"
+        if encoder_cache is not None:
+            encoded = encoder_cache.lookup(x, x_lengths, self.encode_text)
+        else:
+            encoded = self.encode_text(x, x_lengths)
+        n = len(variants)
+        generators = []
+        for _, _, seed in variants:
+            generator = torch.Generator(device=x.device)
+            if seed is None:
+                generator.seed()
+            else:
+                generator.manual_seed(seed)
+            generators.append(generator)
+
+        o, o_lengths, _, _ = self.infer_batch(
+            x.expand(n, -1),
+            x_lengths.expand(n),
+            decoder_batch_size=decoder_batch_size,
+            length_scale=x.new_tensor([v[0] for v in variants], dtype=torch.float).view(n, 1, 1),
+            noise_scale=x.new_tensor([v[1] for v in variants], dtype=torch.float).view(n, 1, 1),
+            generator=generators,
+            encoded=tuple(t.expand(n, *t.shape[1:]) for t in encoded),
+            **kwargs,
+        )
+        return [o[i, 0, : o_lengths[i]] for i in range(n)]
+
+    def infer_stream(self, x, x_lengths, chunk_size=32, **kwargs):
+        """
+        Same as `infer`, but yields the waveform in chunks of `chunk_size`
+        frames as they are vocoded (see Generator.infer_stream).
+        """
+        z, y_mask, _ = self.infer_latent(x, x_lengths, **kwargs)
+        yield from self.dec.infer_stream(z * y_mask, chunk_size=chunk_size)
+
+    def infer_timings(
+            self,
+            x,
+            x_lengths,
+            length_scale=1,
+            d=None,
+            soft=False,
+            encoder_cache=None,
+    ):
+        """
+        Token timings without the flows and vocoder: the start and end frame
+        of every token [b, t_x] (zero on padding) and the output lengths in
+        frames [b], as `infer` would produce them with the same
+        `length_scale`. Boundaries follow the predicted durations or, with
+        `soft`, the frames in which each token has the most attention weight
+        in the learnable upsampling; tokens that never do get zero length.
+        """
+        if encoder_cache is not None:
+            x, x_mask, logw = encoder_cache.lookup(x, x_lengths, self.encode_text)
+        else:
+            x, x_mask, logw = self.encode_text(x, x_lengths)
 
-        logw = self.dp(x, x_mask, g=None)
         w = torch.exp(logw) * x_mask * length_scale
         if d is not None:
             w = d.unsqueeze(1) * x_mask * length_scale
+        w = w.squeeze(1)
 
-        upsampled_rep, p_mask, _, W = self.learnable_upsampling(
-            w.squeeze(1),
-            x.transpose(1, 2),
-            x_lengths,
-            ~(x_mask.squeeze(1).bool()),
-            x_mask.shape[-1],
+        if not soft:
+            y_lengths = torch.clamp(
+                torch.round(w.sum(-1)).long(), max=self.learnable_upsampling.max_seq_len
+            )
+            ends = torch.cumsum(w, dim=1)
+            starts = ends - w
+            frame_max = y_lengths.unsqueeze(1).to(w.dtype)
+            return (
+                torch.minimum(starts, frame_max) * x_mask[:, 0],
+                torch.minimum(ends, frame_max) * x_mask[:, 0],
+                y_lengths,
+            )
+
+        W, y_lengths = self.learnable_upsampling.alignment(
+            w, x.transpose(1, 2), ~(x_mask.squeeze(1).bool()), x_mask.shape[-1]
         )
+        frames = torch.arange(W.size(1), device=W.device)
+        tokens = torch.arange(W.size(2), device=W.device)
+        # [b, t_y, t_x]: the token with the most weight in each valid frame
+        assigned = (W.argmax(2, keepdim=True) == tokens) & (
+            frames < y_lengths.unsqueeze(1)
+        ).unsqueeze(2)
+        starts = torch.where(assigned, frames.unsqueeze(1), W.size(1)).amin(1)
+        ends = torch.where(assigned, frames.unsqueeze(1) + 1, 0).amax(1)
+        # unassigned tokens collapse onto the end of the previous token
+        ends = torch.cummax(ends, dim=1).values
+        starts = torch.where(assigned.any(1), starts, ends)
+        return (
+            starts.to(w.dtype) * x_mask[:, 0],
+            ends.to(w.dtype) * x_mask[:, 0],
+            y_lengths,
+        )
+
+    def infer_latent(
+            self,
+            x,
+            x_lengths,
+            noise_scale=1,
+            length_scale=1,
+            d=None,
+            upsampling_chunk_size=None,
+            encoder_cache=None,
+            noise=None,
+            generator=None,
+            encoded=None,
+            frame_buckets=None,
+            timer=None,
+    ):
+        """
+        Everything in `infer` up to the vocoder: returns the decoder input z
+        (zero on padded frames), its mask and (z, z_p, m_p, logs_p).
+        noise_scale and length_scale may be [b, 1, 1] tensors of per-item
+        values.
+
+        noise: standard normal noise for the prior, [b, d, t] with t at least
+        the number of output frames; sampled with torch.randn if None.
+        generator: torch.Generator, or a list with one per item, to sample
+        the noise from when it is not given (see `prior_noise`).
+        encoded: `encode_text` outputs to use instead of running it.
+        frame_buckets: ascending frame counts; the frames are zero-padded (and
+        masked) up to the smallest one that fits, so the flows and vocoder
+        only see a few shapes.
+        timer: a `StageTimer` to time the stages with.
+        """
+        if encoded is not None:
+            x, x_mask, logw = encoded
+        elif encoder_cache is not None:
+            x, x_mask, logw = encoder_cache.lookup(
+                x, x_lengths, lambda x, x_lengths: self.encode_text(x, x_lengths, timer)
+            )
+        else:
+            x, x_mask, logw = self.encode_text(x, x_lengths, timer)
+
+        w = torch.exp(logw) * x_mask * length_scale
+        if d is not None:
+            w = d.unsqueeze(1) * x_mask * length_scale
+
+        with stage(timer, "learnable_upsampling"):
+            upsampled_rep, p_mask, _, W = self.learnable_upsampling(
+                w.squeeze(1),
+                x.transpose(1, 2),
+                x_lengths,
+                ~(x_mask.squeeze(1).bool()),
+                x_mask.shape[-1],
+                chunk_size=upsampling_chunk_size,
+            )
         p_mask = ~p_mask
         m_p, logs_p = torch.split(upsampled_rep.transpose(1, 2), 192, dim=1)
 
         y_mask = p_mask.unsqueeze(1)
-
-        z_p = m_p + torch.randn_like(m_p) * torch.exp(logs_p) * noise_scale
-        z = self.flow(z_p, y_mask, g=None, reverse=True)
+        if frame_buckets is not None:
+            n_frames = m_p.size(2)
+            padding = next((b for b in frame_buckets if b >= n_frames), n_frames) - n_frames
+            m_p, logs_p = F.pad(m_p, (0, padding)), F.pad(logs_p, (0, padding))
+            y_mask = F.pad(y_mask, (0, padding))
+
+        if noise is None:
+            noise = self.prior_noise(m_p, generator)
+        z_p = m_p + noise[:, :, : m_p.size(2)] * torch.exp(logs_p) * noise_scale
+        with stage(timer, "flow"):
+            z = self.flow(z_p, y_mask, g=None, reverse=True)
 
         if self.use_memory_bank:
-            z = self.memory_bank(z)
-
-        o = self.dec((z * y_mask)[:, :, :max_len], g=None)
-        return o, y_mask, (z, z_p, m_p, logs_p)
+            with stage(timer, "memory_bank"):
+                z = self.memory_bank(z)
+        z = z * y_mask
+
+        return z, y_mask, (z, z_p, m_p, logs_p)
+
+    @staticmethod
+    def prior_noise(m_p, generator=None):
+        """
+        Standard normal noise shaped like m_p [b, d, t]. With a list of
+        generators, item i is drawn from generator i frame by frame, so an
+        item's noise only depends on its generator, not on the padded length
+        of its batch: seeded items match their unbatched output.
+        """
+        if generator is None:
+            return torch.randn_like(m_p)
+        b, d, t = m_p.shape
+        if isinstance(generator, torch.Generator):
+            generator = [generator] * b
+        noise = [
+            torch.randn(t, d, generator=g, device=g.device, dtype=m_p.dtype)
+            for g in generator
+        ]
+        return torch.stack(noise).transpose(1, 2).to(m_p.device)
+
+    def freeze_for_inference(self):
+        """
+        Turns the model into a slim inference-only model: weight norm is
+        removed, BatchNorm is folded into the preceding convolutions, the flow
+        Flips are folded into the coupling layers and the posterior encoder is
+        dropped. `forward` (training) is not available afterwards.
+        """
+        self.eval()
+        if hasattr(self, "enc_q"):
+            del self.enc_q
+        self.dec.remove_weight_norm()
+        self.flow.remove_weight_norm()
+        self.flow.fold_flips()
+        self.learnable_upsampling.fuse_batch_norm()
+        self.requires_grad_(False)
+        self.frozen = True
+        return self
 
     def attach_memory_bank(self, hps_models):
         device = next(self.parameters()).device
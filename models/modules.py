@@ -219,9 +219,46 @@ class WN(torch.nn.Module):
             torch.nn.utils.remove_weight_norm(l)
 
 
+def causal_conv(conv, x, cache=None):
+    """
+    Runs `conv` (built with padding=0) causally, left-padding x by its
+    receptive field. When streaming, `cache` holds the tail of the previous
+    chunk's input per layer and is used instead of zero padding.
+    """
+    pad = conv.dilation[0] * (conv.kernel_size[0] - 1)
+    if cache is None:
+        return conv(F.pad(x, (pad, 0)))
+    history = cache.get(conv)
+    if history is None:
+        history = x.new_zeros(x.size(0), x.size(1), pad)
+    x = torch.cat([history, x], dim=2)
+    cache[conv] = x[:, :, x.size(2) - pad:]
+    return conv(x)
+
+
+def causal_conv_transpose(conv, x, cache=None):
+    """
+    Runs the transposed convolution `conv` (built with padding=0) causally:
+    output sample j only depends on input frames i <= j // stride. When
+    streaming, `cache` holds the previous input frames that still overlap the
+    current ones.
+    """
+    t, stride = x.size(2), conv.stride[0]
+    if cache is None:
+        return conv(x)[:, :, : t * stride]
+    n_history = math.ceil(conv.kernel_size[0] / stride) - 1
+    history = cache.get(conv)
+    if history is None:
+        history = x.new_zeros(x.size(0), x.size(1), n_history)
+    x = torch.cat([history, x], dim=2)
+    cache[conv] = x[:, :, x.size(2) - n_history:]
+    return conv(x)[:, :, n_history * stride: (n_history + t) * stride]
+
+
 class ResBlock1(torch.nn.Module):
-    def __init__(self, channels, kernel_size=3, dilation=(1, 3, 5)):
+    def __init__(self, channels, kernel_size=3, dilation=(1, 3, 5), causal=False):
         super(ResBlock1, self).__init__()
+        self.causal = causal
         self.convs1 = nn.ModuleList(
             [
                 weight_norm(
@@ -231,7 +268,7 @@ class ResBlock1(torch.nn.Module):
                         kernel_size,
                         1,
                         dilation=dilation[0],
-                        padding=get_padding(kernel_size, dilation[0]),
+                        padding=0 if causal else get_padding(kernel_size, dilation[0]),
                     )
                 ),
                 weight_norm(
@@ -241,7 +278,7 @@ class ResBlock1(torch.nn.Module):
                         kernel_size,
                         1,
                         dilation=dilation[1],
-                        padding=get_padding(kernel_size, dilation[1]),
+                        padding=0 if causal else get_padding(kernel_size, dilation[1]),
                     )
                 ),
                 weight_norm(
@@ -251,7 +288,7 @@ class ResBlock1(torch.nn.Module):
                         kernel_size,
                         1,
                         dilation=dilation[2],
-                        padding=get_padding(kernel_size, dilation[2]),
+                        padding=0 if causal else get_padding(kernel_size, dilation[2]),
                     )
                 ),
             ]
@@ -267,7 +304,7 @@ class ResBlock1(torch.nn.Module):
                         kernel_size,
                         1,
                         dilation=1,
-                        padding=get_padding(kernel_size, 1),
+                        padding=0 if causal else get_padding(kernel_size, 1),
                     )
                 ),
                 weight_norm(
@@ -277,7 +314,7 @@ class ResBlock1(torch.nn.Module):
                         kernel_size,
                         1,
                         dilation=1,
-                        padding=get_padding(kernel_size, 1),
+                        padding=0 if causal else get_padding(kernel_size, 1),
                     )
                 ),
                 weight_norm(
@@ -287,28 +324,34 @@ class ResBlock1(torch.nn.Module):
                         kernel_size,
                         1,
                         dilation=1,
-                        padding=get_padding(kernel_size, 1),
+                        padding=0 if causal else get_padding(kernel_size, 1),
                     )
                 ),
             ]
         )
         self.convs2.apply(init_weights)
 
-    def forward(self, x, x_mask=None):
+    def forward(self, x, x_mask=None, cache=None):
         for c1, c2 in zip(self.convs1, self.convs2):
             xt = F.leaky_relu(x, LRELU_SLOPE)
             if x_mask is not None:
                 xt = xt * x_mask
-            xt = c1(xt)
+            xt = causal_conv(c1, xt, cache) if self.causal else c1(xt)
             xt = F.leaky_relu(xt, LRELU_SLOPE)
             if x_mask is not None:
                 xt = xt * x_mask
-            xt = c2(xt)
+            xt = causal_conv(c2, xt, cache) if self.causal else c2(xt)
             x = xt + x
         if x_mask is not None:
             x = x * x_mask
         return x
 
+    def receptive_field(self):
+        return sum(
+            get_padding(c.kernel_size[0], c.dilation[0])
+            for c in [*self.convs1, *self.convs2]
+        )
+
     def remove_weight_norm(self):
         for l in self.convs1:
             remove_weight_norm(l)
@@ -317,8 +360,9 @@ class ResBlock1(torch.nn.Module):
 
 
 class ResBlock2(torch.nn.Module):
-    def __init__(self, channels, kernel_size=3, dilation=(1, 3)):
+    def __init__(self, channels, kernel_size=3, dilation=(1, 3), causal=False):
         super(ResBlock2, self).__init__()
+        self.causal = causal
         self.convs = nn.ModuleList(
             [
                 weight_norm(
@@ -328,7 +372,7 @@ class ResBlock2(torch.nn.Module):
                         kernel_size,
                         1,
                         dilation=dilation[0],
-                        padding=get_padding(kernel_size, dilation[0]),
+                        padding=0 if causal else get_padding(kernel_size, dilation[0]),
                     )
                 ),
                 weight_norm(
@@ -338,24 +382,27 @@ class ResBlock2(torch.nn.Module):
                         kernel_size,
                         1,
                         dilation=dilation[1],
-                        padding=get_padding(kernel_size, dilation[1]),
+                        padding=0 if causal else get_padding(kernel_size, dilation[1]),
                     )
                 ),
             ]
         )
         self.convs.apply(init_weights)
 
-    def forward(self, x, x_mask=None):
+    def forward(self, x, x_mask=None, cache=None):
         for c in self.convs:
             xt = F.leaky_relu(x, LRELU_SLOPE)
             if x_mask is not None:
                 xt = xt * x_mask
-            xt = c(xt)
+            xt = causal_conv(c, xt, cache) if self.causal else c(xt)
             x = xt + x
         if x_mask is not None:
             x = x * x_mask
         return x
 
+    def receptive_field(self):
+        return sum(get_padding(c.kernel_size[0], c.dilation[0]) for c in self.convs)
+
     def remove_weight_norm(self):
         for l in self.convs:
             remove_weight_norm(l)
@@ -435,8 +482,13 @@ class ResidualCouplingLayer(nn.Module):
         self.post.weight.data.zero_()
         self.post.bias.data.zero_()
 
+        # set by flip_channels: the second half conditions the first one
+        self.swap_halves = False
+
     def forward(self, x, x_mask, g=None, reverse=False):
         x0, x1 = torch.split(x, [self.half_channels] * 2, 1)
+        if self.swap_halves:
+            x0, x1 = x1, x0
         h = self.pre(x0) * x_mask
         h = self.enc(h, x_mask, g=g)
         stats = self.post(h) * x_mask
@@ -444,18 +496,40 @@ class ResidualCouplingLayer(nn.Module):
             m, logs = torch.split(stats, [self.half_channels] * 2, 1)
         else:
             m = stats
-            logs = torch.zeros_like(m)
+            logs = None
 
         if not reverse:
-            x1 = m + x1 * torch.exp(logs) * x_mask
-            x = torch.cat([x0, x1], 1)
-            logdet = torch.sum(logs, [1, 2])
+            if logs is None:
+                x1 = m + x1 * x_mask
+                logdet = torch.zeros(x.size(0), dtype=x.dtype, device=x.device)
+            else:
+                x1 = m + x1 * torch.exp(logs) * x_mask
+                logdet = torch.sum(logs, [1, 2])
+            x = torch.cat([x1, x0] if self.swap_halves else [x0, x1], 1)
             return x, logdet
         else:
-            x1 = (x1 - m) * torch.exp(-logs) * x_mask
-            x = torch.cat([x0, x1], 1)
+            if logs is None:
+                x1 = (x1 - m) * x_mask
+            else:
+                x1 = (x1 - m) * torch.exp(-logs) * x_mask
+            x = torch.cat([x1, x0] if self.swap_halves else [x0, x1], 1)
             return x
 
+    def flip_channels(self):
+        """
+        Turns the layer into Flip o self o Flip, by permuting the input
+        channels of `pre` and the output channels of `post` and swapping the
+        roles of the two halves, so that the neighbouring Flips can be dropped.
+        """
+        n_stats = 1 if self.mean_only else 2
+        with torch.no_grad():
+            self.pre.weight.copy_(self.pre.weight.flip(1))
+            post_weight = self.post.weight.view(n_stats, self.half_channels, -1, 1)
+            self.post.weight.copy_(post_weight.flip(1).view_as(self.post.weight))
+            post_bias = self.post.bias.view(n_stats, self.half_channels)
+            self.post.bias.copy_(post_bias.flip(1).view_as(self.post.bias))
+        self.swap_halves = not self.swap_halves
+
 
 class SwishBlock(nn.Module):
     """Swish Block"""
@@ -471,15 +545,17 @@ class SwishBlock(nn.Module):
         )
 
     def forward(self, S, E, V):
-        out = torch.cat(
-            [
-                S.unsqueeze(-1),
-                E.unsqueeze(-1),
-                V.unsqueeze(1).expand(-1, E.size(1), -1, -1),
-            ],
-            dim=-1,
-        )
-        out = self.layer(out)
+        # The first projection of cat([S, E, V]) is split column-wise so that
+        # V (which only depends on [B, K]) is projected once per token and
+        # broadcast over T, instead of materializing the [B, T, K, C + 2] input.
+        first = self.layer[0].linear
+        out = F.linear(V, first.weight[:, 2:], first.bias).unsqueeze(1)  # [B, 1, K, H]
+        out = (
+            out
+            + S.unsqueeze(-1) * first.weight[:, 0]
+            + E.unsqueeze(-1) * first.weight[:, 1]
+        )  # [B, T, K, H]
+        out = self.layer[1:](out)
 
         return out
 
@@ -524,6 +600,18 @@ class ConvBlock(nn.Module):
         self.dropout = dropout
         self.layer_norm = nn.LayerNorm(out_channels)
 
+    def fuse_batch_norm(self):
+        """Folds the (eval mode) BatchNorm into the preceding convolution."""
+        conv, bn = self.conv_layer[0].conv, self.conv_layer[1]
+        if not isinstance(bn, nn.BatchNorm1d):
+            return
+        with torch.no_grad():
+            scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+            bias = conv.bias if conv.bias is not None else torch.zeros_like(scale)
+            conv.weight.mul_(scale.view(-1, 1, 1))
+            conv.bias = nn.Parameter((bias - bn.running_mean) * scale + bn.bias)
+        self.conv_layer[1] = nn.Identity()
+
     def forward(self, enc_input, mask=None):
         enc_output = enc_input.contiguous().transpose(1, 2)
         enc_output = F.dropout(self.conv_layer(enc_output), self.dropout, self.training)
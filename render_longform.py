@@ -0,0 +1,80 @@
+import argparse
+import os
+import time
+
+import torch
+
+from inference.longform import LongFormJob
+from inference.model import load_synthesizer
+from synthesize import write_wav
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", type=str, default=None)
+    parser.add_argument(
+        "--weights_path", type=str, required=True, help="training or frozen checkpoint"
+    )
+    parser.add_argument(
+        "-i", "--input", type=str, required=True, help="text file, blank lines between paragraphs"
+    )
+    parser.add_argument("-o", "--output", type=str, required=True, help="output wav")
+    parser.add_argument(
+        "--work_dir",
+        type=str,
+        default=None,
+        help="finished units, for resuming; defaults to [output].units/",
+    )
+    parser.add_argument(
+        "--cleaned", action="store_true", help="input text is already cleaned"
+    )
+    parser.add_argument("--n_workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--num_threads", type=int, default=1, help="intra-op threads per worker"
+    )
+    parser.add_argument("--max_chars", type=int, default=300, help="max characters per unit")
+    parser.add_argument("--sentence_pause_ms", type=float, default=300)
+    parser.add_argument("--paragraph_pause_ms", type=float, default=800)
+    parser.add_argument("--crossfade_ms", type=float, default=10)
+    parser.add_argument("--noise_scale", type=float, default=0.667)
+    parser.add_argument("--length_scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--log_interval", type=int, default=10, help="in units")
+    args = parser.parse_args()
+
+    net_g, hps = load_synthesizer(args.weights_path, args.config)
+    if not net_g.frozen:
+        net_g.freeze_for_inference()
+    with open(args.input, encoding="utf-8") as f:
+        text = f.read()
+
+    job = LongFormJob(
+        net_g,
+        hps,
+        text,
+        args.work_dir or args.output + ".units",
+        cleaned=args.cleaned,
+        max_chars=args.max_chars,
+        noise_scale=args.noise_scale,
+        length_scale=args.length_scale,
+        seed=args.seed,
+    )
+    start = time.perf_counter()
+    n_rendered = job.render(args.n_workers, args.num_threads, args.log_interval)
+    render_time = time.perf_counter() - start
+
+    audio = job.stitch(args.sentence_pause_ms, args.paragraph_pause_ms, args.crossfade_ms)
+    audio = (torch.from_numpy(audio).clamp(-1, 1) * (hps.data.max_wav_value - 1)).short()
+    write_wav(args.output, hps.data.sampling_rate, audio.numpy())
+    duration = audio.size(0) / hps.data.sampling_rate
+    print(
+        "{} units ({} rendered, {} resumed), {:.1f}s of audio in {:.1f}s "
+        "on {} workers".format(
+            len(job.units),
+            n_rendered,
+            len(job.units) - n_rendered,
+            duration,
+            render_time,
+            args.n_workers,
+        )
+    )
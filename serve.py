@@ -0,0 +1,196 @@
+import argparse
+import asyncio
+import os
+import socket
+
+import torch
+
+from inference.buckets import ShapeBuckets, geometric_buckets
+from inference.cache import AudioCache, EncoderCache
+from inference.model import load_synthesizer
+from inference.prefork import fork_workers, share_weights, wait_workers
+from inference.server import BatchScheduler, SynthesisServer
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", type=str, default=None)
+    parser.add_argument(
+        "--weights_path", type=str, required=True, help="training or frozen checkpoint"
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max_batch_size", type=int, default=8)
+    parser.add_argument(
+        "--max_wait_ms",
+        type=float,
+        default=10,
+        help="how long the first request of a batch waits for others",
+    )
+    parser.add_argument(
+        "--n_workers", type=int, default=1, help="batches synthesized concurrently"
+    )
+    parser.add_argument(
+        "--intra_op_threads",
+        type=int,
+        default=None,
+        help="torch threads per worker, defaults to cpu count / n_workers",
+    )
+    parser.add_argument("--inter_op_threads", type=int, default=1)
+    parser.add_argument(
+        "--decoder_batch_size",
+        type=int,
+        default=1,
+        help="requests vocoded together; each is answered once its group is done",
+    )
+    parser.add_argument(
+        "--interactive_latency_budget",
+        type=float,
+        default=2.0,
+        help="seconds, interactive jobs estimated to take longer are rejected",
+    )
+    parser.add_argument(
+        "--bulk_max_concurrency",
+        type=int,
+        default=1,
+        help="workers bulk jobs may occupy at once",
+    )
+    parser.add_argument(
+        "--bulk_max_batch_size",
+        type=int,
+        default=1,
+        help="chunks per bulk batch, bounds how long interactive jobs wait",
+    )
+    parser.add_argument(
+        "--default_seed",
+        type=int,
+        default=None,
+        help="seed of requests without one; unseeded requests are not cached",
+    )
+    parser.add_argument(
+        "--cache_dir", type=str, default=None, help="disk tier of the audio cache"
+    )
+    parser.add_argument("--cache_memory_mb", type=int, default=256)
+    parser.add_argument("--cache_disk_mb", type=int, default=4096)
+    parser.add_argument(
+        "--encoder_cache_mb",
+        type=int,
+        default=64,
+        help="text encoder outputs cached per sentence, 0 to disable",
+    )
+    parser.add_argument(
+        "--max_chars", type=int, default=300, help="max characters per scheduled chunk"
+    )
+    parser.add_argument(
+        "--bucket_ratio",
+        type=float,
+        default=None,
+        help="pad token counts and frames to buckets growing by this ratio "
+        "(bounding the padding overhead to ratio - 1) and warm them up at start",
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="torch.compile the vocoder for every frame bucket",
+    )
+    parser.add_argument(
+        "--stage_timings",
+        action="store_true",
+        help="report per-stage latency percentiles in /metrics",
+    )
+    parser.add_argument(
+        "--n_processes",
+        type=int,
+        default=1,
+        help="pre-forked server processes sharing the model weights and port",
+    )
+    args = parser.parse_args()
+
+    # must be set before any inter-op parallel work is started
+    torch.set_num_interop_threads(args.inter_op_threads)
+    intra_op_threads = args.intra_op_threads or max(
+        os.cpu_count() // (args.n_processes * args.n_workers), 1
+    )
+    if args.n_processes > 1:
+        # no intra-op thread pool may exist when forking
+        torch.set_num_threads(1)
+
+    net_g, hps = load_synthesizer(args.weights_path, args.config)
+    if not net_g.frozen:
+        net_g.freeze_for_inference()
+
+    def run_worker(index=0, sock=None):
+        buckets = None
+        if args.bucket_ratio is not None:
+            buckets = ShapeBuckets(
+                net_g,
+                geometric_buckets(16, 2 * args.max_chars + 1, args.bucket_ratio),
+                geometric_buckets(
+                    32, net_g.learnable_upsampling.max_seq_len, args.bucket_ratio
+                ),
+                compile=args.compile,
+            )
+        scheduler = BatchScheduler(
+            net_g,
+            max_batch_size=args.max_batch_size,
+            max_wait_ms=args.max_wait_ms,
+            n_workers=args.n_workers,
+            intra_op_threads=intra_op_threads,
+            classes={
+                "interactive": dict(
+                    priority=0, latency_budget=args.interactive_latency_budget
+                ),
+                "bulk": dict(
+                    priority=1,
+                    max_concurrency=args.bulk_max_concurrency,
+                    max_batch_size=args.bulk_max_batch_size,
+                ),
+            },
+            # with several processes, each keeps its own memory tier and
+            # enforces the disk budget on the entries it knows of
+            cache=AudioCache(
+                args.cache_memory_mb * 1024 * 1024,
+                args.cache_dir,
+                args.cache_disk_mb * 1024 * 1024,
+            ),
+            buckets=buckets,
+            stage_timings=args.stage_timings,
+            decoder_batch_size=args.decoder_batch_size,
+            encoder_cache=(
+                EncoderCache(args.encoder_cache_mb * 1024 * 1024)
+                if args.encoder_cache_mb
+                else None
+            ),
+        )
+        if buckets is not None:
+            for bucket in scheduler.warmup():
+                print(
+                    "[worker {}] {} x {} tokens x {} frames: {:.0f}ms cold, "
+                    "{:.0f}ms warm".format(
+                        index,
+                        bucket["batch_size"],
+                        bucket["tokens"],
+                        bucket["frames"],
+                        bucket["cold_ms"],
+                        bucket["warm_ms"],
+                    )
+                )
+        print(
+            "[worker {}] per-token cost: {:.2f}ms".format(
+                index, 1000 * scheduler.measure_cost()
+            )
+        )
+        asyncio.run(
+            SynthesisServer(
+                scheduler, hps, max_chars=args.max_chars, default_seed=args.default_seed
+            ).serve(args.host, args.port, sock=sock)
+        )
+
+    print("Serving on http://{}:{}".format(args.host, args.port))
+    if args.n_processes == 1:
+        run_worker()
+    else:
+        print("Shared {:.1f} MB of weights".format(share_weights(net_g) / 2 ** 20))
+        sock = socket.create_server((args.host, args.port))
+        wait_workers(
+            fork_workers(args.n_processes, lambda index: run_worker(index, sock))
+        )
@@ -0,0 +1,244 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import scipy.io.wavfile
+import torch
+
+from inference.frontend import text_to_ids
+from inference.model import load_synthesizer
+from inference.quantize import QUANTIZED_MODULES, quantize_synthesizer
+from utils.stage_timer import StageTimer, stage
+
+
+def load_items(input_path):
+    """
+    Reads (name, text) pairs from a filelist ("path/to/name.wav|text" lines,
+    named after the wav) or a plain text file (one utterance per line, named
+    after the line number).
+    """
+    items = []
+    with open(input_path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            if "|" in line:
+                fields = line.split("|")
+                items.append((Path(fields[0]).stem, fields[-1]))
+            else:
+                items.append(("{:06d}".format(i), line))
+    return items
+
+
+def make_batches(items, batch_size):
+    """Length-sorted (longest first) batches of (name, token ids) items."""
+    items = sorted(items, key=lambda item: item[1].size(0), reverse=True)
+    return [items[i: i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+def write_wav(path, sampling_rate, audio):
+    # written under a temporary name, so a killed job never leaves a partial
+    # wav behind that --resume would skip
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        scipy.io.wavfile.write(f, sampling_rate, audio)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", type=str, default=None)
+    parser.add_argument(
+        "--weights_path", type=str, required=True, help="training or frozen checkpoint"
+    )
+    parser.add_argument(
+        "-i", "--input", type=str, required=True, help="filelist or text file"
+    )
+    parser.add_argument("-o", "--output_dir", type=str, required=True)
+    parser.add_argument(
+        "--cleaned", action="store_true", help="input text is already cleaned"
+    )
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument(
+        "--decoder_batch_size", type=int, default=None, help="defaults to batch_size"
+    )
+    parser.add_argument("--num_threads", type=int, default=torch.get_num_threads())
+    parser.add_argument("--n_writers", type=int, default=2)
+    parser.add_argument("--noise_scale", type=float, default=0.667)
+    parser.add_argument("--length_scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument(
+        "--length_scales",
+        type=float,
+        nargs="+",
+        default=None,
+        help="render every utterance at each of these speeds",
+    )
+    parser.add_argument(
+        "--n_takes",
+        type=int,
+        default=1,
+        help="takes per speed, seeded seed, seed + 1, ...",
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="skip utterances already written"
+    )
+    parser.add_argument(
+        "--quantize",
+        type=str,
+        default=None,
+        choices=["dynamic", "static"],
+        help="INT8 inference; static calibrates on the validation filelist",
+    )
+    parser.add_argument(
+        "--quantize_modules", type=str, nargs="+", default=list(QUANTIZED_MODULES)
+    )
+    parser.add_argument(
+        "--fp32_layers",
+        type=str,
+        nargs="*",
+        default=[],
+        help="fnmatch patterns of layers kept in fp32 when quantizing",
+    )
+    parser.add_argument("--n_calibration", type=int, default=20)
+    parser.add_argument("--log_interval", type=int, default=10, help="in batches")
+    parser.add_argument(
+        "--stage_timings", action="store_true", help="print the time spent per stage"
+    )
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.num_threads)
+    torch.manual_seed(args.seed)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    net_g, hps = load_synthesizer(args.weights_path, args.config)
+    sampling_rate = hps.data.sampling_rate
+    if args.quantize is not None:
+        if not net_g.frozen:
+            net_g.freeze_for_inference()
+        calibration = None
+        if args.quantize == "static":
+            path = hps.data.validation_files
+            calibration = []
+            for _, text in load_items(path)[: args.n_calibration]:
+                ids = text_to_ids(text, hps.data, path.endswith(".cleaned"))
+                calibration.append((ids.unsqueeze(0), torch.LongTensor([ids.size(0)])))
+        quantize_synthesizer(
+            net_g,
+            args.quantize,
+            modules=args.quantize_modules,
+            fp32_layers=args.fp32_layers,
+            calibration_inputs=calibration,
+        )
+
+    # with several variants, every utterance is rendered once per variant as
+    # [name]_[i].wav, sharing its text encoder pass (see `infer_variants`)
+    variants = None
+    if args.length_scales is not None or args.n_takes > 1:
+        variants = [
+            (length_scale, args.noise_scale, args.seed + take)
+            for length_scale in args.length_scales or [args.length_scale]
+            for take in range(args.n_takes)
+        ]
+        for i, (length_scale, _, seed) in enumerate(variants):
+            print("variant {}: length_scale {}, seed {}".format(i, length_scale, seed))
+
+    def output_names(name):
+        if variants is None:
+            return [name]
+        return ["{}_{}".format(name, i) for i in range(len(variants))]
+
+    items = load_items(args.input)
+    n_items = len(items)
+    if args.resume:
+        items = [
+            (name, text)
+            for name, text in items
+            if not all(
+                os.path.exists(os.path.join(args.output_dir, output + ".wav"))
+                for output in output_names(name)
+            )
+        ]
+    print("{} utterances, {} to synthesize".format(n_items, len(items)))
+
+    timer = StageTimer(next(net_g.parameters()).device) if args.stage_timings else None
+    with stage(timer, "frontend"):
+        items = [(name, text_to_ids(text, hps.data, args.cleaned)) for name, text in items]
+    batches = make_batches(items, args.batch_size if variants is None else 1)
+
+    synth_time, n_samples, pending = 0.0, 0, []
+    with ThreadPoolExecutor(args.n_writers) as writers:
+        for batch_idx, batch in enumerate(batches):
+            x_lengths = torch.LongTensor([ids.size(0) for _, ids in batch])
+            x = torch.zeros(len(batch), x_lengths.max(), dtype=torch.long)
+            for i, (_, ids) in enumerate(batch):
+                x[i, : ids.size(0)] = ids
+
+            start = time.perf_counter()
+            with torch.no_grad():
+                if variants is None:
+                    o, o_lengths, *_ = net_g.infer_batch(
+                        x,
+                        x_lengths,
+                        decoder_batch_size=args.decoder_batch_size,
+                        noise_scale=args.noise_scale,
+                        length_scale=args.length_scale,
+                        timer=timer,
+                    )
+                    waveforms = [o[i, 0, : o_lengths[i]] for i in range(len(batch))]
+                else:
+                    waveforms = net_g.infer_variants(
+                        x,
+                        x_lengths,
+                        variants,
+                        decoder_batch_size=args.decoder_batch_size,
+                        timer=timer,
+                    )
+            synth_time += time.perf_counter() - start
+            n_samples += sum(waveform.size(0) for waveform in waveforms)
+
+            names = [output for name, _ in batch for output in output_names(name)]
+            for name, waveform in zip(names, waveforms):
+                audio = (waveform.clamp(-1, 1) * (hps.data.max_wav_value - 1)).short()
+                pending.append(
+                    writers.submit(
+                        write_wav,
+                        os.path.join(args.output_dir, name + ".wav"),
+                        sampling_rate,
+                        audio.numpy(),
+                    )
+                )
+            # surface write errors early
+            for future in [f for f in pending if f.done()]:
+                future.result()
+                pending.remove(future)
+
+            if (batch_idx + 1) % args.log_interval == 0 or batch_idx + 1 == len(batches):
+                print(
+                    "[{}/{}] {:.1f}s of audio, RTF {:.3f}".format(
+                        batch_idx + 1,
+                        len(batches),
+                        n_samples / sampling_rate,
+                        synth_time / max(n_samples / sampling_rate, 1e-9),
+                    )
+                )
+        for future in pending:
+            future.result()
+
+    if n_samples:
+        print(
+            "Synthesized {:.1f}s of audio in {:.1f}s (RTF {:.3f}, {} threads)".format(
+                n_samples / sampling_rate,
+                synth_time,
+                synth_time / (n_samples / sampling_rate),
+                args.num_threads,
+            )
+        )
+    if timer is not None:
+        timings = timer.timings()
+        total = sum(timings.values())
+        for name, ms in timings.items():
+            print("{:>22}: {:9.1f}ms {:5.1f}%".format(name, ms, 100 * ms / total))
@@ -0,0 +1,36 @@
+import torch
+
+from inference.cache import EncoderCache
+
+
+def encode(x, x_lengths):
+    """Stands in for `SynthesizerTrn.encode_text`: outputs masked past each length."""
+    x_mask = (torch.arange(x.size(1)) < x_lengths.unsqueeze(1)).unsqueeze(1).float()
+    hidden = x.unsqueeze(1).float().repeat(1, 4, 1) * x_mask
+    return hidden, x_mask, hidden[:, :1] * 0.5
+
+
+def padded(sequences, length=None):
+    x_lengths = torch.LongTensor([len(s) for s in sequences])
+    x = torch.zeros(len(sequences), length or x_lengths.max(), dtype=torch.long)
+    for i, s in enumerate(sequences):
+        x[i, : len(s)] = torch.LongTensor(s)
+    return x, x_lengths
+
+
+def test_items_hit_across_batches():
+    cache = EncoderCache()
+    calls = []
+
+    def encode_fn(x, x_lengths):
+        calls.append(x_lengths.tolist())
+        return encode(x, x_lengths)
+
+    cache.lookup(*padded([[1, 2, 3], [4, 5]]), encode_fn)
+    x, x_lengths = padded([[6], [4, 5], [1, 2, 3]], length=5)
+    out = cache.lookup(x, x_lengths, encode_fn)
+
+    assert calls == [[3, 2], [1]]  # only the new sequence is encoded
+    assert (cache.hits, cache.misses) == (2, 3)
+    for value, expected in zip(out, encode(x, x_lengths)):
+        assert torch.equal(value, expected)
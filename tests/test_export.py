@@ -0,0 +1,37 @@
+import pytest
+import torch
+
+from inference.export import (
+    export_onnx,
+    export_torchscript,
+    max_parity_error,
+    onnx_runner,
+)
+from inference.model import build_synthesizer
+from utils import utils
+
+# padded, mixed-length batches, one shorter than the attention window and one
+# longer than the traced input
+BATCHES = [(3,), (30, 7), (80, 12, 45)]
+
+
+@pytest.fixture(scope="module")
+def net_g():
+    torch.manual_seed(0)
+    hps = utils.get_hparams_from_file("configs/ljs.json")
+    net_g = build_synthesizer(hps).eval()
+    net_g.freeze_for_inference()
+    return net_g
+
+
+def test_torchscript_matches_infer_batch(net_g, tmp_path):
+    path = str(tmp_path / "graph.pt")
+    export_torchscript(net_g, path, lengths=(50,))
+    assert max_parity_error(net_g, torch.jit.load(path), BATCHES) < 1e-5
+
+
+def test_onnx_matches_infer_batch(net_g, tmp_path):
+    pytest.importorskip("onnxruntime")
+    path = str(tmp_path / "graph.onnx")
+    export_onnx(net_g, path, lengths=(50,))
+    assert max_parity_error(net_g, onnx_runner(path), BATCHES) < 1e-4
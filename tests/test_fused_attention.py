@@ -0,0 +1,36 @@
+import pytest
+import torch
+
+from models.models import TextEncoder
+
+
+def text_encoder(fused_attention):
+    torch.manual_seed(0)
+    return TextEncoder(
+        n_vocab=40,
+        out_channels=16,
+        hidden_channels=64,
+        filter_channels=128,
+        n_heads=2,
+        n_layers=3,
+        kernel_size=3,
+        p_dropout=0.1,
+        fused_attention=fused_attention,
+    ).eval()
+
+
+@pytest.mark.parametrize("max_length", [3, 30])  # shorter and longer than the window
+def test_fused_attention_matches_attention(max_length):
+    reference = text_encoder(fused_attention=False)
+    fused = text_encoder(fused_attention=True)
+    fused.load_state_dict(reference.state_dict())
+
+    g = torch.Generator().manual_seed(0)
+    x_lengths = torch.LongTensor([max_length, max_length - 1, 2, 1])
+    x = torch.randint(1, 40, (4, max_length), generator=g)
+    with torch.no_grad():
+        outputs = fused(x, x_lengths)
+        expected = reference(x, x_lengths)
+
+    for output, reference_output in zip(outputs, expected):
+        torch.testing.assert_close(output, reference_output, atol=1e-5, rtol=1e-4)
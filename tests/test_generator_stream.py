@@ -0,0 +1,37 @@
+import pytest
+import torch
+
+from models.models import Generator
+
+
+def small_generator(**kwargs):
+    torch.manual_seed(0)
+    return Generator(
+        initial_channel=16,
+        resblock="1",
+        resblock_kernel_sizes=[3, 7],
+        resblock_dilation_sizes=[[1, 3, 5], [1, 3, 5]],
+        upsample_rates=[8, 4],
+        upsample_initial_channel=32,
+        upsample_kernel_sizes=[16, 8],
+        **kwargs,
+    ).eval()
+
+
+@pytest.mark.parametrize(
+    "kwargs, chunk_size",
+    [
+        ({}, 8),
+        ({}, 13),  # not a divisor of the frame count
+        ({"causal": True}, 1),
+        ({"causal": True, "lookahead": 2}, 5),
+    ],
+)
+def test_stream_matches_forward(kwargs, chunk_size):
+    dec = small_generator(**kwargs)
+    x = torch.randn(2, 16, 50)
+    with torch.no_grad():
+        full = dec(x)
+        streamed = torch.cat(list(dec.infer_stream(x, chunk_size=chunk_size)), dim=2)
+    assert streamed.shape == full.shape
+    torch.testing.assert_close(streamed, full, atol=1e-4, rtol=1e-4)
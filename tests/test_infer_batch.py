@@ -0,0 +1,36 @@
+import pytest
+import torch
+
+from inference.model import build_synthesizer
+from text.symbols import symbols
+from utils import utils
+
+
+@pytest.fixture(scope="module")
+def net_g():
+    torch.manual_seed(0)
+    hps = utils.get_hparams_from_file("configs/ljs.json")
+    return build_synthesizer(hps).eval()
+
+
+@pytest.mark.parametrize("decoder_batch_size", [None, 2])
+def test_infer_batch_matches_infer(net_g, decoder_batch_size):
+    g = torch.Generator().manual_seed(0)
+    x_lengths = torch.LongTensor([9, 20, 5])
+    x = torch.zeros(3, 20, dtype=torch.long)
+    for i, length in enumerate(x_lengths):
+        x[i, :length] = torch.randint(1, len(symbols), (length,), generator=g)
+    noise = torch.randn(3, net_g.dec.conv_pre.in_channels, 1000, generator=g)
+
+    with torch.no_grad():
+        o, o_lengths, *_ = net_g.infer_batch(
+            x, x_lengths, decoder_batch_size=decoder_batch_size, noise=noise
+        )
+        for i, length in enumerate(x_lengths):
+            o_i, y_mask, _ = net_g.infer(
+                x[i: i + 1, :length], x_lengths[i: i + 1], noise=noise[i: i + 1]
+            )
+            assert o_lengths[i] == y_mask.sum() * net_g.dec.hop_length
+            torch.testing.assert_close(
+                o[i, :, : o_lengths[i]], o_i[0, :, : o_lengths[i]], atol=1e-4, rtol=1e-4
+            )
@@ -0,0 +1,31 @@
+import pytest
+import torch
+
+from inference.export import example_inputs
+from inference.model import build_synthesizer
+from utils import utils
+
+
+@pytest.fixture(scope="module")
+def net_g():
+    torch.manual_seed(0)
+    hps = utils.get_hparams_from_file("configs/ljs.json")
+    return build_synthesizer(hps).eval()
+
+
+def test_variants_match_infer(net_g):
+    x, x_lengths, *_ = example_inputs(net_g, [20], seed=0)
+    variants = [(1.0, 0.667, 1), (1.3, 0.667, 1), (0.8, 0.3, 2)]
+    with torch.no_grad():
+        outputs = net_g.infer_variants(x, x_lengths, variants, decoder_batch_size=2)
+        for (length_scale, noise_scale, seed), audio in zip(variants, outputs):
+            o, y_mask, _ = net_g.infer(
+                x,
+                x_lengths,
+                length_scale=length_scale,
+                noise_scale=noise_scale,
+                generator=torch.Generator().manual_seed(seed),
+            )
+            assert audio.size(0) == y_mask.sum() * net_g.dec.hop_length
+            torch.testing.assert_close(audio, o[0, 0], atol=1e-4, rtol=1e-4)
+    assert outputs[0].size(0) < outputs[1].size(0)  # slower
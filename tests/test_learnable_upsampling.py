@@ -0,0 +1,38 @@
+import pytest
+import torch
+
+from models.models import LearnableUpsampling
+
+
+@pytest.fixture
+def inputs():
+    torch.manual_seed(0)
+    x_lengths = torch.LongTensor([9, 5])
+    src_mask = torch.arange(9).unsqueeze(0) >= x_lengths.unsqueeze(1)
+    duration = (torch.rand(2, 9) * 4 + 0.5).masked_fill(src_mask, 0)
+    V = torch.randn(2, 9, 192).masked_fill(src_mask.unsqueeze(-1), 0)
+    return duration, V, x_lengths, src_mask, 9
+
+
+def test_one_chunk_is_bit_identical(inputs):
+    upsampling = LearnableUpsampling().eval()
+    with torch.no_grad():
+        rep, mel_mask, mel_len, _ = upsampling(*inputs)
+        chunked, chunked_mask, chunked_len, _ = upsampling(
+            *inputs, chunk_size=int(mel_len.max())
+        )
+    assert torch.equal(chunked_len, mel_len)
+    assert torch.equal(chunked_mask, mel_mask)
+    assert torch.equal(chunked, rep)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7])
+def test_small_chunks_match_dense(inputs, chunk_size):
+    upsampling = LearnableUpsampling().eval()
+    with torch.no_grad():
+        rep, mel_mask, *_ = upsampling(*inputs)
+        chunked, *_ = upsampling(*inputs, chunk_size=chunk_size)
+    assert mel_mask.any(), "the shorter item must have padded frames"
+    assert chunked.shape == rep.shape
+    # a few float32 ulps: outputs are of order 1, the differences ~1e-6
+    torch.testing.assert_close(chunked, rep, atol=5e-6, rtol=0)
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+import torch
+
+from inference.model import build_synthesizer
+from inference.prefork import (
+    fork_workers,
+    memory_usage,
+    private_bytes_in,
+    share_weights,
+    weight_ranges,
+)
+from utils import utils
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux"), reason="reads /proc/[pid]/smaps"
+)
+
+
+def test_forked_workers_share_the_weights():
+    torch.manual_seed(0)
+    hps = utils.get_hparams_from_file("configs/ljs.json")
+    net_g = build_synthesizer(hps).eval()
+    net_g.freeze_for_inference()
+    weight_bytes = share_weights(net_g)
+    x = torch.randint(1, 50, (1, 20))
+    x_lengths = torch.LongTensor([20])
+
+    ready_r, ready_w = os.pipe()
+    exit_r, exit_w = os.pipe()
+
+    def run_worker(index):
+        torch.set_num_threads(1)
+        with torch.no_grad():
+            net_g.infer(x, x_lengths)
+        os.write(ready_w, b"1")
+        os.read(exit_r, 1)
+
+    n_threads = torch.get_num_threads()
+    torch.set_num_threads(1)  # no intra-op thread pool may be used across fork
+    pids = fork_workers(2, run_worker)
+    try:
+        for _ in pids:
+            os.read(ready_r, 1)
+        usage = [
+            dict(memory_usage(pid), weights=private_bytes_in(pid, weight_ranges(net_g)))
+            for pid in pids
+        ]
+    finally:
+        os.write(exit_w, b"1" * len(pids))
+        for pid in pids:
+            os.waitpid(pid, 0)
+        torch.set_num_threads(n_threads)
+
+    for worker in usage:
+        # inference reads the weights, so no page of them is copied
+        assert worker["weights"] < 0.05 * weight_bytes
+        assert worker["private"] < weight_bytes
@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+import torch
+from torch import nn
+
+from inference.server import BadRequest, BatchScheduler, SynthesisServer
+
+
+class FakeSynthesizer(nn.Module):
+    """`infer_batch` returning one sample per token, of value token id."""
+
+    def __init__(self):
+        super().__init__()
+        self.weight = nn.Parameter(torch.zeros(1))
+
+    def infer_batch(self, x, x_lengths, **kwargs):
+        return x.unsqueeze(1).float(), x_lengths, None, None
+
+
+def test_shared_request_is_promoted_to_the_higher_class():
+    async def run():
+        scheduler = BatchScheduler(
+            FakeSynthesizer(),
+            classes={
+                "interactive": dict(priority=0),
+                "bulk": dict(priority=1, max_concurrency=1, max_batch_size=1),
+            },
+            per_token_cost=0.0,
+        )
+        chunks = [torch.LongTensor([i + 1] * 5) for i in range(4)]
+        bulk = asyncio.ensure_future(
+            scheduler.submit_job(chunks, priority="bulk", seed=1)
+        )
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(
+            scheduler.submit_job(chunks[-1:], priority="interactive", seed=1)
+        )
+        await asyncio.sleep(0)
+
+        shared = scheduler.in_flight[next(reversed(scheduler.in_flight))]
+        assert shared in scheduler.classes["interactive"].queue
+        assert shared not in scheduler.classes["bulk"].queue
+        assert len(scheduler.classes["bulk"].queue) == 3
+
+        # dispatched before the bulk chunks queued ahead of it
+        scheduler.start()
+        audio = await interactive
+        assert not bulk.done()
+        assert torch.equal(audio[0], chunks[-1].float())
+        assert [a.tolist() for a in await bulk] == [c.float().tolist() for c in chunks]
+        await scheduler.stop()
+
+    asyncio.run(run())
+
+
+class BlockingSynthesizer(FakeSynthesizer):
+    """Vocodes the first item, then blocks until `release` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def infer_batch(self, x, x_lengths, on_decoded=None, **kwargs):
+        o, o_lengths, *_ = super().infer_batch(x, x_lengths)
+        on_decoded(0, o[0, 0, : o_lengths[0]])
+        self.release.wait(5)
+        for i in range(1, x.size(0)):
+            on_decoded(i, o[i, 0, : o_lengths[i]])
+        return o, o_lengths, None, None
+
+
+def test_requests_are_answered_as_their_group_is_vocoded():
+    async def run():
+        net_g = BlockingSynthesizer()
+        scheduler = BatchScheduler(net_g, max_batch_size=2, max_wait_ms=50)
+        scheduler.start()
+        long, short = [
+            asyncio.ensure_future(scheduler.submit(torch.LongTensor([i] * n)))
+            for i, n in ((1, 9), (2, 3))
+        ]
+        # the batch is sorted longest first, so `long` is item 0
+        audio = await asyncio.wait_for(long, 5)
+        assert audio.tolist() == [1.0] * 9
+        assert not short.done()
+        net_g.release.set()
+        assert (await short).tolist() == [2.0] * 3
+        await scheduler.stop()
+
+    asyncio.run(run())
+
+
+def test_invalid_requests_are_rejected():
+    async def run():
+        server = SynthesisServer(BatchScheduler(FakeSynthesizer()), hps=None)
+        for body in (
+            b"not json",
+            b'{"priority": "interactive"}',
+            b'{"text": "  "}',
+            b'{"text": "Hello.", "priority": "urgent"}',
+        ):
+            with pytest.raises(BadRequest):
+                await server.route("POST", "/synthesize", body)
+
+    asyncio.run(run())
+
+
+def test_frontend_does_not_block_the_event_loop(monkeypatch):
+    def slow_text_to_ids(text, hps_data, cleaned=False):
+        time.sleep(0.2)  # stands in for phonemization
+        return torch.LongTensor([1, 2, 3])
+
+    monkeypatch.setattr("inference.server.text_to_ids", slow_text_to_ids)
+    hps = SimpleNamespace(data=SimpleNamespace(max_wav_value=32768.0, sampling_rate=22050))
+
+    async def run():
+        scheduler = BatchScheduler(FakeSynthesizer(), per_token_cost=0.0)
+        server = SynthesisServer(scheduler, hps)
+        scheduler.start()
+        body = b'{"text": "One. Two. Three.", "priority": "bulk"}'
+        synthesis = asyncio.ensure_future(server.route("POST", "/synthesize", body))
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lag = time.perf_counter() - start
+        status, _, _ = await synthesis
+        await scheduler.stop()
+        return lag, status
+
+    lag, status = asyncio.run(run())
+    assert status == 200
+    assert lag < 0.1
+
+
+class SlowSynthesizer(FakeSynthesizer):
+    def infer_batch(self, x, x_lengths, **kwargs):
+        time.sleep(0.3)
+        return super().infer_batch(x, x_lengths)
+
+
+def test_saturated_class_does_not_spin_the_dispatcher():
+    async def run():
+        scheduler = BatchScheduler(SlowSynthesizer(), n_workers=2, per_token_cost=0.0)
+        n_dispatches = 0
+        dispatch = scheduler._dispatch
+
+        def counting_dispatch():
+            nonlocal n_dispatches
+            n_dispatches += 1
+            dispatch()
+
+        scheduler._dispatch = counting_dispatch
+        scheduler.start()
+        # bulk runs one chunk at a time, the others wait past max_wait
+        chunks = [torch.LongTensor([i + 1] * 5) for i in range(3)]
+        await scheduler.submit_job(chunks, priority="bulk")
+        await scheduler.stop()
+        return n_dispatches
+
+    # one per arrival and per finished batch, not a busy loop
+    assert asyncio.run(run()) < 20
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+
+import torch
+
+from inference.pipeline import StreamingSynthesizer
+
+
+class SlowSynthesizer(StreamingSynthesizer):
+    """Takes `delay` seconds per sentence and records the sentences it started."""
+
+    def __init__(self, delay, **kwargs):
+        super().__init__(net_g=None, hps=None, **kwargs)
+        self.delay = delay
+        self.started = []
+        self.lock = threading.Lock()
+
+    def synthesize_sentence(self, sentence):
+        with self.lock:
+            self.started.append(sentence)
+        time.sleep(self.delay)
+        return torch.zeros(10)
+
+
+async def fragments(n):
+    for i in range(n):
+        yield "Sentence {}. ".format(i)
+
+
+def test_at_most_max_pending_in_flight():
+    synth = SlowSynthesizer(0.01, n_workers=4, max_pending=3)
+
+    async def run():
+        stream = synth.synthesize(fragments(20))
+        await stream.__anext__()
+        # a stalled consumer: the pipeline must not run ahead of it
+        await asyncio.sleep(0.3)
+        n_started = len(synth.started)
+        await stream.aclose()
+        return n_started
+
+    # the consumed sentence plus max_pending in flight
+    assert asyncio.run(run()) == 1 + 3
+
+
+def test_close_does_not_wait_for_queued_sentences():
+    synth = SlowSynthesizer(0.2, n_workers=1, max_pending=8)
+
+    async def run():
+        stream = synth.synthesize(fragments(20))
+        await stream.__anext__()
+        await asyncio.sleep(0.05)  # let the producer queue sentences
+        start = time.perf_counter()
+        await stream.aclose()
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) < 0.15
+    time.sleep(0.3)  # the sentence running at close may finish, no other
+    assert len(synth.started) <= 2
@@ -0,0 +1,48 @@
+import torch
+
+from models.models import LearnableUpsampling
+from models.modules import SwishBlock
+
+
+def concat_forward(block, S, E, V):
+    """SwishBlock.forward before the first projection was factorized."""
+    out = torch.cat(
+        [
+            S.unsqueeze(-1),
+            E.unsqueeze(-1),
+            V.unsqueeze(1).expand(-1, E.size(1), -1, -1),
+        ],
+        dim=-1,
+    )
+    return block.layer(out)
+
+
+def test_swish_block_matches_concat():
+    torch.manual_seed(0)
+    block = SwishBlock(8 + 2, 4, 4)
+    S, E = torch.randn(2, 13, 7), torch.randn(2, 13, 7)
+    V = torch.randn(2, 7, 8)
+    torch.testing.assert_close(block(S, E, V), concat_forward(block, S, E, V))
+
+
+def test_learnable_upsampling_matches_concat_with_padding():
+    torch.manual_seed(0)
+    upsampling = LearnableUpsampling().eval()
+    x_lengths = torch.LongTensor([7, 4])
+    src_mask = torch.arange(7).unsqueeze(0) >= x_lengths.unsqueeze(1)
+    duration = torch.rand(2, 7) * 3 + 0.5
+    duration = duration.masked_fill(src_mask, 0)  # padded tokens, padded frames
+    V = torch.randn(2, 7, 192).masked_fill(src_mask.unsqueeze(-1), 0)
+
+    with torch.no_grad():
+        rep, mel_mask, mel_len, W = upsampling(duration, V, x_lengths, src_mask, 7)
+        for block in (upsampling.swish_w, upsampling.swish_c):
+            block.forward = lambda S, E, V, block=block: concat_forward(block, S, E, V)
+        rep_ref, mel_mask_ref, mel_len_ref, W_ref = upsampling(
+            duration, V, x_lengths, src_mask, 7
+        )
+
+    assert mel_mask.any(), "the shorter item must have padded frames"
+    assert torch.equal(mel_len, mel_len_ref)
+    torch.testing.assert_close(W, W_ref)
+    torch.testing.assert_close(rep, rep_ref)
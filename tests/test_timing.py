@@ -0,0 +1,43 @@
+import pytest
+import torch
+
+from inference.export import example_inputs
+from inference.model import build_synthesizer
+from inference.timing import phoneme_timings
+from utils import utils
+
+
+@pytest.fixture(scope="module")
+def net_g():
+    torch.manual_seed(0)
+    hps = utils.get_hparams_from_file("configs/ljs.json")
+    return build_synthesizer(hps).eval()
+
+
+@pytest.mark.parametrize("soft", [False, True])
+def test_timings_match_infer_batch(net_g, soft):
+    x, x_lengths, noise, *_ = example_inputs(net_g, [25, 9, 16], seed=0)
+    hop_length = net_g.dec.hop_length
+    with torch.no_grad():
+        starts, ends, y_lengths = net_g.infer_timings(x, x_lengths, soft=soft)
+        _, o_lengths, *_ = net_g.infer_batch(x, x_lengths, noise=noise)
+
+    assert torch.equal(y_lengths * hop_length, o_lengths)
+    for i, length in enumerate(x_lengths):
+        assert (ends[i, length:] == 0).all()
+        durations = ends[i, :length] - starts[i, :length]
+        assert (durations >= 0).all()
+        if soft:
+            assert ends[i, length - 1] == y_lengths[i]
+        else:
+            # frames are rounded once for the whole item
+            torch.testing.assert_close(durations.sum(), ends[i, length - 1])
+            assert abs(durations.sum() - y_lengths[i]) <= 0.5
+
+    sampling_rate = 22050
+    timings, seconds = phoneme_timings(net_g, x, x_lengths, sampling_rate, soft=soft)
+    for i, length in enumerate(x_lengths):
+        assert seconds[i] * sampling_rate == pytest.approx(o_lengths[i].item())
+        for timing, start, end in zip(timings[i], starts[i], ends[i]):
+            assert timing["start"] * sampling_rate == pytest.approx(start * hop_length)
+            assert timing["end"] * sampling_rate == pytest.approx(end * hop_length)
@@ -150,6 +150,16 @@ def run(rank, n_gpus, hps):
     except Exception as e:
         epoch_str = 0
         global_step = 0
+        if hps.finetune_from is not None:
+            # weights only: parameter names are shared between the causal and
+            # non-causal decoders, so either can be initialized from the other
+            utils.load_checkpoint(hps.finetune_from, net_g)
+            d_path = os.path.join(
+                os.path.dirname(hps.finetune_from),
+                os.path.basename(hps.finetune_from).replace("G_", "D_"),
+            )
+            if os.path.isfile(d_path):
+                utils.load_checkpoint(d_path, net_d)
 
     net_g = DDP(net_g, device_ids=[rank], find_unused_parameters=True)
     net_d = DDP(net_d, device_ids=[rank], find_unused_parameters=True)
@@ -458,7 +468,8 @@ def train(
         logger.info("====> Epoch: {}".format(epoch))
 
 
-def evaluate(hps, generator, eval_loader, writer_eval, epoch=0):
+def evaluate(hps, generator, eval_loader, writer_eval, epoch=0, n_items=1):
+    # only the first `n_items` of every eval batch are synthesized and written
     generator.eval()
 
     save_dir = os.path.join(writer_eval.log_dir, f"{epoch}")
@@ -477,16 +488,11 @@ def evaluate(hps, generator, eval_loader, writer_eval, epoch=0):
                 x, x_lengths = x.cuda(0), x_lengths.cuda(0)
                 spec, spec_lengths = spec.cuda(0), spec_lengths.cuda(0)
                 y, y_lengths = y.cuda(0), y_lengths.cuda(0)
-                # remove else
-                x = x[:1]
-                x_lengths = x_lengths[:1]
-                spec = spec[:1]
-                spec_lengths = spec_lengths[:1]
-                y = y[:1]
-                y_lengths = y_lengths[:1]
+                x, x_lengths = x[:n_items], x_lengths[:n_items]
+                spec, spec_lengths = spec[:n_items], spec_lengths[:n_items]
+                y, y_lengths = y[:n_items], y_lengths[:n_items]
 
-                y_hat, mask, *_ = generator.module.infer(x, x_lengths, max_len=1000)
-                y_hat_lengths = mask.sum([1, 2]).long() * hps.data.hop_length
+                y_hat, y_hat_lengths, *_ = generator.module.infer_batch(x, x_lengths)
 
                 mel = spec_to_mel_torch(
                     spec,
@@ -507,18 +513,19 @@ def evaluate(hps, generator, eval_loader, writer_eval, epoch=0):
                     hps.data.mel_fmax,
                 )
 
-                audio = y_hat[0, 0, : y_hat_lengths[0]].cpu().numpy()
-                audio_gt = y[0, 0, : y_lengths[0]].cpu().numpy()
-                scipy.io.wavfile.write(
-                    filename=os.path.join(save_dir, f"{batch_idx}.wav"),
-                    rate=hps.data.sampling_rate,
-                    data=audio,
-                )
-                scipy.io.wavfile.write(
-                    filename=os.path.join(save_dir, f"{batch_idx}_gt.wav"),
-                    rate=hps.data.sampling_rate,
-                    data=audio_gt,
-                )
+                for i in range(x.size(0)):
+                    audio = y_hat[i, 0, : y_hat_lengths[i]].cpu().numpy()
+                    audio_gt = y[i, 0, : y_lengths[i]].cpu().numpy()
+                    scipy.io.wavfile.write(
+                        filename=os.path.join(save_dir, f"{batch_idx}_{i}.wav"),
+                        rate=hps.data.sampling_rate,
+                        data=audio,
+                    )
+                    scipy.io.wavfile.write(
+                        filename=os.path.join(save_dir, f"{batch_idx}_{i}_gt.wav"),
+                        rate=hps.data.sampling_rate,
+                        data=audio_gt,
+                    )
 
                 if batch_idx >= 8:
                     break
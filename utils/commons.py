@@ -143,6 +143,24 @@ def generate_path(duration, mask):
     return path
 
 
+def kmeans(x, n_clusters, n_iters=20, seed=0):
+    """
+    Lloyd's k-means.
+    x: [n, d]
+    ret: centers [n_clusters, d], labels [n]
+    """
+    g = torch.Generator().manual_seed(seed)
+    init = torch.randperm(x.size(0), generator=g)[:n_clusters].to(x.device)
+    centers = x[init].clone()
+    for _ in range(n_iters):
+        labels = torch.cdist(x, centers).argmin(dim=1)
+        counts = torch.bincount(labels, minlength=n_clusters).unsqueeze(1)
+        sums = torch.zeros_like(centers).index_add_(0, labels, x)
+        centers = torch.where(counts > 0, sums / counts.clamp(min=1), centers)
+    labels = torch.cdist(x, centers).argmin(dim=1)
+    return centers, labels
+
+
 def clip_grad_value_(parameters, clip_value, norm_type=2):
     if isinstance(parameters, torch.Tensor):
         parameters = [parameters]
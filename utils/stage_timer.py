@@ -0,0 +1,81 @@
+import contextlib
+import logging
+import time
+from collections import OrderedDict
+
+import torch
+
+
+class StageTimer:
+    """
+    Wall-clock time of named inference stages, e.g.
+
+        timer = StageTimer(hooks=[logging_hook(logger)])
+        net_g.infer(x, x_lengths, timer=timer)
+        timer.emit()  # {"enc_p": ms, "dp": ms, ..., "dec": ms} to every hook
+
+    On CUDA, stages are bracketed with CUDA events that are only resolved
+    (synchronized) in `timings`, so timing adds no sync to inference; on CPU
+    they use the monotonic clock. Repeated stages (e.g. the decoder groups of
+    `infer_batch`) are summed.
+    """
+
+    def __init__(self, device="cpu", hooks=()):
+        self.cuda = torch.device(device).type == "cuda"
+        self.hooks = list(hooks)
+        self._stages = OrderedDict()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.cuda:
+            start = torch.cuda.Event(enable_timing=True)
+            end = torch.cuda.Event(enable_timing=True)
+            start.record()
+            yield
+            end.record()
+            self._stages.setdefault(name, []).append((start, end))
+        else:
+            start = time.perf_counter()
+            yield
+            self._stages.setdefault(name, []).append(time.perf_counter() - start)
+
+    def timings(self):
+        """Milliseconds per stage, in the order the stages first ran."""
+        timings = OrderedDict()
+        for name, spans in self._stages.items():
+            if self.cuda:
+                spans[-1][1].synchronize()
+                timings[name] = sum(start.elapsed_time(end) for start, end in spans)
+            else:
+                timings[name] = 1000 * sum(spans)
+        return timings
+
+    def emit(self):
+        """Passes `timings()` to every hook and returns them."""
+        timings = self.timings()
+        for hook in self.hooks:
+            hook(timings)
+        return timings
+
+    def reset(self):
+        self._stages.clear()
+
+
+def stage(timer, name):
+    """`timer.stage(name)`, or a no-op context without a timer."""
+    if timer is None:
+        return contextlib.nullcontext()
+    return timer.stage(name)
+
+
+def logging_hook(logger=None, level=logging.INFO):
+    """A `StageTimer` hook that logs the stage timings."""
+    logger = logger or logging.getLogger(__name__)
+
+    def hook(timings):
+        logger.log(
+            level,
+            " ".join("{}={:.1f}ms".format(name, ms) for name, ms in timings.items()),
+        )
+
+    return hook
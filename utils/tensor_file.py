@@ -0,0 +1,88 @@
+import json
+import os
+
+import torch
+
+# tensor offsets are aligned so that every dtype can be viewed in place
+ALIGNMENT = 64
+
+
+def _dtype_from_str(name):
+    return getattr(torch, name.replace("torch.", ""))
+
+
+def save_tensors(path, tensors, metadata=None):
+    """
+    Writes `tensors` (name -> tensor) back to back into `path`.bin and their
+    index (dtype, shape, byte offset) plus JSON-serializable `metadata` into
+    `path`.json.
+    """
+    index, offset = {}, 0
+    with open(path + ".bin", "wb") as f:
+        for name, tensor in tensors.items():
+            data = tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8)
+            padding = -offset % ALIGNMENT
+            f.write(b"\0" * padding)
+            offset += padding
+            index[name] = {
+                "dtype": str(tensor.dtype),
+                "shape": list(tensor.shape),
+                "offset": offset,
+            }
+            f.write(data.numpy().tobytes())
+            offset += data.numel()
+    with open(path + ".json", "w") as f:
+        json.dump({"tensors": index, "metadata": metadata or {}}, f)
+
+
+def load_tensors(path):
+    """
+    Returns (tensors, metadata) from `save_tensors`. The tensors are views
+    into a private memory map of `path`.bin: nothing is read until a tensor
+    is used, and writes are copy-on-write, never reaching the file.
+    """
+    with open(path + ".json") as f:
+        index = json.load(f)
+    n_bytes = os.path.getsize(path + ".bin")
+    storage = (
+        torch.UntypedStorage.from_file(path + ".bin", shared=False, nbytes=n_bytes)
+        if n_bytes
+        else torch.UntypedStorage(0)
+    )
+    tensors = {}
+    for name, entry in index["tensors"].items():
+        dtype = _dtype_from_str(entry["dtype"])
+        element_size = torch.empty(0, dtype=dtype).element_size()
+        tensors[name] = torch.empty(0, dtype=dtype).set_(
+            storage,
+            entry["offset"] // element_size,
+            entry["shape"],
+            torch.empty(entry["shape"], device="meta").stride(),
+        )
+    return tensors, index["metadata"]
+
+
+def save_optimizer_state(path, state_dict):
+    """Optimizer state: its tensors in the flat file, everything else in the index."""
+    tensors, scalars = {}, {}
+    for param_id, state in state_dict["state"].items():
+        for key, value in state.items():
+            name = "{}.{}".format(param_id, key)
+            if isinstance(value, torch.Tensor):
+                tensors[name] = value
+            else:
+                scalars[name] = value
+    save_tensors(
+        path,
+        tensors,
+        {"param_groups": state_dict["param_groups"], "scalars": scalars},
+    )
+
+
+def load_optimizer_state(path):
+    tensors, metadata = load_tensors(path)
+    state = {}
+    for name, value in list(tensors.items()) + list(metadata["scalars"].items()):
+        param_id, key = name.split(".", 1)
+        state.setdefault(int(param_id), {})[key] = value
+    return {"state": state, "param_groups": metadata["param_groups"]}
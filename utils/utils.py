@@ -9,6 +9,8 @@ import numpy as np
 from scipy.io.wavfile import read
 import torch
 
+from utils import tensor_file
+
 MATPLOTLIB_FLAG = False
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)  # can be changed to DEBUG
@@ -18,7 +20,11 @@ logger = logging
 def load_checkpoint(checkpoint_path, model, optimizer=None):
     assert os.path.isfile(checkpoint_path)
 
-    checkpoint_dict = torch.load(checkpoint_path, map_location="cpu")
+    flat = checkpoint_path.endswith(".model.json")
+    if flat:
+        checkpoint_dict = load_flat_checkpoint(checkpoint_path, optimizer is not None)
+    else:
+        checkpoint_dict = torch.load(checkpoint_path, map_location="cpu")
 
     iteration = checkpoint_dict["iteration"]
 
@@ -36,10 +42,12 @@ def load_checkpoint(checkpoint_path, model, optimizer=None):
         except:
             logger.info("%s is not in the checkpoint" % k)
             new_state_dict[k] = v
+    # memory-mapped tensors are used in place by a model on the CPU
+    assign = flat and all(v.device.type == "cpu" for v in state_dict.values())
     if hasattr(model, "module"):
-        model.module.load_state_dict(new_state_dict)
+        model.module.load_state_dict(new_state_dict, assign=assign)
     else:
-        model.load_state_dict(new_state_dict)
+        model.load_state_dict(new_state_dict, assign=assign)
 
     if optimizer is not None:
         optimizer.load_state_dict(checkpoint_dict["optimizer"])
@@ -50,6 +58,32 @@ def load_checkpoint(checkpoint_path, model, optimizer=None):
     return model, optimizer, learning_rate, iteration
 
 
+def load_flat_checkpoint(checkpoint_path, load_optimizer=False):
+    """
+    Loads a checkpoint written by `save_flat_checkpoint` from the index of its
+    model file ([prefix].model.json) as a `torch.save` style dict. The model
+    tensors are memory-mapped and the optimizer state is only read if asked.
+    """
+    prefix = checkpoint_path[: -len(".model.json")]
+    model, metadata = tensor_file.load_tensors(prefix + ".model")
+    checkpoint_dict = dict(metadata, model=model)
+    if load_optimizer:
+        checkpoint_dict["optimizer"] = tensor_file.load_optimizer_state(prefix + ".optim")
+    return checkpoint_dict
+
+
+def save_flat_checkpoint(checkpoint_dict, prefix):
+    """
+    Writes a `torch.save` style checkpoint dict as [prefix].model.{bin,json}
+    and, if it has optimizer state, [prefix].optim.{bin,json}. All other
+    entries (iteration, learning_rate, ...) go to the model index.
+    """
+    metadata = {k: v for k, v in checkpoint_dict.items() if k not in ("model", "optimizer")}
+    tensor_file.save_tensors(prefix + ".model", checkpoint_dict["model"], metadata)
+    if checkpoint_dict.get("optimizer") is not None:
+        tensor_file.save_optimizer_state(prefix + ".optim", checkpoint_dict["optimizer"])
+
+
 def save_checkpoint(model, optimizer, learning_rate, iteration, checkpoint_path):
     logger.info(
         "Saving model and optimizer state at iteration {} to {}".format(
@@ -183,6 +217,12 @@ def get_hparams(init=True):
     )
     parser.add_argument("--data_dir", type=str, default="./data", help="Data directory")
     parser.add_argument("--type", type=str, default="train", help="Data type (train/val/test)")
+    parser.add_argument(
+        "--finetune_from",
+        type=str,
+        default=None,
+        help="G_*.pth checkpoint to initialize a new run from (e.g. a non-causal model)",
+    )
     args = parser.parse_args()
     model_dir = os.path.join("./logs", args.model)
 
@@ -206,6 +246,7 @@ def get_hparams(init=True):
     hparams.warmup = args.warmup
     hparams.data_dir = args.data_dir
     hparams.type = args.type
+    hparams.finetune_from = args.finetune_from
     # hparams.lang
     return hparams
 
@@ -300,3 +341,8 @@ class HParams:
 
     def __repr__(self):
         return self.__dict__.__repr__()
+
+    def to_dict(self):
+        return {
+            k: v.to_dict() if isinstance(v, HParams) else v for k, v in self.items()
+        }
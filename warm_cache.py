@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+
+import torch
+
+from inference.cache import AudioCache
+from inference.frontend import text_to_ids
+from inference.model import load_synthesizer
+from inference.pipeline import split_sentences
+from inference.server import BatchScheduler
+from synthesize import load_items
+
+
+async def warm(scheduler, jobs, **kwargs):
+    scheduler.start()
+    try:
+        await asyncio.gather(
+            *[scheduler.submit_job(chunks, priority="warm", **kwargs) for chunks in jobs]
+        )
+    finally:
+        await scheduler.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", type=str, default=None)
+    parser.add_argument(
+        "--weights_path", type=str, required=True, help="training or frozen checkpoint"
+    )
+    parser.add_argument(
+        "-i", "--input", type=str, required=True, help="phrase list, one per line"
+    )
+    parser.add_argument(
+        "--cleaned", action="store_true", help="input text is already cleaned"
+    )
+    parser.add_argument("--cache_dir", type=str, required=True)
+    parser.add_argument("--cache_disk_mb", type=int, default=4096)
+    parser.add_argument(
+        "--seed", type=int, default=1234, help="serve with the same --default_seed"
+    )
+    parser.add_argument("--noise_scale", type=float, default=0.667)
+    parser.add_argument("--length_scale", type=float, default=1.0)
+    parser.add_argument("--max_chars", type=int, default=300)
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--num_threads", type=int, default=torch.get_num_threads())
+    args = parser.parse_args()
+
+    net_g, hps = load_synthesizer(args.weights_path, args.config)
+    # the server freezes its model too, so both hash the same weights
+    if not net_g.frozen:
+        net_g.freeze_for_inference()
+
+    # no memory tier: every synthesized chunk goes straight to disk
+    cache = AudioCache(0, args.cache_dir, args.cache_disk_mb * 1024 * 1024)
+    n_cached = cache.stats()["disk_entries"]
+    jobs = [
+        [
+            text_to_ids(sentence, hps.data, args.cleaned)
+            for sentence in split_sentences(text, args.max_chars)
+        ]
+        for _, text in load_items(args.input)
+    ]
+    scheduler = BatchScheduler(
+        net_g,
+        max_batch_size=args.batch_size,
+        intra_op_threads=args.num_threads,
+        classes={"warm": dict(priority=0)},
+        cache=cache,
+    )
+    asyncio.run(
+        warm(
+            scheduler,
+            jobs,
+            noise_scale=args.noise_scale,
+            length_scale=args.length_scale,
+            seed=args.seed,
+        )
+    )
+    stats = cache.stats()
+    print(
+        "{} phrases, {} chunks: {} synthesized, {} already cached ({:.1f} MB on disk)".format(
+            len(jobs),
+            sum(len(chunks) for chunks in jobs),
+            stats["disk_entries"] - n_cached,
+            stats["disk_hits"],
+            stats["disk_bytes"] / (1024 * 1024),
+        )
+    )